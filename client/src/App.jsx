@@ -10,7 +10,7 @@ import LeaderboardPage from './pages/LeaderboardPage'
 import PredictionsPage from './pages/PredictionsPage'
 import ScoringPage from './pages/ScoringPage'
 import { useAuth } from './hooks/useAuth'
-import api from './config/api'
+import api, { PRICE_STREAM_URL } from './config/api'
 
 const TIMEFRAMES = [
   { id: 'hourly', label: 'Hourly', interval: '1m', lookback: '1d' },
@@ -21,6 +21,19 @@ const TIMEFRAMES = [
 ]
 
 const PRICE_POLL_INTERVAL = 30000
+const CHART_MAX_POINTS = 500
+const SUPPORTS_PRICE_STREAM = typeof window !== 'undefined' && 'EventSource' in window
+// Failed connection attempts in a row before the chart falls back to polling
+const STREAM_MAX_ERRORS = 3
+
+// Replace bars whose timestamp we already have and append newer ones, keeping the window size
+const mergeBars = (prev, bars) => {
+  if (!prev.length) return bars
+  const byTimestamp = new Map(prev.map(bar => [bar.timestamp, bar]))
+  bars.forEach(bar => byTimestamp.set(bar.timestamp, bar))
+  const merged = Array.from(byTimestamp.values()).sort((a, b) => (a.timestamp < b.timestamp ? -1 : 1))
+  return merged.slice(Math.max(0, merged.length - Math.max(prev.length, bars.length)))
+}
 
 function App() {
   const { user, isLoading: authLoading, isAuthenticated, refetch: refetchAuth, login, register, logout, error: authError, clearError } = useAuth()
@@ -39,6 +52,8 @@ function App() {
   const [stakedTokens, setStakedTokens] = useState(0)
   const [userPrediction, setUserPrediction] = useState(null)
   const [liveScore, setLiveScore] = useState(null)
+  const [streamFailed, setStreamFailed] = useState(false)
+  const streaming = SUPPORTS_PRICE_STREAM && !streamFailed
 
   const displayBounds = useMemo(() => {
     if (!chartBounds) return null
@@ -78,7 +93,8 @@ function App() {
       const response = await api.get(`/api/prices/${symbol}`, {
         params: {
           interval: config.interval,
-          period: config.lookback
+          period: config.lookback,
+          max_points: CHART_MAX_POINTS
         }
       })
       setPriceData(response.data.prices)
@@ -158,24 +174,95 @@ function App() {
 
   useEffect(() => {
     if (selectedAsset) {
-      fetchPriceData(selectedAsset.symbol, timeframe)
+      if (!streaming) {
+        fetchPriceData(selectedAsset.symbol, timeframe)
+      }
       fetchPredictions(selectedAsset.symbol, timeframe)
       fetchUserPrediction(selectedAsset.symbol, timeframe)
     }
   }, [selectedAsset, timeframe, fetchPriceData, fetchPredictions, fetchUserPrediction])
 
+  // Live prices: one snapshot, then only new/updated bars pushed by the server
+  useEffect(() => {
+    if (!selectedAsset || !streaming) return
+
+    const config = TIMEFRAMES.find(t => t.id === timeframe)
+    const params = new URLSearchParams({ interval: config.interval, period: config.lookback })
+    if (liveScore?.predictionId) {
+      params.set('predictionId', liveScore.predictionId)
+    }
+
+    const updateBounds = (data) => setChartBounds({
+      minPrice: data.minPrice,
+      maxPrice: data.maxPrice,
+      lastPrice: data.lastPrice,
+      lastTimestamp: data.lastTimestamp
+    })
+
+    setLoading(true)
+    setError(null)
+    let errors = 0
+    const source = new EventSource(
+      `${PRICE_STREAM_URL}/api/prices/${encodeURIComponent(selectedAsset.symbol)}/stream?${params}`,
+      { withCredentials: true }
+    )
+    source.addEventListener('snapshot', (e) => {
+      errors = 0
+      const data = JSON.parse(e.data)
+      setPriceData(data.prices)
+      updateBounds(data)
+      setLoading(false)
+    })
+    source.addEventListener('bars', (e) => {
+      const data = JSON.parse(e.data)
+      setPriceData(prev => mergeBars(prev, data.bars))
+      updateBounds(data)
+    })
+    source.addEventListener('score', (e) => {
+      const data = JSON.parse(e.data)
+      setLiveScore(prev => prev && prev.predictionId === data.predictionId ? {
+        ...prev,
+        mspe: data.mspe,
+        progress: data.progress,
+        nElapsed: data.nElapsed,
+        nTotal: data.nTotal
+      } : prev)
+    })
+    source.addEventListener('error', (e) => {
+      if (e.data) {
+        setError('Failed to fetch price data. Please try again.')
+        source.close()
+        setLoading(false)
+        return
+      }
+      // The server refused the stream (e.g. 503 when it holds too many) or keeps dropping it: poll instead
+      errors += 1
+      if (source.readyState === EventSource.CLOSED || errors >= STREAM_MAX_ERRORS) {
+        source.close()
+        setStreamFailed(true)
+        fetchPriceData(selectedAsset.symbol, timeframe)
+        return
+      }
+      setLoading(false)
+    })
+
+    return () => source.close()
+  }, [selectedAsset, timeframe, liveScore?.predictionId, streaming, fetchPriceData])
+
   useEffect(() => {
     if (!selectedAsset) return
     
     const pollInterval = setInterval(() => {
-      fetchPriceData(selectedAsset.symbol, timeframe)
+      if (!streaming) {
+        fetchPriceData(selectedAsset.symbol, timeframe)
+      }
       if (liveScore?.predictionId) {
         updateScore()
       }
     }, PRICE_POLL_INTERVAL)
     
     return () => clearInterval(pollInterval)
-  }, [selectedAsset, timeframe, fetchPriceData, liveScore?.predictionId, updateScore])
+  }, [selectedAsset, timeframe, fetchPriceData, liveScore?.predictionId, updateScore, streaming])
 
   const handleAssetSelect = (asset) => {
     setSelectedAsset(asset)
@@ -187,10 +274,12 @@ function App() {
     setCustomMax('')
     setUserPrediction(null)
     setLiveScore(null)
+    setStreamFailed(false)
   }
 
   const handleTimeframeChange = (tf) => {
     setTimeframe(tf)
+    setStreamFailed(false)
     setPredictions([])
     setAveragePrediction([])
   }
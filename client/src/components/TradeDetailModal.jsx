@@ -16,6 +16,9 @@ import 'chartjs-adapter-date-fns'
 import api from '../config/api'
 import { formatLocalDate } from '../utils/dateUtils'
 
+// The overlay canvas is only a few hundred pixels wide
+const CHART_MAX_POINTS = 400
+
 ChartJS.register(
   CategoryScale,
   LinearScale,
@@ -49,7 +52,9 @@ function TradeDetailModal({ tradeId, onClose }) {
 
       setLoading(true)
       try {
-        const response = await api.get(`/api/trades/${tradeId}/details`)
+        const response = await api.get(`/api/trades/${tradeId}/details`, {
+          params: { max_points: CHART_MAX_POINTS }
+        })
         setTrade(response.data.trade)
         setPredictionSeries(response.data.predictionSeries)
         setActualPrices(response.data.actualPrices)
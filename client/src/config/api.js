@@ -1,6 +1,8 @@
 import axios from 'axios'
 
 export const API_URL = import.meta.env.VITE_API_URL || ''
+// Live price streams may be served by a separate (async worker) deployment
+export const PRICE_STREAM_URL = import.meta.env.VITE_PRICE_STREAM_URL || API_URL
 
 const AUTH_TOKEN_KEY = 'draw_trade_auth_token'
 
@@ -13,6 +13,9 @@ const TIMEFRAME_LABELS = {
   yearly: 'Yearly'
 }
 
+// The server downsamples long histories to about this many snapshots
+const HISTORY_MAX_POINTS = 400
+
 const STATUS_LABELS = {
   active: 'Active',
   completed: 'Completed',
@@ -38,7 +41,10 @@ export default function AccountPage({ user, isAuthenticated, onRefreshAuth }) {
       const [statsRes, predictionsRes, historyRes] = await Promise.all([
         api.get('/api/user/stats', { withCredentials: true }),
         api.get('/api/user/predictions/detailed', { withCredentials: true }),
-        api.get('/api/user/performance-history', { withCredentials: true })
+        api.get('/api/user/performance-history', {
+          params: { max_points: HISTORY_MAX_POINTS },
+          withCredentials: true
+        })
       ])
 
       setStats(statsRes.data)
@@ -0,0 +1,99 @@
+"""
+Bulk admin operations that can run while the app serves traffic.
+
+Both work in short, separately committed chunks instead of one transaction
+over whole tables, so row locks are held for one chunk at a time and
+requests keep going in between. TRUNCATE is not used: its table lock waits
+for every open transaction on the table and blocks all readers queued
+behind it.
+
+`on_progress(table, rows_so_far)` is called after every chunk; the admin
+endpoints log it and the `flask` commands print it.
+"""
+
+import logging
+from typing import Callable, Dict, Optional
+
+from db import db, delete_in_chunks, update_in_chunks, DEFAULT_CHUNK_SIZE
+from http_cache import bump_versions, GLOBAL_SCOPE
+from models import (User, Prediction, MetaPrediction, UserPerformanceHistory, UserStats, TokenLedger,
+                    DEFAULT_TOKEN_BALANCE)
+import ledger
+
+logger = logging.getLogger(__name__)
+
+# Users removed per step of wipe_all(); their dependent rows go first in chunks of their own
+USER_CHUNK_SIZE = 1000
+
+# Tables holding rows of a user, deleted before the user itself
+USER_DEPENDENTS = (
+    ('userStats', UserStats, UserStats.user_id),
+    ('tokenLedger', TokenLedger, TokenLedger.user_id),  # References predictions, so goes before them
+    ('predictions', Prediction, Prediction.user_id),
+    ('performanceHistory', UserPerformanceHistory, UserPerformanceHistory.user_id),
+)
+
+Progress = Optional[Callable[[str, int], None]]
+
+
+def log_progress(table: str, rows: int):
+    logger.info(f"Admin bulk operation: {rows} {table} rows so far")
+
+
+def reset_balances(balance: int = DEFAULT_TOKEN_BALANCE, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                   on_progress: Progress = None) -> int:
+    """
+    Set every user's token balance to `balance`, recording each change in the
+    ledger; returns the number of balances changed.
+    """
+    reset = update_in_chunks(
+        User, {'token_balance': balance}, User.token_balance != balance, chunk_size=chunk_size,
+        on_progress=on_progress and (lambda rows: on_progress('users', rows)),
+        before_chunk=lambda ids: ledger.record_resets(ids, balance))
+    bump_versions(GLOBAL_SCOPE)
+    db.session.commit()
+    return reset
+
+
+def wipe_all(chunk_size: int = DEFAULT_CHUNK_SIZE, on_progress: Progress = None) -> Dict[str, int]:
+    """
+    Delete all users, predictions, meta-predictions, performance history and
+    the token ledger.
+
+    Users go USER_CHUNK_SIZE at a time: their dependent rows are deleted in
+    chunks first, then the users are locked, rows written for them meanwhile
+    are swept up and the users deleted, in one short transaction. A request
+    that writes for a user being deleted waits for that transaction and then
+    fails instead of leaving orphaned rows.
+    """
+    deleted = dict.fromkeys(['users', 'predictions', 'metaPredictions', 'performanceHistory', 'userStats',
+                             'tokenLedger'], 0)
+
+    def progress(table):
+        return on_progress and (lambda rows: on_progress(table, deleted[table] + rows))
+
+    while True:
+        user_ids = [row[0] for row in db.session.query(User.id).order_by(User.id).limit(USER_CHUNK_SIZE).all()]
+        if not user_ids:
+            break
+        for table, model, column in USER_DEPENDENTS:
+            deleted[table] += delete_in_chunks(model, column.in_(user_ids), chunk_size=chunk_size,
+                                               on_progress=progress(table))
+
+        db.session.query(User.id).filter(User.id.in_(user_ids)).order_by(User.id).with_for_update().all()
+        for table, model, column in USER_DEPENDENTS:
+            deleted[table] += model.query.filter(column.in_(user_ids)).delete(synchronize_session=False)
+        deleted['users'] += User.query.filter(User.id.in_(user_ids)).delete(synchronize_session=False)
+        db.session.commit()
+        if on_progress:
+            on_progress('users', deleted['users'])
+
+    # Predictions made without an account, and the per-symbol consensus
+    deleted['predictions'] += delete_in_chunks(Prediction, Prediction.user_id.is_(None), chunk_size=chunk_size,
+                                               on_progress=progress('predictions'))
+    deleted['metaPredictions'] += delete_in_chunks(MetaPrediction, chunk_size=chunk_size,
+                                                   on_progress=progress('metaPredictions'))
+
+    bump_versions(GLOBAL_SCOPE)
+    db.session.commit()
+    return deleted
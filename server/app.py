@@ -1,101 +1,271 @@
 import os
-from flask import Flask, request, jsonify, session
+import shutil
+import tempfile
+import time
+from flask import Blueprint, Flask, Response, current_app, g, request, jsonify, session, stream_with_context
 from flask_cors import CORS
 from flask_login import current_user
 from datetime import datetime, timedelta
 from werkzeug.middleware.proxy_fix import ProxyFix
-import yfinance as yf
 import json
 import logging
+import numpy as np
+import click
 
 logging.basicConfig(level=logging.DEBUG)
 
-from db import db
-from models import User, Prediction, PriceData, UserPerformanceHistory, MetaPrediction, DEFAULT_TOKEN_BALANCE
+from db import db, dialect_insert, engine_options, validate_on_checkout, DEFAULT_CHUNK_SIZE, MAX_CHUNK_SIZE
+from models import (User, Prediction, UserPerformanceHistory, MetaPrediction, UserStats, DEFAULT_TOKEN_BALANCE,
+                    SETTLED_PREDICATE)
 from auth import auth_bp, init_auth, require_login, get_authenticated_user
 import twelve_data
-import math
-import pytz
+import admin_ops
+import ledger
+import score_buffer
+import bar_archive
+import bulk_io
+import price_meta
+from price_stream import PriceStreamHub
+from json_provider import init_json, dumps_bytes, json_bytes_response
+from instrumentation import init_instrumentation, request_budget
+import metrics
+import profiling
+import query_plans
+import performance_history
+import schema
+import user_stats
+from downsample import downsample_bars, select_indices, METHODS as DOWNSAMPLE_METHODS
+from market_hours import is_market_open, get_next_market_open
+from scoring import (calculate_live_score, calculate_mspe, calculate_progress, calculate_contrarian_score,
+                     calculate_new_payoff, calculate_payoff, merge_meta_series)
+from http_cache import (conditional, bump_versions, bump_shared_versions, BodyCache, prediction_scopes, user_scope,
+                        symbol_predictions_scope, prices_scope, GLOBAL_SCOPE, PREDICTIONS_SCOPE, LEADERBOARD_SCOPE,
+                        SHARED_PREDICTION_SCOPES)
 from functools import wraps
 
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", os.urandom(24).hex())
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1, x_for=1, x_prefix=1)
-
-# Configure CORS for production
-frontend_url = os.environ.get('FRONTEND_URL', 'http://localhost:5173')
-allowed_origins = [
-    frontend_url,
-    'http://localhost:5173',
-    'http://localhost:5001',
-    'http://localhost:5000',
-    'http://localhost:3000',
-]
-# Add Vercel preview URLs pattern
-if os.environ.get('VERCEL_URL'):
-    allowed_origins.append(f"https://{os.environ.get('VERCEL_URL')}")
-
-# Add the production domain
-production_domain = os.environ.get('PRODUCTION_DOMAIN', 'draw.trade')
-allowed_origins.extend([
-    f'https://{production_domain}',
-    f'https://www.{production_domain}',
-])
-
-# Log allowed origins for debugging
-logging.info(f"Allowed CORS origins: {allowed_origins}")
-
-CORS(app,
-     supports_credentials=True,
-     origins=allowed_origins,
-     allow_headers=['Content-Type', 'Authorization', 'X-Requested-With'],
-     methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
-     expose_headers=['Set-Cookie'])
-
-# Handle Railway's postgres:// URL format (SQLAlchemy requires postgresql://)
-database_url = os.environ.get('DATABASE_URL')
-if database_url and database_url.startswith('postgres://'):
-    database_url = database_url.replace('postgres://', 'postgresql://', 1)
-
-if not database_url:
-    database_url = 'sqlite:///local.db'
-    logging.warning("DATABASE_URL not set, using SQLite for local development")
-
-app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-    'pool_pre_ping': True,
-    'pool_recycle': 300,
-}
-# For cross-origin auth between Vercel frontend and Railway backend:
-# - SameSite=None allows cookies in cross-origin requests
-# - Secure=True is required when SameSite=None (HTTPS only)
-is_production = os.environ.get('RAILWAY_ENVIRONMENT') or os.environ.get('FLASK_ENV') == 'production'
-app.config['SESSION_COOKIE_SAMESITE'] = 'None' if is_production else 'Lax'
-app.config['SESSION_COOKIE_SECURE'] = is_production
-app.config['SESSION_COOKIE_HTTPONLY'] = True
-app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
-app.config['REMEMBER_COOKIE_DURATION'] = timedelta(days=30)
-app.config['REMEMBER_COOKIE_SAMESITE'] = 'None' if is_production else 'Lax'
-app.config['REMEMBER_COOKIE_SECURE'] = is_production
-app.config['REMEMBER_COOKIE_HTTPONLY'] = True
-
-logging.info(f"Production mode: {is_production}, SameSite: {'None' if is_production else 'Lax'}")
-
-db.init_app(app)
-
-with app.app_context():
-    db.create_all()
-    logging.info("Database tables created")
-
-# Initialize authentication
-init_auth(app)
-app.register_blueprint(auth_bp)
-
-@app.before_request
+
+def create_app():
+    """Configure the Flask app; no database or network access happens here."""
+    app = Flask(__name__)
+    init_json(app)
+    app.secret_key = os.environ.get("SESSION_SECRET", os.urandom(24).hex())
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1, x_for=1, x_prefix=1)
+
+    # Configure CORS for production
+    frontend_url = os.environ.get('FRONTEND_URL', 'http://localhost:5173')
+    allowed_origins = [
+        frontend_url,
+        'http://localhost:5173',
+        'http://localhost:5001',
+        'http://localhost:5000',
+        'http://localhost:3000',
+    ]
+    # Add Vercel preview URLs pattern
+    if os.environ.get('VERCEL_URL'):
+        allowed_origins.append(f"https://{os.environ.get('VERCEL_URL')}")
+
+    # Add the production domain
+    production_domain = os.environ.get('PRODUCTION_DOMAIN', 'draw.trade')
+    allowed_origins.extend([
+        f'https://{production_domain}',
+        f'https://www.{production_domain}',
+    ])
+
+    # Log allowed origins for debugging
+    logging.info(f"Allowed CORS origins: {allowed_origins}")
+
+    CORS(app,
+         supports_credentials=True,
+         origins=allowed_origins,
+         allow_headers=['Content-Type', 'Authorization', 'X-Requested-With'],
+         methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
+         expose_headers=['Set-Cookie', 'Server-Timing', 'X-Query-Count'])
+
+    # Handle Railway's postgres:// URL format (SQLAlchemy requires postgresql://)
+    database_url = os.environ.get('DATABASE_URL')
+    if database_url and database_url.startswith('postgres://'):
+        database_url = database_url.replace('postgres://', 'postgresql://', 1)
+
+    if not database_url:
+        database_url = 'sqlite:///local.db'
+        logging.warning("DATABASE_URL not set, using SQLite for local development")
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # One pooled connection per request thread (gunicorn.conf.py exports WEB_THREADS),
+    # plus overflow for the upstream refresh threads and the price stream hub
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+        database_url,
+        pool_size=int(os.environ.get('WEB_THREADS', 8)),
+        max_overflow=twelve_data.UPSTREAM_WORKERS + 2,
+        statement_timeout_ms=int(os.environ.get('STATEMENT_TIMEOUT_MS', 15000)),
+        poolclass=metrics.TimedQueuePool,
+    )
+    # For cross-origin auth between Vercel frontend and Railway backend:
+    # - SameSite=None allows cookies in cross-origin requests
+    # - Secure=True is required when SameSite=None (HTTPS only)
+    is_production = os.environ.get('RAILWAY_ENVIRONMENT') or os.environ.get('FLASK_ENV') == 'production'
+    app.config['SESSION_COOKIE_SAMESITE'] = 'None' if is_production else 'Lax'
+    app.config['SESSION_COOKIE_SECURE'] = is_production
+    app.config['SESSION_COOKIE_HTTPONLY'] = True
+    app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
+    app.config['REMEMBER_COOKIE_DURATION'] = timedelta(days=30)
+    app.config['REMEMBER_COOKIE_SAMESITE'] = 'None' if is_production else 'Lax'
+    app.config['REMEMBER_COOKIE_SECURE'] = is_production
+    app.config['REMEMBER_COOKIE_HTTPONLY'] = True
+
+    logging.info(f"Production mode: {is_production}, SameSite: {'None' if is_production else 'Lax'}")
+
+    db.init_app(app)
+    with app.app_context():
+        validate_on_checkout(db.engine)
+    init_instrumentation(app)
+    metrics.init_metrics(app)
+    profiling.init_profiling(app)
+    init_auth(app)
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(api)
+    app.extensions['price_stream'] = PriceStreamHub(
+        lambda symbol, interval, period: load_price_payload(symbol, interval, period)[0], app)
+    return app
+
+
+# Routes and CLI commands are registered on the app by create_app()
+api = Blueprint('api', __name__, cli_group=None)
+
+
+def init_db():
+    """Apply schema migrations and fill the price series metadata and user statistics; returns the revision."""
+    revision = schema.upgrade()
+    price_meta.ensure_populated()
+    user_stats.ensure_populated()
+    return revision
+
+
+@api.cli.command('init-db')
+def init_db_command():
+    """Apply schema migrations and fill the price series metadata and user statistics."""
+    print(f"Database at revision {init_db()}")
+
+
+@api.cli.command('explain-queries')
+def explain_queries_command():
+    """Check that the hot Prediction queries use their indexes and scan no whole table."""
+    results = query_plans.check()
+    for result in results:
+        if result['ok']:
+            status = f"uses {result['index']}"
+        elif result['index']:
+            status = f"uses {result['index']} but SEQUENTIAL SCAN"
+        else:
+            status = f"MISSING {' or '.join(result['expected'])}"
+        print(f"{result['name']}: {status}")
+        for line in result['plan']:
+            print(f"    {line}")
+    if not all(result['ok'] for result in results):
+        raise SystemExit(1)
+
+
+@api.cli.command('rebuild-price-meta')
+def rebuild_price_meta_command():
+    """Recompute price series metadata from price_data."""
+    count = price_meta.rebuild()
+    print(f"Rebuilt metadata for {count} price series")
+
+
+@api.cli.command('reconcile-user-stats')
+@click.option('--rebuild', is_flag=True, help='Recompute every row instead of repairing the drifted ones')
+def reconcile_user_stats_command(rebuild):
+    """Check the per-user prediction statistics against predictions."""
+    if rebuild:
+        print(f"Rebuilt statistics for {user_stats.rebuild()} users")
+        return
+    result = user_stats.reconcile()
+    print(f"Checked {result['users']} users, repaired {result['repaired']}")
+
+
+@api.cli.command('compact-performance-history')
+def compact_performance_history_command():
+    """Thin out old performance snapshots to one per day, then one per week."""
+    report = performance_history.compact()
+    for resolution, tier in report['tiers'].items():
+        print(f"{resolution}: kept {tier['rowsKept']}, deleted {tier['rowsDeleted']} "
+              f"snapshots of {tier['users']} users before {tier['cutoff']}")
+
+
+def print_progress(table, rows):
+    print(f"  {table}: {rows}")
+
+
+@api.cli.command('reset-balances')
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True, type=click.IntRange(1, MAX_CHUNK_SIZE),
+              help='Users updated per transaction')
+def reset_balances_command(chunk_size):
+    """Reset every user's token balance to the default."""
+    count = admin_ops.reset_balances(chunk_size=chunk_size, on_progress=print_progress)
+    print(f"Reset {count} user balances to {DEFAULT_TOKEN_BALANCE}")
+
+
+@api.cli.command('wipe-all-data')
+@click.confirmation_option(prompt='Delete all users, predictions and performance history?')
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True, type=click.IntRange(1, MAX_CHUNK_SIZE),
+              help='Rows deleted per transaction')
+def wipe_all_data_command(chunk_size):
+    """Delete all users, predictions, meta-predictions and performance history."""
+    deleted = admin_ops.wipe_all(chunk_size=chunk_size, on_progress=print_progress)
+    print(', '.join(f"{count} {table}" for table, count in deleted.items()) + ' deleted')
+
+
+@api.cli.command('profile-token')
+@click.argument('path')
+@click.option('--minutes', default=10, show_default=True, help='Validity (at most 60)')
+def profile_token_command(path, minutes):
+    """Print an X-Profile-Token header value that profiles requests to PATH."""
+    expires = int(datetime.utcnow().timestamp()) + min(minutes, 60) * 60
+    print(f"{profiling.TOKEN_HEADER}: {profiling.sign(path, expires)}")
+
+
+@api.cli.command('export-parquet')
+@click.argument('directory')
+@click.option('--table', 'tables', multiple=True, type=click.Choice(bulk_io.TABLES), help='Defaults to all tables')
+@click.option('--symbol', 'symbols', multiple=True)
+@click.option('--interval', 'intervals', multiple=True, help='Price data intervals, e.g. 1min')
+@click.option('--since', help='Epoch seconds or ISO 8601')
+@click.option('--until', help='Epoch seconds or ISO 8601')
+@click.option('--batch-size', default=bulk_io.DEFAULT_BATCH_SIZE, show_default=True)
+def export_parquet_command(directory, tables, symbols, intervals, since, until, batch_size):
+    """Export price data and predictions to partitioned Parquet under DIRECTORY."""
+    report = bulk_io.export_dataset(
+        directory, tables or bulk_io.TABLES, symbols=list(symbols), intervals=list(intervals),
+        since=twelve_data.parse_timestamp(since), until=twelve_data.parse_timestamp(until), batch_size=batch_size,
+    )
+    for table, counts in report.items():
+        print(f"{table}: {counts['rows']} rows in {counts['files']} files")
+
+
+@api.cli.command('import-parquet')
+@click.argument('directory')
+@click.option('--table', 'tables', multiple=True, type=click.Choice(bulk_io.TABLES), help='Defaults to all tables')
+@click.option('--overwrite', is_flag=True, help='Replace existing price bars instead of keeping them')
+@click.option('--batch-size', default=bulk_io.DEFAULT_BATCH_SIZE, show_default=True)
+def import_parquet_command(directory, tables, overwrite, batch_size):
+    """Import a Parquet dataset written by export-parquet from DIRECTORY."""
+    report = bulk_io.import_dataset(directory, tables or bulk_io.TABLES, overwrite=overwrite, batch_size=batch_size)
+    for table, counts in report.items():
+        print(f"{table}: {counts}")
+
+
+@api.before_app_request
 def make_session_permanent():
     session.permanent = True
 
+
+@api.before_app_request
+def start_background_jobs():
+    # Started by the first request so each gunicorn worker runs its own, not the preloading master
+    user_stats.start_reconciler(current_app._get_current_object())
+    score_buffer.start_flusher(current_app._get_current_object())
+
 POPULAR_STOCKS = [
     {'symbol': 'AAPL', 'name': 'Apple Inc.', 'type': 'Stock'},
     {'symbol': 'MSFT', 'name': 'Microsoft Corporation', 'type': 'Stock'},
@@ -126,181 +296,42 @@ SUPPORTED_TIMEZONES = [
 ]
 
 
-def is_crypto(symbol):
-    """Check if a symbol is a cryptocurrency."""
-    return '-USD' in symbol.upper() or symbol.upper() in ['BTC', 'ETH', 'USDT', 'BNB', 'SOL', 'XRP', 'DOGE']
-
-
-def is_market_open(symbol):
-    """
-    Check if the market is currently open for the given symbol.
-    Crypto markets are always open.
-    US stock market hours: 9:30 AM - 4:00 PM ET, Monday-Friday.
-    Futures have extended hours but we'll use regular hours for simplicity.
-    """
-    if is_crypto(symbol):
-        return True
-
-    # Get current time in Eastern timezone
-    eastern = pytz.timezone('America/New_York')
-    now = datetime.now(eastern)
-
-    # Check if it's a weekend
-    if now.weekday() >= 5:  # Saturday = 5, Sunday = 6
-        return False
-
-    # Check market hours (9:30 AM - 4:00 PM ET)
-    market_open = now.replace(hour=9, minute=30, second=0, microsecond=0)
-    market_close = now.replace(hour=16, minute=0, second=0, microsecond=0)
-
-    return market_open <= now <= market_close
-
-
-def get_next_market_open(symbol):
-    """Get the next market open time for a symbol."""
-    if is_crypto(symbol):
-        return None  # Always open
-
-    eastern = pytz.timezone('America/New_York')
-    now = datetime.now(eastern)
-
-    # Find next weekday at 9:30 AM
-    next_open = now.replace(hour=9, minute=30, second=0, microsecond=0)
-
-    # If we're past market close today, move to next day
-    market_close = now.replace(hour=16, minute=0, second=0, microsecond=0)
-    if now >= market_close or now >= next_open:
-        next_open += timedelta(days=1)
-
-    # Skip weekends
-    while next_open.weekday() >= 5:
-        next_open += timedelta(days=1)
-
-    return next_open.isoformat()
-
-
-def calculate_contrarian_score(prediction_series, meta_series):
-    """
-    Calculate how different a prediction is from the meta-prediction.
-    Returns a score where higher = more contrarian.
-    Uses correlation-based measure: contrarian_score = 1 - abs(correlation)
-    """
-    if not prediction_series or not meta_series:
-        return 0.5  # Neutral score if no comparison possible
-
-    # Align series by length
-    min_len = min(len(prediction_series), len(meta_series))
-    if min_len < 2:
-        return 0.5
-
-    pred_prices = [p['price'] for p in prediction_series[:min_len]]
-    meta_prices = [p['price'] for p in meta_series[:min_len]]
-
-    # Calculate percentage changes instead of raw prices
-    pred_changes = [(pred_prices[i] - pred_prices[i-1]) / pred_prices[i-1] if pred_prices[i-1] != 0 else 0
-                    for i in range(1, len(pred_prices))]
-    meta_changes = [(meta_prices[i] - meta_prices[i-1]) / meta_prices[i-1] if meta_prices[i-1] != 0 else 0
-                    for i in range(1, len(meta_prices))]
-
-    if not pred_changes or not meta_changes:
-        return 0.5
-
-    # Calculate correlation
-    n = len(pred_changes)
-    mean_pred = sum(pred_changes) / n
-    mean_meta = sum(meta_changes) / n
-
-    numerator = sum((pred_changes[i] - mean_pred) * (meta_changes[i] - mean_meta) for i in range(n))
-    pred_variance = sum((p - mean_pred) ** 2 for p in pred_changes)
-    meta_variance = sum((m - mean_meta) ** 2 for m in meta_changes)
-
-    if pred_variance == 0 or meta_variance == 0:
-        return 0.5
-
-    correlation = numerator / math.sqrt(pred_variance * meta_variance)
-
-    # Contrarian score: 0 = same as consensus, 1 = completely opposite
-    # We reward both being different AND being accurate
-    contrarian_score = (1 - abs(correlation)) * 0.5 + 0.5  # Scale to 0.5-1.0 range
-
-    return round(contrarian_score, 4)
+def current_user_scope(**_):
+    """Version scope of the authenticated user, for conditional GETs."""
+    auth_user = get_authenticated_user()
+    return user_scope(auth_user.id if auth_user else 'anonymous')
 
 
-def calculate_new_payoff(staked_tokens, accuracy_score, contrarian_score, n_points, is_early_close=False, progress=1.0):
+def lock_meta_prediction(symbol):
     """
-    New payoff function that rewards both accuracy and contrarian predictions.
-
-    Payoff = stake * (accuracy_multiplier * contrarian_bonus) * progress_factor
-
-    Where:
-    - accuracy_multiplier = n_points / (1 + MSPE)  (higher for lower MSPE)
-    - contrarian_bonus = 1 + (contrarian_score - 0.5) * 2  (1.0 to 2.0x)
-    - progress_factor = 0.5 + 0.5 * progress (for early close)
+    The meta-prediction of a symbol, locked (FOR UPDATE) until the caller
+    commits. A symbol without one gets an empty one first.
     """
-    if staked_tokens <= 0 or accuracy_score is None:
-        return 0
-
-    # Base accuracy multiplier (capped to prevent extreme values)
-    mspe_capped = max(accuracy_score, 0.001)  # Prevent division by near-zero
-    accuracy_multiplier = min(n_points / (1 + mspe_capped), n_points * 10)  # Cap at 10x n_points
-
-    # Contrarian bonus (1.0x to 2.0x)
-    c_score = contrarian_score if contrarian_score is not None else 0.5
-    contrarian_bonus = 1.0 + (c_score - 0.5) * 2.0
-
-    # Progress factor for early close
-    progress_factor = 1.0 if not is_early_close else (0.5 + 0.5 * progress)
-
-    # Calculate final payoff
-    raw_payoff = staked_tokens * accuracy_multiplier * contrarian_bonus * progress_factor
-
-    # Apply reasonable bounds (0.1x to 100x stake)
-    min_payoff = int(staked_tokens * 0.1)
-    max_payoff = int(staked_tokens * 100)
-
-    return max(min_payoff, min(int(raw_payoff), max_payoff))
-
-
-def update_meta_prediction(symbol, new_prediction_series):
-    """Update the meta-prediction for a symbol by incorporating a new prediction."""
-    meta = MetaPrediction.query.filter_by(symbol=symbol).first()
-
-    if not meta:
-        # Create new meta-prediction
-        meta = MetaPrediction(
-            symbol=symbol,
-            price_series=json.dumps(new_prediction_series),
-            prediction_count=1
-        )
-        db.session.add(meta)
-    else:
-        # Update existing meta-prediction with weighted average
-        existing_series = json.loads(meta.price_series) if meta.price_series else []
-        count = meta.prediction_count
-
-        # Weighted average: existing gets weight=count, new gets weight=1
-        updated_series = []
-        max_len = max(len(existing_series), len(new_prediction_series))
-
-        for i in range(max_len):
-            if i < len(existing_series) and i < len(new_prediction_series):
-                avg_price = (existing_series[i]['price'] * count + new_prediction_series[i]['price']) / (count + 1)
-                updated_series.append({
-                    'price': round(avg_price, 2),
-                    'timestamp': new_prediction_series[i].get('timestamp', existing_series[i].get('timestamp'))
-                })
-            elif i < len(new_prediction_series):
-                updated_series.append(new_prediction_series[i])
+    query = MetaPrediction.query.filter_by(symbol=symbol).with_for_update().populate_existing()
+    # The caller's half-built rows are flushed later, in one go
+    with db.session.no_autoflush:
+        meta = query.first()
+        if meta is None:
+            values = {'symbol': symbol, 'price_series': '[]', 'prediction_count': 0}
+            stmt = dialect_insert(MetaPrediction)
+            if stmt is not None:
+                # First predictions of a symbol racing: one inserts, the others wait for its row
+                db.session.execute(stmt.values(**values).on_conflict_do_nothing(
+                    index_elements=[MetaPrediction.symbol]))
+                meta = query.first()
             else:
-                updated_series.append(existing_series[i])
+                meta = MetaPrediction(**values)
+                db.session.add(meta)
+    return meta
 
-        meta.price_series = json.dumps(updated_series)
-        meta.prediction_count = count + 1
 
-    db.session.commit()
-    return meta
+def add_to_meta_prediction(meta, existing_series, new_prediction_series):
+    """Fold a new prediction into a locked meta-prediction (weighted average). Caller commits."""
+    count = meta.prediction_count or 0
+    meta.price_series = json.dumps(merge_meta_series(existing_series, count, new_prediction_series))
+    meta.prediction_count = count + 1
 
-@app.route('/api/search')
+@api.route('/api/search')
 def search_assets():
     query = request.args.get('q', '').upper()
 
@@ -314,6 +345,7 @@ def search_assets():
 
     if len(matches) < 5 and len(query) >= 1:
         try:
+            import yfinance as yf  # Imported on first use: it pulls in pandas
             ticker = yf.Ticker(query)
             info = ticker.info
             if info.get('shortName') or info.get('longName'):
@@ -328,39 +360,61 @@ def search_assets():
 
     return jsonify({'results': matches[:10]})
 
-@app.route('/api/prices/<symbol>')
-def get_prices(symbol):
-    interval = request.args.get('interval', '5m')
-    period = request.args.get('period', '5d')
-    source = request.args.get('source', 'auto')  # 'auto', 'twelve_data', 'yfinance'
+PERIOD_TO_OUTPUTSIZE = {
+    '1d': 100,      # 1 day of 1m data ~= 390 bars (market hours)
+    '5d': 500,      # 5 days
+    '1mo': 720,     # 1 month of hourly data
+    '6mo': 180,     # 6 months of daily data
+    '1y': 365,      # 1 year of daily data
+}
 
+
+def load_price_payload(symbol, interval, period, source='auto', since=None, until=None, compact=False):
+    """
+    Load prices for a symbol from the Twelve Data cache, falling back to yfinance.
+
+    `since`/`until` (naive UTC datetimes) restrict the response to a range and
+    `compact` returns epoch/OHLCV rows instead of dicts.
+    Returns a (payload, status_code) tuple shared by the REST and streaming endpoints.
+    """
     # Map period to approximate outputsize for Twelve Data
-    period_to_outputsize = {
-        '1d': 100,      # 1 day of 1m data ~= 390 bars (market hours)
-        '5d': 500,      # 5 days
-        '1mo': 720,     # 1 month of hourly data
-        '6mo': 180,     # 6 months of daily data
-        '1y': 365,      # 1 year of daily data
-    }
-    outputsize = period_to_outputsize.get(period, 100)
+    outputsize = PERIOD_TO_OUTPUTSIZE.get(period, 100)
 
     # Try Twelve Data first if API key is configured and source allows it
     if source in ('auto', 'twelve_data') and twelve_data.TWELVE_DATA_API_KEY:
-        result = twelve_data.get_prices_with_cache(symbol, interval, outputsize)
-        if result.get('prices'):
-            return jsonify(result)
+        result = twelve_data.get_prices_with_cache(symbol, interval, outputsize,
+                                                   since=since, until=until, compact=compact)
+        if not result.get('error'):
+            return result, 200
 
     # Fall back to yfinance
     if source in ('auto', 'yfinance'):
         try:
+            import yfinance as yf
             ticker = yf.Ticker(symbol)
-            df = ticker.history(period=period, interval=interval)
+            with metrics.UPSTREAM_LATENCY.labels('yfinance').time():
+                df = ticker.history(period=period, interval=interval)
 
             if df.empty:
-                return jsonify({'error': 'No data found'}), 404
+                metrics.UPSTREAM_ERRORS.labels('yfinance', 'no_data').inc()
+                return {'error': 'No data found'}, 404
 
             prices = []
             for timestamp, row in df.iterrows():
+                if since is not None or until is not None:
+                    utc_timestamp = datetime.utcfromtimestamp(timestamp.timestamp())
+                    if (since is not None and utc_timestamp < since) or (until is not None and utc_timestamp > until):
+                        continue
+                if compact:
+                    prices.append([
+                        twelve_data.to_epoch(timestamp),
+                        float(row['Open']),
+                        float(row['High']),
+                        float(row['Low']),
+                        float(row['Close']),
+                        int(row['Volume'])
+                    ])
+                    continue
                 prices.append({
                     'timestamp': timestamp.isoformat(),
                     'open': float(row['Open']),
@@ -370,25 +424,129 @@ def get_prices(symbol):
                     'volume': int(row['Volume'])
                 })
 
-            closes = [p['close'] for p in prices]
-
-            return jsonify({
-                'prices': prices,
-                'minPrice': min(closes),
-                'maxPrice': max(closes),
-                'lastPrice': closes[-1] if closes else 0,
-                'lastTimestamp': prices[-1]['timestamp'] if prices else None,
-                'source': 'yfinance'
-            })
+            metrics.PRICE_SOURCE.labels('yfinance').inc()
+            return twelve_data.build_price_payload(prices, 'yfinance', compact), 200
 
         except Exception as e:
             logging.error(f"yfinance error for {symbol}: {e}")
-            return jsonify({'error': str(e)}), 500
+            metrics.UPSTREAM_ERRORS.labels('yfinance', 'exception').inc()
+            return {'error': str(e)}, 500
+
+    return {'error': 'No data source available'}, 500
+
+
+# Downsampled price bodies, keyed by ETag (symbol, interval, max_points, data version)
+downsampled_prices_cache = BodyCache(maxsize=512)
+
+
+
+@api.route('/api/prices/<symbol>')
+@conditional(
+    lambda symbol: [prices_scope(symbol, twelve_data.get_twelve_data_interval(request.args.get('interval', '5m')))],
+    # Expire with the cache so a stale window still triggers a refresh
+    ttl=lambda symbol: twelve_data.cache_freshness_seconds(request.args.get('interval', '5m')),
+)
+def get_prices(symbol):
+    """
+    Get price bars for a symbol.
+
+    Optional `since`/`until` (epoch seconds or ISO 8601) return only bars in that
+    range, so a poll can ask for just what changed since its last timestamp.
+    `format=compact` returns {'columns': ['t','o','h','l','c','v'], 'bars': [[epoch, ...], ...]}.
+    `max_points` reduces the bars to about that many with `method` 'lttb' (default)
+    or 'minmax'; downsampled bodies are cached until the underlying data changes.
+    """
+    interval = request.args.get('interval', '5m')
+    period = request.args.get('period', '5d')
+    source = request.args.get('source', 'auto')  # 'auto', 'twelve_data', 'yfinance'
+    compact = request.args.get('format') == 'compact'
+    max_points = request.args.get('max_points', type=int)
+    method = request.args.get('method', 'lttb')
+
+    if method not in DOWNSAMPLE_METHODS:
+        return jsonify({'error': f'method must be one of: {", ".join(DOWNSAMPLE_METHODS)}'}), 400
+
+    if max_points:
+        body = downsampled_prices_cache.get(g.get('etag'))
+        if body is not None:
+            return json_bytes_response(body)
 
-    return jsonify({'error': 'No data source available'}), 500
+    try:
+        since = twelve_data.parse_timestamp(request.args.get('since'))
+        until = twelve_data.parse_timestamp(request.args.get('until'))
+    except ValueError:
+        return jsonify({'error': 'since/until must be epoch seconds or ISO 8601 timestamps'}), 400
 
+    payload, status = load_price_payload(symbol, interval, period, source, since=since, until=until, compact=compact)
 
-@app.route('/api/prices/refresh/<symbol>', methods=['POST'])
+    if max_points and status == 200:
+        key = 'bars' if compact else 'prices'
+        payload['originalCount'] = len(payload[key])
+        payload[key] = downsample_bars(payload[key], max_points, method, compact)
+        payload['count'] = len(payload[key])
+        body = dumps_bytes(payload)
+        downsampled_prices_cache.put(g.get('etag'), body)
+        return json_bytes_response(body)
+
+    return jsonify(payload), status
+
+
+@api.route('/api/prices/<symbol>/stream')
+def stream_prices(symbol):
+    """
+    Stream prices as Server-Sent Events.
+
+    Sends a `snapshot` event with the full window once, then `bars` events with
+    only new or updated bars. With `predictionId`, also sends read-only `score`
+    events whenever the live MSPE changes. Answers 503 when this process
+    already holds as many streams as it allows (price_stream.MAX_SUBSCRIBERS).
+    """
+    interval = request.args.get('interval', '5m')
+    period = request.args.get('period', '5d')
+    prediction_id = request.args.get('predictionId', type=int)
+
+    on_bars = None
+    if prediction_id:
+        prediction = Prediction.query.get(prediction_id)
+        if not prediction:
+            return jsonify({'error': 'Prediction not found'}), 404
+
+        price_series = json.loads(prediction.price_series) if prediction.price_series else []
+        timeframe, created_at = prediction.timeframe, prediction.created_at
+        last_score = {}
+
+        def on_bars(data):
+            current_price = data.get('lastPrice')
+            if not price_series or not current_price or current_price <= 0:
+                return None
+            score = calculate_live_score(price_series, timeframe, created_at, current_price)
+            if score['mspe'] == last_score.get('mspe') and score['progress'] == last_score.get('progress'):
+                return None
+            last_score.update(score)
+            return {'predictionId': prediction_id, **score}
+
+    # Release the pooled connection; the stream itself never touches the database
+    db.session.close()
+
+    hub = current_app.extensions['price_stream']
+    subscription = hub.subscribe(symbol, interval, period)
+    if subscription is None:
+        # Every stream this process can hold is open; the client polls /api/prices instead
+        response = jsonify({'error': 'Price stream unavailable, poll /api/prices instead'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '60'
+        return response
+
+    response = Response(stream_with_context(hub.stream(subscription, on_bars=on_bars)),
+                        mimetype='text/event-stream')
+    # Also when the client leaves before the stream started and its finally never runs
+    response.call_on_close(lambda: hub.unsubscribe(subscription))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@api.route('/api/prices/refresh/<symbol>', methods=['POST'])
 def refresh_prices(symbol):
     """Force refresh price data from Twelve Data API."""
     interval = request.args.get('interval', '5m')
@@ -411,35 +569,16 @@ def refresh_prices(symbol):
     return jsonify({'error': 'Failed to fetch price data'}), 500
 
 
-@app.route('/api/prices/stats')
+@api.route('/api/prices/stats')
 def price_stats():
     """Get statistics about cached price data."""
-    from sqlalchemy import func
-
-    stats = db.session.query(
-        PriceData.symbol,
-        PriceData.interval,
-        func.count(PriceData.id).label('count'),
-        func.min(PriceData.timestamp).label('oldest'),
-        func.max(PriceData.timestamp).label('newest'),
-    ).group_by(PriceData.symbol, PriceData.interval).all()
-
-    result = []
-    for stat in stats:
-        result.append({
-            'symbol': stat.symbol,
-            'interval': stat.interval,
-            'count': stat.count,
-            'oldest': stat.oldest.isoformat() if stat.oldest else None,
-            'newest': stat.newest.isoformat() if stat.newest else None,
-        })
-
     return jsonify({
-        'stats': result,
+        'stats': [price_meta.to_dict(meta) for meta in price_meta.all_series()],
         'twelveDataConfigured': bool(twelve_data.TWELVE_DATA_API_KEY)
     })
 
-@app.route('/api/predictions/<symbol>')
+@api.route('/api/predictions/<symbol>')
+@conditional(lambda symbol: [symbol_predictions_scope(symbol)])
 def get_predictions(symbol):
     timeframe = request.args.get('timeframe', 'daily')
 
@@ -496,7 +635,8 @@ def get_predictions(symbol):
         'count': len(predictions)
     })
 
-@app.route('/api/predictions/all')
+@api.route('/api/predictions/all')
+@conditional(lambda: [PREDICTIONS_SCOPE], ttl=60)
 def get_all_predictions():
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
@@ -582,7 +722,7 @@ def get_all_predictions():
         'currentPage': page
     })
 
-@app.route('/api/predictions', methods=['POST'])
+@api.route('/api/predictions', methods=['POST'])
 def submit_prediction():
     data = request.get_json()
 
@@ -615,12 +755,9 @@ def submit_prediction():
         return jsonify({'error': 'Minimum stake is 1 token'}), 400
 
     user_id = auth_user.id
-    user = User.query.get(auth_user.id)
-    if user.token_balance < staked_tokens:
+    # Cheap early rejection; the debit below is the authoritative check
+    if auth_user.token_balance < staked_tokens:
         return jsonify({'error': 'Insufficient token balance'}), 400
-    user.token_balance -= staked_tokens
-    db.session.add(user)
-    user_balance = user.token_balance
 
     canvas_height = canvas_dimensions.get('height', 400)
     bottom_padding = canvas_dimensions.get('bottomPadding', 30)
@@ -683,11 +820,6 @@ def submit_prediction():
             'timestamp': timestamp.isoformat()
         })
 
-    # Get meta-prediction for contrarian score calculation
-    meta = MetaPrediction.query.filter_by(symbol=symbol).first()
-    meta_series = json.loads(meta.price_series) if meta and meta.price_series else []
-    contrarian_score = calculate_contrarian_score(price_series, meta_series)
-
     prediction = Prediction(
         user_id=user_id,
         symbol=symbol,
@@ -696,27 +828,43 @@ def submit_prediction():
         start_price=price_series[0]['price'],
         end_price=price_series[-1]['price'],
         price_series=json.dumps(price_series),
-        staked_tokens=staked_tokens,
-        contrarian_score=contrarian_score
+        staked_tokens=staked_tokens
     )
 
+    # One transaction from here to the commit. The debit goes first, so a stake
+    # the balance no longer covers fails before the meta row is locked.
+    user_balance = ledger.debit(user_id, staked_tokens, 'stake', prediction)
+    if user_balance is None:
+        # A concurrent stake spent the balance since the check above
+        db.session.rollback()
+        return jsonify({'error': 'Insufficient token balance'}), 400
+
+    # Contrarian score against the meta-prediction, then fold this prediction in
+    meta = lock_meta_prediction(symbol)
+    meta_series = json.loads(meta.price_series) if meta.price_series else []
+    contrarian_score = calculate_contrarian_score(price_series, meta_series)
+    prediction.contrarian_score = contrarian_score
+    add_to_meta_prediction(meta, meta_series, price_series)
+
     db.session.add(prediction)
+    user_stats.record(prediction)
+    bump_versions(*prediction_scopes(symbol, user_id))
+    prediction_id = prediction.id  # Read before the commit expires it
     db.session.commit()
-
-    # Update meta-prediction with this new prediction
-    update_meta_prediction(symbol, price_series)
+    bump_shared_versions(*SHARED_PREDICTION_SCOPES)
 
     return jsonify({
         'success': True,
-        'predictionId': prediction.id,
+        'predictionId': prediction_id,
         'message': 'Prediction saved successfully',
         'tokenBalance': user_balance,
         'priceSeries': price_series,
         'contrarianScore': contrarian_score
     })
 
-@app.route('/api/user/predictions')
+@api.route('/api/user/predictions')
 @require_login
+@conditional(lambda: [current_user_scope()])
 def get_user_predictions():
     auth_user = get_authenticated_user()
     predictions = Prediction.query.filter_by(
@@ -742,7 +890,8 @@ def get_user_predictions():
         ]
     })
 
-@app.route('/api/user/prediction/<symbol>')
+@api.route('/api/user/prediction/<symbol>')
+@conditional(lambda symbol: [current_user_scope()])
 def get_user_latest_prediction(symbol):
     auth_user = get_authenticated_user()
     if not auth_user:
@@ -776,7 +925,7 @@ def get_user_latest_prediction(symbol):
         }
     })
 
-@app.route('/api/predictions/<int:prediction_id>/score', methods=['POST'])
+@api.route('/api/predictions/<int:prediction_id>/score', methods=['POST'])
 def update_prediction_score(prediction_id):
     """
     Update prediction score using Mean Squared Percentage Error (MSPE).
@@ -809,20 +958,7 @@ def update_prediction_score(prediction_id):
     if not price_series:
         return jsonify({'error': 'No price series data'}), 400
 
-    now = datetime.utcnow()
-    prediction_created = prediction.created_at
-
-    timeframe_durations = {
-        'hourly': timedelta(hours=1),
-        'daily': timedelta(days=1),
-        'weekly': timedelta(weeks=1),
-        'monthly': timedelta(days=30),
-        'yearly': timedelta(days=365)
-    }
-
-    total_duration = timeframe_durations.get(prediction.timeframe, timedelta(days=1))
-    elapsed = now - prediction_created
-    progress = min(1.0, elapsed.total_seconds() / total_duration.total_seconds())
+    progress = calculate_progress(prediction.created_at, prediction.timeframe)
 
     n_total = len(price_series)  # Total prediction points
     current_point_index = 0
@@ -839,39 +975,51 @@ def update_prediction_score(prediction_id):
 
         predicted_price_at_now = price_series[current_point_index]['price']
 
+    # A settled prediction keeps the score its payout was computed from
+    if progress >= 0.01 and prediction.status == 'active':
+        scoring_started = time.perf_counter()
         # Compute MSPE over all elapsed points
-        # SPE = (actual - predicted)² / actual
-        # MSPE = mean of all SPE values
-        spe_sum = 0.0
-        for i in range(n_elapsed):
-            predicted_price = price_series[i]['price']
-            diff = current_price - predicted_price
-            spe = (diff * diff) / current_price
-            spe_sum += spe
-
-        mspe = spe_sum / n_elapsed
-        prediction.accuracy_score = round(mspe, 6)
-
-        if progress >= 1.0 and prediction.status == 'active':
-            prediction.status = 'completed'
-            if prediction.staked_tokens > 0 and mspe > 0:
-                # Payoff = stake * N / MSPE
-                # Lower MSPE = higher rewards
-                payoff = (prediction.staked_tokens * n_total) / mspe
-                rewards = int(payoff)
-                prediction.rewards_earned = rewards
-
-                if prediction.user_id:
-                    user = User.query.get(prediction.user_id)
-                    if user:
-                        user.token_balance += rewards
-                        db.session.add(user)
-
-        db.session.commit()
+        mspe = calculate_mspe(price_series, current_price, n_elapsed)
+        accuracy_score = round(mspe, 6)
+
+        if progress >= 1.0:
+            # Settlement is written now; lock the row and start from its current score
+            db.session.refresh(prediction, with_for_update=True)
+            score_buffer.discard(prediction.id)
+            # A concurrent close or score may have settled it since the check above
+            settled = prediction.status == 'active'
+            if settled:
+                before = user_stats.state(prediction)
+                prediction.accuracy_score = accuracy_score
+                rewards = prediction.rewards_earned or 0
+                if prediction.staked_tokens > 0 and mspe > 0:
+                    # Payoff = stake * N / MSPE
+                    # Lower MSPE = higher rewards
+                    payoff = (prediction.staked_tokens * n_total) / mspe
+                    rewards = int(payoff)
+
+                # Only the request that completes the prediction pays out
+                settled = ledger.settle(prediction, 'completed', rewards)
+
+            if not settled:
+                # Report the settlement that won instead of this score
+                db.session.rollback()
+                mspe = None
+            else:
+                if prediction.user_id and rewards:
+                    ledger.credit(prediction.user_id, rewards, 'reward', prediction)
+                user_stats.record(prediction, before)
+                bump_versions(*prediction_scopes(prediction.symbol, prediction.user_id))
+                db.session.commit()
+                bump_shared_versions(*SHARED_PREDICTION_SCOPES)
+        else:
+            # Informational until settlement: written behind, in batches (score_buffer.py)
+            score_buffer.put(prediction.id, accuracy_score)
+        metrics.SCORING_DURATION.labels('score').observe(time.perf_counter() - scoring_started)
 
     return jsonify({
         'predictionId': prediction.id,
-        'mspe': prediction.accuracy_score,
+        'mspe': accuracy_score if mspe is not None else prediction.accuracy_score,
         'status': prediction.status,
         'rewardsEarned': prediction.rewards_earned,
         'progress': round(progress * 100, 1),
@@ -883,17 +1031,6 @@ def update_prediction_score(prediction_id):
     })
 
 
-def calculate_payoff(staked_tokens, n_total, mspe):
-    """Calculate payoff based on stake, prediction length, and MSPE.
-
-    Payoff = stake * N / MSPE
-    Lower MSPE = higher rewards
-    """
-    if mspe is None or mspe <= 0 or staked_tokens <= 0:
-        return 0
-    return int((staked_tokens * n_total) / mspe)
-
-
 def calculate_estimated_payoff(prediction, current_price=None):
     """Calculate estimated payoff for a prediction based on current state."""
     price_series = json.loads(prediction.price_series) if prediction.price_series else []
@@ -915,7 +1052,7 @@ def calculate_estimated_payoff(prediction, current_price=None):
     return 0
 
 
-@app.route('/api/predictions/<int:prediction_id>/close', methods=['POST'])
+@api.route('/api/predictions/<int:prediction_id>/close', methods=['POST'])
 @require_login
 def close_or_collect_prediction(prediction_id):
     """Close a prediction early or collect rewards for completed predictions."""
@@ -957,20 +1094,7 @@ def close_or_collect_prediction(prediction_id):
         return jsonify({'error': 'No price series data'}), 400
 
     # Calculate progress
-    now = datetime.utcnow()
-    prediction_created = prediction.created_at
-
-    timeframe_durations = {
-        'hourly': timedelta(hours=1),
-        'daily': timedelta(days=1),
-        'weekly': timedelta(weeks=1),
-        'monthly': timedelta(days=30),
-        'yearly': timedelta(days=365)
-    }
-
-    total_duration = timeframe_durations.get(prediction.timeframe, timedelta(days=1))
-    elapsed = now - prediction_created
-    progress = min(1.0, elapsed.total_seconds() / total_duration.total_seconds())
+    progress = calculate_progress(prediction.created_at, prediction.timeframe)
 
     # Determine if this is early close or reward collection
     is_early_close = progress < 1.0
@@ -981,17 +1105,15 @@ def close_or_collect_prediction(prediction_id):
         return jsonify({'error': 'Cannot close prediction in first 5% of timeframe'}), 400
 
     # Calculate MSPE over elapsed points
+    settlement_started = time.perf_counter()
     current_point_index = min(int(progress * n_total), n_total - 1)
     n_elapsed = current_point_index + 1 if is_early_close else n_total
 
-    spe_sum = 0.0
-    for i in range(n_elapsed):
-        predicted_price = price_series[i]['price']
-        diff = current_price - predicted_price
-        spe = (diff * diff) / current_price if current_price > 0 else 0
-        spe_sum += spe
-
-    mspe = spe_sum / n_elapsed if n_elapsed > 0 else 0
+    mspe = calculate_mspe(price_series, current_price, n_elapsed)
+    # Lock the row and start from its current score, which score polling writes behind
+    db.session.refresh(prediction, with_for_update=True)
+    score_buffer.discard(prediction.id)
+    before = user_stats.state(prediction)
     prediction.accuracy_score = round(mspe, 6)
 
     # Calculate payoff using new function with contrarian bonus
@@ -1004,17 +1126,20 @@ def close_or_collect_prediction(prediction_id):
         progress=progress
     )
 
-    # Set status based on whether it's early close or full completion
-    prediction.status = 'closed' if is_early_close else 'completed'
-    prediction.rewards_earned = payoff
+    # Set status based on whether it's early close or full completion; a
+    # concurrent close or score may have settled it since the check above
+    if not ledger.settle(prediction, 'closed' if is_early_close else 'completed', payoff):
+        db.session.rollback()
+        return jsonify({'error': 'Prediction is not active'}), 400
 
     # Credit user
-    user = User.query.get(auth_user.id)
-    if user:
-        user.token_balance += payoff
-        db.session.add(user)
+    new_balance = ledger.credit(auth_user.id, payoff, 'payoff', prediction)
 
+    user_stats.record(prediction, before)
+    bump_versions(*prediction_scopes(prediction.symbol, prediction.user_id))
     db.session.commit()
+    bump_shared_versions(*SHARED_PREDICTION_SCOPES)
+    metrics.SCORING_DURATION.labels('settle').observe(time.perf_counter() - settlement_started)
 
     # Different messages for close vs collect
     if is_completed:
@@ -1029,86 +1154,36 @@ def close_or_collect_prediction(prediction_id):
         'contrarianScore': prediction.contrarian_score,
         'progress': round(progress * 100, 1),
         'payoff': payoff,
-        'newBalance': user.token_balance if user else 0,
+        'newBalance': new_balance or 0,
         'message': message,
         'isEarlyClose': is_early_close
     })
 
 
-def calculate_time_weighted_mspe(predictions, half_life_days=30):
-    """
-    Calculate time-weighted MSPE where recent predictions have more weight.
-    Uses exponential decay with configurable half-life.
-
-    Weight = exp(-ln(2) * days_ago / half_life_days)
-
-    Time-weighted MSPE = Σ(weight_i * mspe_i) / Σ(weight_i)
-    """
-    now = datetime.utcnow()
-    decay_constant = math.log(2) / half_life_days
-
-    total_weighted_mspe = 0.0
-    total_weight = 0.0
-
-    for pred in predictions:
-        if pred.accuracy_score is None:
-            continue
-
-        days_ago = (now - pred.created_at).total_seconds() / 86400.0
-        weight = math.exp(-decay_constant * days_ago)
-
-        total_weighted_mspe += weight * pred.accuracy_score
-        total_weight += weight
-
-    if total_weight == 0:
-        return None
-
-    return total_weighted_mspe / total_weight
-
-
-@app.route('/api/leaderboard')
+@api.route('/api/leaderboard')
+@conditional(lambda: [LEADERBOARD_SCOPE])
 def get_leaderboard():
     """Get leaderboard of users ranked by overall MSPE across all predictions."""
     from sqlalchemy import func
-    from collections import defaultdict
 
-    # Get all users with predictions
-    user_ids = db.session.query(Prediction.user_id).filter(
+    # Totals come from each user's statistics row; only the MSPE needs predictions:
+    # average MSPE per day, then average across all days, in one grouped query
+    daily = db.session.query(
+        Prediction.user_id.label('user_id'),
+        func.avg(Prediction.accuracy_score).label('mspe'),
+    ).filter(
         Prediction.user_id.isnot(None),
         Prediction.accuracy_score.isnot(None)
-    ).distinct().all()
+    ).group_by(Prediction.user_id, func.date(Prediction.created_at)).subquery()
+    overall_mspes = dict(db.session.query(daily.c.user_id, func.avg(daily.c.mspe)).group_by(daily.c.user_id).all())
 
-    user_ids = [u[0] for u in user_ids]
+    rows = db.session.query(User, UserStats).join(UserStats, UserStats.user_id == User.id).filter(
+        UserStats.scored_predictions > 0
+    ).all()
 
     leaderboard = []
-    for user_id in user_ids:
-        user = User.query.get(user_id)
-        if not user:
-            continue
-
-        # Get all predictions with scores for this user
-        predictions = Prediction.query.filter(
-            Prediction.user_id == user_id,
-            Prediction.accuracy_score.isnot(None)
-        ).all()
-
-        if not predictions:
-            continue
-
-        # Group predictions by date and calculate daily average MSPE
-        daily_mspes = defaultdict(list)
-        for p in predictions:
-            date_key = p.created_at.date()
-            daily_mspes[date_key].append(p.accuracy_score)
-
-        # Average MSPE per day, then average across all days
-        daily_averages = [sum(scores) / len(scores) for scores in daily_mspes.values()]
-        overall_mspe = sum(daily_averages) / len(daily_averages) if daily_averages else None
-
-        # Calculate totals
-        total_staked = sum(p.staked_tokens for p in predictions)
-        total_rewards = sum(p.rewards_earned or 0 for p in predictions)
-        prediction_count = len(predictions)
+    for user, stats in rows:
+        overall_mspe = overall_mspes.get(user.id)
 
         display_name = f"{user.first_name or ''} {user.last_name or ''}".strip()
         if not display_name:
@@ -1118,11 +1193,11 @@ def get_leaderboard():
             'userId': user.id,
             'displayName': display_name,
             'mspe': round(float(overall_mspe), 6) if overall_mspe else None,
-            'predictionCount': prediction_count,
-            'totalStaked': total_staked or 0,
-            'totalRewards': total_rewards or 0,
+            'predictionCount': stats.scored_predictions,
+            'totalStaked': stats.scored_staked,
+            'totalRewards': stats.scored_rewards,
             'tokenBalance': user.token_balance,
-            'profitLoss': (total_rewards or 0) - (total_staked or 0)
+            'profitLoss': stats.scored_rewards - stats.scored_staked
         })
 
     # Sort by MSPE (lower is better), then by token balance
@@ -1138,56 +1213,30 @@ def get_leaderboard():
     })
 
 
-@app.route('/api/user/stats')
+@api.route('/api/user/stats')
 @require_login
+@conditional(lambda: [current_user_scope(), LEADERBOARD_SCOPE], ttl=300)
 def get_user_stats():
     """Get detailed statistics for the current user."""
-    from sqlalchemy import func
-
     auth_user = get_authenticated_user()
     user = User.query.get(auth_user.id)
     if not user:
         return jsonify({'error': 'User not found'}), 404
 
-    # Get prediction stats
-    predictions = Prediction.query.filter_by(user_id=auth_user.id).all()
-
-    active_predictions = [p for p in predictions if p.status == 'active']
-    completed_predictions = [p for p in predictions if p.status in ('completed', 'closed')]
-
-    # Calculate mean MSPE
-    mspe_values = [p.accuracy_score for p in predictions if p.accuracy_score is not None]
-    mean_mspe = sum(mspe_values) / len(mspe_values) if mspe_values else None
-
-    # Calculate time-weighted MSPE
-    tw_mspe = calculate_time_weighted_mspe(predictions)
-
-    # Calculate totals
-    total_staked = sum(p.staked_tokens for p in predictions)
-    total_rewards = sum(p.rewards_earned or 0 for p in predictions)
+    stats = user_stats.get(user.id)
+    mean_mspe = stats.mean_mspe
+    tw_mspe = stats.time_weighted_mspe
 
     # Get user's rank on leaderboard (using time-weighted MSPE)
-    all_user_ids = db.session.query(Prediction.user_id).filter(
-        Prediction.user_id.isnot(None),
-        Prediction.accuracy_score.isnot(None)
-    ).distinct().all()
-
-    user_tw_mspes = []
-    for (uid,) in all_user_ids:
-        user_preds = Prediction.query.filter(
-            Prediction.user_id == uid,
-            Prediction.accuracy_score.isnot(None)
-        ).all()
-        user_tw = calculate_time_weighted_mspe(user_preds)
-        if user_tw is not None:
-            user_tw_mspes.append((uid, user_tw))
-
-    sorted_users = sorted(user_tw_mspes, key=lambda x: x[1])
-    rank = next((i + 1 for i, (uid, _) in enumerate(sorted_users) if uid == auth_user.id), None)
+    rank, ranked_users = user_stats.rank(stats)
 
     # Build prediction history for chart
+    history = db.session.query(
+        Prediction.id, Prediction.symbol, Prediction.timeframe, Prediction.staked_tokens,
+        Prediction.rewards_earned, Prediction.accuracy_score, Prediction.status, Prediction.created_at
+    ).filter(Prediction.user_id == user.id).order_by(Prediction.created_at.asc()).all()
     prediction_history = []
-    for p in sorted(predictions, key=lambda x: x.created_at):
+    for p in history:
         prediction_history.append({
             'id': p.id,
             'symbol': p.symbol,
@@ -1209,23 +1258,24 @@ def get_user_stats():
             'createdAt': user.created_at.isoformat()
         },
         'stats': {
-            'totalPredictions': len(predictions),
-            'activePredictions': len(active_predictions),
-            'completedPredictions': len(completed_predictions),
+            'totalPredictions': stats.total_predictions,
+            'activePredictions': stats.active_predictions,
+            'completedPredictions': stats.completed_predictions,
             'meanMspe': round(mean_mspe, 6) if mean_mspe else None,
             'timeWeightedMspe': round(tw_mspe, 6) if tw_mspe else None,
-            'totalStaked': total_staked,
-            'totalRewards': total_rewards,
-            'profitLoss': total_rewards - total_staked,
+            'totalStaked': stats.total_staked,
+            'totalRewards': stats.total_rewards,
+            'profitLoss': stats.profit_loss,
             'rank': rank,
-            'totalRankedUsers': len(sorted_users)
+            'totalRankedUsers': ranked_users
         },
         'predictionHistory': prediction_history
     })
 
 
-@app.route('/api/user/predictions/detailed')
+@api.route('/api/user/predictions/detailed')
 @require_login
+@conditional(lambda: [current_user_scope()], ttl=60)
 def get_user_predictions_detailed():
     """Get detailed predictions for the current user with progress info."""
     auth_user = get_authenticated_user()
@@ -1281,14 +1331,14 @@ def get_user_predictions_detailed():
     return jsonify({'predictions': result})
 
 
-@app.route('/api/trades/top-profitable')
+@api.route('/api/trades/top-profitable')
 def get_top_profitable_trades():
     """Get the most profitable trades of all time."""
     limit = request.args.get('limit', 20, type=int)
 
     # Get completed predictions sorted by profit (rewards - staked)
     predictions = Prediction.query.filter(
-        Prediction.status.in_(['completed', 'closed']),
+        db.text(SETTLED_PREDICATE),  # Spelled like idx_predictions_profit's predicate so it can be used
         Prediction.rewards_earned.isnot(None),
         Prediction.user_id.isnot(None)
     ).order_by(
@@ -1327,9 +1377,13 @@ def get_top_profitable_trades():
     })
 
 
-@app.route('/api/trades/<int:prediction_id>/details')
+@api.route('/api/trades/<int:prediction_id>/details')
 def get_trade_details(prediction_id):
-    """Get detailed trade info including prediction series and actual price data for overlay."""
+    """
+    Get detailed trade info including prediction series and actual price data for overlay.
+
+    `max_points` downsamples the actual prices (LTTB on close) for the chart.
+    """
     prediction = Prediction.query.get(prediction_id)
     if not prediction:
         return jsonify({'error': 'Trade not found'}), 404
@@ -1382,19 +1436,22 @@ def get_trade_details(prediction_id):
     if now < end_time:
         end_time = now
 
-    price_data = PriceData.query.filter(
-        PriceData.symbol == prediction.symbol,
-        PriceData.interval == interval,
-        PriceData.timestamp >= prediction.created_at,
-        PriceData.timestamp <= end_time
-    ).order_by(PriceData.timestamp.asc()).all()
+    # Column arrays, from the memory-mapped archive when it covers the window
+    bars = bar_archive.load_bars(prediction.symbol, interval, since=prediction.created_at, until=end_time)
+    timestamps, closes = bars['timestamp'], bars['close']
+
+    max_points = request.args.get('max_points', type=int)
+    if max_points and len(closes) > max_points:
+        selected = select_indices(timestamps, closes, max_points)
+        timestamps, closes = timestamps[selected], closes[selected]
 
     actual_prices = [
         {
-            'timestamp': pd.timestamp.isoformat(),
-            'price': pd.close
+            'timestamp': timestamp,
+            'price': price
         }
-        for pd in price_data
+        for timestamp, price in zip(np.datetime_as_string(timestamps.astype('datetime64[s]')).tolist(),
+                                    closes.tolist())
     ]
 
     return jsonify({
@@ -1420,110 +1477,66 @@ def get_trade_details(prediction_id):
     })
 
 
-@app.route('/api/user/performance-history')
+# Downsampled performance history bodies, keyed by ETag (user version and query)
+performance_history_cache = BodyCache(maxsize=256)
+
+
+@api.route('/api/user/performance-history')
 @require_login
+@conditional(lambda: [current_user_scope()])
 def get_user_performance_history():
-    """Get historical performance data for the current user."""
-    auth_user = get_authenticated_user()
+    """
+    Get historical performance data for the current user.
 
-    # Get performance history records
-    history = UserPerformanceHistory.query.filter_by(
-        user_id=auth_user.id
-    ).order_by(UserPerformanceHistory.recorded_at.asc()).all()
+    Optional `since`/`until` (epoch seconds or ISO 8601) restrict the window.
+    At most performance_history.MAX_HISTORY_ROWS snapshots are read, newest
+    first; when older ones were left out, `nextUntil` is the `until` of the
+    next page. The result is downsampled to `max_points` (default 500).
+    """
+    max_points = request.args.get('max_points', performance_history.DEFAULT_MAX_POINTS, type=int)
+    max_points = min(max(max_points, 1), performance_history.MAX_POINTS)
+    try:
+        since = twelve_data.parse_timestamp(request.args.get('since'))
+        until = twelve_data.parse_timestamp(request.args.get('until'))
+    except ValueError:
+        return jsonify({'error': 'since/until must be epoch seconds or ISO 8601 timestamps'}), 400
+
+    body = performance_history_cache.get(g.get('etag'))
+    if body is not None:
+        return json_bytes_response(body)
 
-    return jsonify({
-        'history': [
-            {
-                'recordedAt': h.recorded_at.isoformat(),
-                'tokenBalance': h.token_balance,
-                'totalPredictions': h.total_predictions,
-                'completedPredictions': h.completed_predictions,
-                'meanMspe': h.mean_mspe,
-                'timeWeightedMspe': h.time_weighted_mspe,
-                'totalStaked': h.total_staked,
-                'totalRewards': h.total_rewards,
-                'profitLoss': h.profit_loss,
-                'rank': h.rank
-            }
-            for h in history
-        ]
+    auth_user = get_authenticated_user()
+    rows, has_more = performance_history.load_window(auth_user.id, since, until)
+    history = performance_history.downsample_history(rows, max_points)
+
+    body = dumps_bytes({
+        'history': [performance_history.to_dict(h) for h in history],
+        'count': len(history),
+        'originalCount': len(rows),
+        'hasMore': has_more,
+        'nextUntil': (rows[0].recorded_at - timedelta(microseconds=1)).isoformat() if has_more else None
     })
+    performance_history_cache.put(g.get('etag'), body)
+    return json_bytes_response(body)
 
 
-def record_user_performance_snapshot(user_id):
-    """Record a performance snapshot for a user."""
-    user = User.query.get(user_id)
-    if not user:
-        return None
-
-    predictions = Prediction.query.filter_by(user_id=user_id).all()
-    completed = [p for p in predictions if p.status in ('completed', 'closed')]
-
-    mspe_values = [p.accuracy_score for p in predictions if p.accuracy_score is not None]
-    mean_mspe = sum(mspe_values) / len(mspe_values) if mspe_values else None
-    tw_mspe = calculate_time_weighted_mspe(predictions)
-
-    total_staked = sum(p.staked_tokens for p in predictions)
-    total_rewards = sum(p.rewards_earned or 0 for p in predictions)
-
-    # Calculate rank
-    all_user_ids = db.session.query(Prediction.user_id).filter(
-        Prediction.user_id.isnot(None),
-        Prediction.accuracy_score.isnot(None)
-    ).distinct().all()
-
-    user_tw_mspes = []
-    for (uid,) in all_user_ids:
-        user_preds = Prediction.query.filter(
-            Prediction.user_id == uid,
-            Prediction.accuracy_score.isnot(None)
-        ).all()
-        user_tw = calculate_time_weighted_mspe(user_preds)
-        if user_tw is not None:
-            user_tw_mspes.append((uid, user_tw))
-
-    sorted_users = sorted(user_tw_mspes, key=lambda x: x[1])
-    rank = next((i + 1 for i, (uid, _) in enumerate(sorted_users) if uid == user_id), None)
-
-    snapshot = UserPerformanceHistory(
-        user_id=user_id,
-        token_balance=user.token_balance,
-        total_predictions=len(predictions),
-        completed_predictions=len(completed),
-        mean_mspe=mean_mspe,
-        time_weighted_mspe=tw_mspe,
-        total_staked=total_staked,
-        total_rewards=total_rewards,
-        profit_loss=total_rewards - total_staked,
-        rank=rank
-    )
-
-    db.session.add(snapshot)
-    db.session.commit()
-    return snapshot
-
-
-@app.route('/api/admin/record-snapshots', methods=['POST'])
+@api.route('/api/admin/record-snapshots', methods=['POST'])
+@request_budget(queries=10000, latency_ms=300000)  # Bulk work; compaction commits per user
 def record_all_performance_snapshots():
     """Record performance snapshots for all users. Can be called by a cron job."""
-    # Get all users with predictions
-    user_ids = db.session.query(Prediction.user_id).filter(
-        Prediction.user_id.isnot(None)
-    ).distinct().all()
+    recorded = performance_history.record_snapshots()
 
-    recorded = 0
-    for (user_id,) in user_ids:
-        snapshot = record_user_performance_snapshot(user_id)
-        if snapshot:
-            recorded += 1
+    # Older snapshots are thinned out to daily and weekly ones as they age
+    compaction = performance_history.compact()
 
     return jsonify({
         'success': True,
-        'snapshotsRecorded': recorded
+        'snapshotsRecorded': recorded,
+        'snapshotsCompacted': compaction['rowsDeleted']
     })
 
 
-@app.route('/api/user/settings', methods=['GET'])
+@api.route('/api/user/settings', methods=['GET'])
 @require_login
 def get_user_settings():
     """Get current user settings."""
@@ -1544,7 +1557,7 @@ def get_user_settings():
     })
 
 
-@app.route('/api/user/settings', methods=['PUT'])
+@api.route('/api/user/settings', methods=['PUT'])
 @require_login
 def update_user_settings():
     """Update user settings (timezone, language)."""
@@ -1578,7 +1591,18 @@ def update_user_settings():
     })
 
 
-@app.route('/api/admin/reset-balances', methods=['POST'])
+def parse_chunk_size(data):
+    """The request's chunkSize (default DEFAULT_CHUNK_SIZE), or None unless it is an integer in range."""
+    value = data.get('chunkSize', DEFAULT_CHUNK_SIZE)
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if not isinstance(value, int) or isinstance(value, bool):
+        return None
+    return value if 1 <= value <= MAX_CHUNK_SIZE else None
+
+
+@api.route('/api/admin/reset-balances', methods=['POST'])
+@request_budget(queries=10000, latency_ms=300000)  # Chunked bulk work
 def reset_all_user_balances():
     """Reset all user token balances to default (100). Admin endpoint."""
     data = request.get_json() or {}
@@ -1588,14 +1612,11 @@ def reset_all_user_balances():
     if admin_key != expected_key:
         return jsonify({'error': 'Unauthorized'}), 403
 
-    users = User.query.all()
-    reset_count = 0
-
-    for user in users:
-        user.token_balance = DEFAULT_TOKEN_BALANCE
-        reset_count += 1
+    chunk_size = parse_chunk_size(data)
+    if chunk_size is None:
+        return jsonify({'error': f'chunkSize must be an integer from 1 to {MAX_CHUNK_SIZE}'}), 400
 
-    db.session.commit()
+    reset_count = admin_ops.reset_balances(chunk_size=chunk_size, on_progress=admin_ops.log_progress)
 
     logging.info(f"Admin action: Reset {reset_count} user balances to {DEFAULT_TOKEN_BALANCE}")
 
@@ -1606,7 +1627,8 @@ def reset_all_user_balances():
     })
 
 
-@app.route('/api/admin/wipe-all-data', methods=['POST'])
+@api.route('/api/admin/wipe-all-data', methods=['POST'])
+@request_budget(queries=10000, latency_ms=300000)  # Chunked bulk work
 def wipe_all_data():
     """Delete all users, predictions, and related data. Nuclear option."""
     data = request.get_json() or {}
@@ -1616,31 +1638,204 @@ def wipe_all_data():
     if admin_key != expected_key:
         return jsonify({'error': 'Unauthorized'}), 403
 
-    # Delete in order to respect foreign keys
-    predictions_deleted = Prediction.query.delete()
-    meta_deleted = MetaPrediction.query.delete()
-    history_deleted = UserPerformanceHistory.query.delete()
-    users_deleted = User.query.delete()
+    chunk_size = parse_chunk_size(data)
+    if chunk_size is None:
+        return jsonify({'error': f'chunkSize must be an integer from 1 to {MAX_CHUNK_SIZE}'}), 400
 
-    db.session.commit()
+    deleted = admin_ops.wipe_all(chunk_size=chunk_size, on_progress=admin_ops.log_progress)
 
-    logging.info(f"Admin action: WIPED ALL DATA - {users_deleted} users, {predictions_deleted} predictions")
+    logging.info(f"Admin action: WIPED ALL DATA - {deleted['users']} users, {deleted['predictions']} predictions")
 
     return jsonify({
         'success': True,
         'message': 'All data wiped',
-        'deleted': {
-            'users': users_deleted,
-            'predictions': predictions_deleted,
-            'metaPredictions': meta_deleted,
-            'performanceHistory': history_deleted
-        }
+        'deleted': deleted
+    })
+
+
+@api.route('/api/admin/cleanup-price-data', methods=['POST'])
+@request_budget(queries=10000, latency_ms=300000)  # Chunked bulk work
+def cleanup_price_data():
+    """Apply tiered retention to cached price data. Can be called by a cron job."""
+    data = request.get_json() or {}
+    admin_key = data.get('adminKey')
+
+    expected_key = os.environ.get('ADMIN_SECRET_KEY', 'admin-reset-key-2024')
+    if admin_key != expected_key:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    chunk_size = parse_chunk_size(data)
+    if chunk_size is None:
+        return jsonify({'error': f'chunkSize must be an integer from 1 to {MAX_CHUNK_SIZE}'}), 400
+
+    report = twelve_data.cleanup_old_data(chunk_size=chunk_size)
+    if report.get('error'):
+        return jsonify(report), 500
+
+    logging.info(f"Admin action: price retention deleted {report['rowsDeleted']} rows")
+
+    return jsonify({
+        'success': True,
+        **report
+    })
+
+
+@api.route('/api/admin/export-parquet', methods=['POST'])
+@request_budget(queries=10000, latency_ms=300000)  # Chunked bulk work
+def export_parquet():
+    """Export price data and predictions as a tar of partitioned Parquet files."""
+    data = request.get_json() or {}
+    admin_key = data.get('adminKey')
+
+    expected_key = os.environ.get('ADMIN_SECRET_KEY', 'admin-reset-key-2024')
+    if admin_key != expected_key:
+        return jsonify({'error': 'Unauthorized'}), 403
+    try:
+        bulk_io.require_pyarrow()
+    except RuntimeError:
+        return jsonify({'error': 'pyarrow is not installed'}), 501
+
+    tables = data.get('tables') or list(bulk_io.TABLES)
+    if any(table not in bulk_io.TABLES for table in tables):
+        return jsonify({'error': f'tables must be among {list(bulk_io.TABLES)}'}), 400
+    try:
+        since = twelve_data.parse_timestamp(data.get('since'))
+        until = twelve_data.parse_timestamp(data.get('until'))
+    except ValueError:
+        return jsonify({'error': 'since/until must be epoch seconds or ISO 8601 timestamps'}), 400
+
+    directory = tempfile.mkdtemp(prefix='parquet-export-')
+    try:
+        report = bulk_io.export_dataset(directory, tables, symbols=data.get('symbols'),
+                                        intervals=data.get('intervals'), since=since, until=until)
+    except Exception:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    db.session.close()
+
+    logging.info(f"Admin action: Parquet export {report}")
+
+    def generate():
+        try:
+            yield from bulk_io.iter_tar(directory)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    response = Response(generate(), mimetype='application/x-tar')
+    response.headers['Content-Disposition'] = f'attachment; filename="draw-trade-{datetime.utcnow():%Y%m%d%H%M%S}.tar"'
+    return response
+
+
+@api.route('/api/admin/import-parquet', methods=['POST'])
+@request_budget(queries=10000, latency_ms=300000)  # Chunked bulk work
+def import_parquet():
+    """Import a tar of partitioned Parquet files produced by export-parquet (multipart field `file`)."""
+    admin_key = request.form.get('adminKey')
+
+    expected_key = os.environ.get('ADMIN_SECRET_KEY', 'admin-reset-key-2024')
+    if admin_key != expected_key:
+        return jsonify({'error': 'Unauthorized'}), 403
+    try:
+        bulk_io.require_pyarrow()
+    except RuntimeError:
+        return jsonify({'error': 'pyarrow is not installed'}), 501
+
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({'error': 'file is required'}), 400
+    tables = request.form.getlist('tables') or list(bulk_io.TABLES)
+    if any(table not in bulk_io.TABLES for table in tables):
+        return jsonify({'error': f'tables must be among {list(bulk_io.TABLES)}'}), 400
+    overwrite = request.form.get('overwrite', 'false').lower() == 'true'
+
+    directory = tempfile.mkdtemp(prefix='parquet-import-')
+    try:
+        bulk_io.extract_tar(upload.stream, directory)
+        report = bulk_io.import_dataset(directory, tables, overwrite=overwrite)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    logging.info(f"Admin action: Parquet import {report}")
+
+    return jsonify({
+        'success': True,
+        'imported': report
+    })
+
+
+@api.route('/api/admin/profiling', methods=['POST'])
+def arm_profiling():
+    """Profile the next `count` requests under path `prefix` within `minutes`, or disarm with enabled=false."""
+    data = request.get_json() or {}
+    admin_key = data.get('adminKey')
+
+    expected_key = os.environ.get('ADMIN_SECRET_KEY', 'admin-reset-key-2024')
+    if admin_key != expected_key:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    if data.get('enabled') is False:
+        profiling.armed.disarm()
+        logging.info("Admin action: Profiling disarmed")
+        return jsonify({'success': True, 'armed': None})
+
+    prefix = data.get('prefix')
+    if not prefix or not prefix.startswith('/'):
+        return jsonify({'error': 'prefix must be a path such as /api/user/stats'}), 400
+    try:
+        count = min(max(int(data.get('count', 10)), 1), 100)
+        minutes = min(max(float(data.get('minutes', 10)), 0.1), 60)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'count and minutes must be numbers'}), 400
+
+    rule = profiling.armed.arm(prefix, count, minutes)
+    logging.info(f"Admin action: Profiling armed for {count} requests under {prefix}")
+    return jsonify({'success': True, 'armed': rule})
+
+
+@api.route('/api/admin/profiles', methods=['POST'])
+def list_profiles():
+    """Captured profiles, newest first, and the armed rule."""
+    data = request.get_json() or {}
+    admin_key = data.get('adminKey')
+
+    expected_key = os.environ.get('ADMIN_SECRET_KEY', 'admin-reset-key-2024')
+    if admin_key != expected_key:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    return jsonify({
+        'profiles': profiling.store.list(),
+        'armed': profiling.armed.current(),
     })
 
 
-@app.route('/api/health')
+@api.route('/api/admin/profiles/<profile_id>', methods=['POST'])
+def download_profile(profile_id):
+    """One profile as folded stacks, ready for flamegraph.pl or speedscope."""
+    data = request.get_json() or {}
+    admin_key = data.get('adminKey')
+
+    expected_key = os.environ.get('ADMIN_SECRET_KEY', 'admin-reset-key-2024')
+    if admin_key != expected_key:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    path = profiling.store.folded_path(profile_id)
+    if path is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    with open(path, 'rb') as f:
+        body = f.read()
+    response = Response(body, mimetype='text/plain')
+    response.headers['Content-Disposition'] = f'attachment; filename="{profile_id}.folded"'
+    return response
+
+
+@api.route('/api/health')
 def health():
     return jsonify({'status': 'ok'})
 
+app = create_app()
+
 if __name__ == '__main__':
+    # Local development migrates itself; deploys run `flask init-db`
+    with app.app_context():
+        init_db()
     app.run(host='0.0.0.0', port=8000, debug=True)
@@ -0,0 +1,357 @@
+"""
+Offline replay of prediction scoring and settlement.
+
+Re-runs the life of every stored prediction against cached price bars, in
+created_at order per symbol: the contrarian score against the meta-prediction
+as it stood at submission, the meta-prediction update, the MSPE at the end of
+the timeframe and the payout under one or more payoff rules. It uses the same
+functions as the API (scoring.py), so a change to a payoff or scoring rule can
+be measured on real history before it is deployed.
+
+Runs entirely locally against a SQLite copy of the database, one process per
+symbol. Settlement is vectorized per symbol: settle prices come from a binary
+search over the bars and MSPE is computed for all predictions of a length at
+once. The meta-prediction update is inherently sequential and stays a loop.
+
+To get a SQLite copy of production:
+
+    flask export-parquet /tmp/export --table price_data --table predictions
+    DATABASE_URL=sqlite:////tmp/copy.db flask import-parquet /tmp/export
+
+Usage:
+
+    python backtest.py /tmp/copy.db --workers 8
+    python backtest.py /tmp/copy.db --rule candidate=my_rules:payoff --json report.json
+
+A rule is any callable (staked_tokens, mspe, contrarian_score, n_points) -> tokens,
+like scoring.calculate_new_payoff.
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from market_hours import EASTERN, is_crypto
+from scoring import (TIMEFRAME_DURATIONS, calculate_mspe_batch, calculate_new_payoff, calculate_payoff,
+                     contrarian_score_prices, merge_meta_prices)
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # pragma: no cover - optional dependency
+    _loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+# Settle against the finest cached interval available for a symbol
+SETTLEMENT_INTERVALS = ('1min', '5min', '15min', '30min', '1h', '4h', '1day')
+
+TIMEFRAMES = list(TIMEFRAME_DURATIONS)
+DEFAULT_DURATION = TIMEFRAME_DURATIONS['daily']
+
+PERCENTILES = (10, 50, 90, 99)
+
+
+def collect_rule(staked_tokens: int, mspe: float, contrarian_score: float, n_points: int) -> int:
+    """Payout of /api/predictions/<id>/close at completion."""
+    return calculate_new_payoff(staked_tokens, mspe, contrarian_score, n_points)
+
+
+def score_rule(staked_tokens: int, mspe: float, contrarian_score: float, n_points: int) -> int:
+    """Payout of /api/predictions/<id>/score at completion (stake * N / MSPE)."""
+    return calculate_payoff(staked_tokens, n_points, mspe)
+
+
+BUILTIN_RULES = {
+    'collect': 'backtest:collect_rule',
+    'score': 'backtest:score_rule',
+}
+
+
+def resolve_rule(spec: str) -> Callable[[int, float, float, int], int]:
+    """Import a 'module:function' payoff rule."""
+    module_name, _, function_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def parse_rules(specs: List[str]) -> Dict[str, str]:
+    """Rule names to import paths from 'name' (built-in) or 'name=module:function' arguments."""
+    rules = {}
+    for spec in specs:
+        name, _, path = spec.partition('=')
+        if not path:
+            if name not in BUILTIN_RULES:
+                raise ValueError(f"Unknown rule {name!r}; built-ins are {sorted(BUILTIN_RULES)}")
+            path = BUILTIN_RULES[name]
+        rules[name] = path
+    return rules
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Read-only connection, so a replay can never touch the copy it reads."""
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+
+def to_datetime64(values: List[str]) -> np.ndarray:
+    """SQLite datetime strings (as SQLAlchemy writes them) to datetime64[us]."""
+    return pd.to_datetime(pd.Series(values), format='ISO8601').to_numpy(dtype='datetime64[us]')
+
+
+def load_bars(conn: sqlite3.Connection, symbol: str):
+    """(interval, UTC timestamps, closes) of the finest cached interval for `symbol`."""
+    available = {row[0] for row in conn.execute(
+        "SELECT DISTINCT interval FROM price_data WHERE symbol = ?", (symbol,))}
+    for interval in SETTLEMENT_INTERVALS:
+        if interval in available:
+            break
+    else:
+        return None, np.empty(0, dtype='datetime64[us]'), np.empty(0)
+
+    rows = conn.execute(
+        "SELECT timestamp, close FROM price_data WHERE symbol = ? AND interval = ? ORDER BY timestamp",
+        (symbol, interval),
+    ).fetchall()
+    timestamps = pd.to_datetime(pd.Series([row[0] for row in rows]), format='ISO8601')
+    if not is_crypto(symbol):
+        # Stock bars are stored in exchange time; predictions in UTC
+        timestamps = timestamps.dt.tz_localize(EASTERN, ambiguous='NaT', nonexistent='NaT').dt.tz_convert('UTC')
+        timestamps = timestamps.dt.tz_localize(None)
+    closes = np.array([row[1] for row in rows], dtype=np.float64)
+    valid = timestamps.notna().to_numpy()
+    return interval, timestamps.to_numpy(dtype='datetime64[us]')[valid], closes[valid]
+
+
+def replay_symbol(db_path: str, symbol: str, rules: Dict[str, str]) -> Dict[str, Any]:
+    """Replay every prediction of one symbol. Runs in a worker process."""
+    started = time.perf_counter()
+    rule_functions = {name: resolve_rule(path) for name, path in rules.items()}
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT id, timeframe, created_at, price_series, staked_tokens, status, rewards_earned, contrarian_score "
+            "FROM predictions WHERE symbol = ? ORDER BY created_at, id",
+            (symbol,),
+        ).fetchall()
+        interval, bar_times, bar_closes = load_bars(conn, symbol)
+    finally:
+        conn.close()
+
+    n = len(rows)
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    timeframes = [row[1] for row in rows]
+    created = to_datetime64([row[2] for row in rows])
+    stakes = np.array([row[4] or 0 for row in rows], dtype=np.int64)
+    statuses = [row[5] for row in rows]
+    recorded_rewards = np.array([row[6] or 0 for row in rows], dtype=np.int64)
+    recorded_contrarian = np.array([np.nan if row[7] is None else row[7] for row in rows], dtype=np.float64)
+    series = [np.array([point['price'] for point in _loads(row[3])], dtype=np.float64) for row in rows]
+
+    # Submission: contrarian score against the meta-prediction as it stood, then fold the prediction in
+    contrarian = np.empty(n, dtype=np.float64)
+    meta = np.empty(0, dtype=np.float64)
+    count = 0
+    for i, prices in enumerate(series):
+        contrarian[i] = contrarian_score_prices(prices, meta) if count and len(prices) else 0.5
+        meta = prices.copy() if count == 0 else merge_meta_prices(meta, count, prices)
+        count += 1
+
+    # Settlement: close of the last bar at or before the end of each timeframe
+    durations = np.array([TIMEFRAME_DURATIONS.get(tf, DEFAULT_DURATION) for tf in timeframes],
+                         dtype='timedelta64[us]')
+    ends = created + durations
+    settled = np.zeros(n, dtype=bool)
+    settle_prices = np.full(n, np.nan)
+    if len(bar_times):
+        positions = np.searchsorted(bar_times, ends, side='right') - 1
+        settled = (positions >= 0) & (ends <= bar_times[-1])
+        settle_prices[settled] = bar_closes[positions[settled]]
+
+    lengths = np.array([len(prices) for prices in series], dtype=np.int64)
+    mspe = np.full(n, np.nan)
+    for length in np.unique(lengths[settled]):
+        group = np.flatnonzero(settled & (lengths == length))
+        if length == 0:
+            continue
+        matrix = np.vstack([series[i] for i in group])
+        mspe[group] = calculate_mspe_batch(matrix, settle_prices[group])
+
+    payouts = {}
+    for name, rule in rule_functions.items():
+        payout = np.zeros(n, dtype=np.int64)
+        for i in np.flatnonzero(settled):
+            payout[i] = rule(int(stakes[i]), float(mspe[i]), float(contrarian[i]), int(lengths[i]))
+        payouts[name] = payout
+
+    return {
+        'symbol': symbol,
+        'interval': interval,
+        'ids': ids,
+        'timeframes': np.array(timeframes, dtype=object),
+        'stakes': stakes,
+        'settled': settled,
+        'mspe': mspe,
+        'contrarian': contrarian,
+        'recordedContrarian': recorded_contrarian,
+        'recordedRewards': recorded_rewards,
+        'recordedPaid': np.isin(np.array(statuses, dtype=object), ['completed', 'closed']),
+        'payouts': payouts,
+        'seconds': time.perf_counter() - started,
+    }
+
+
+def payout_stats(stakes: np.ndarray, payouts: np.ndarray) -> Dict[str, Any]:
+    """Distribution of payouts relative to stake, and the tokens they mint."""
+    staked = int(stakes.sum())
+    paid = int(payouts.sum())
+    stats = {
+        'count': int(len(stakes)),
+        'totalStaked': staked,
+        'totalPaid': paid,
+        'netMinted': paid - staked,
+        'inflation': round(paid / staked - 1, 4) if staked else None,
+        'zeroPayouts': int((payouts == 0).sum()),
+    }
+    if len(stakes):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            multiples = np.where(stakes > 0, payouts / stakes, 0.0)
+        stats['payoutMultiple'] = {
+            **{f"p{p}": round(float(np.percentile(multiples, p)), 4) for p in PERCENTILES},
+            'mean': round(float(multiples.mean()), 4),
+            'max': round(float(multiples.max()), 4),
+        }
+    return stats
+
+
+def summarize(results: List[Dict[str, Any]], rules: Dict[str, str], seconds: float) -> Dict[str, Any]:
+    """Combine per-symbol replays into one report."""
+    def column(name):
+        arrays = [result[name] for result in results]
+        return np.concatenate(arrays) if arrays else np.empty(0)
+
+    settled = column('settled').astype(bool)
+    stakes = column('stakes')
+    timeframes = column('timeframes')
+    n = len(stakes)
+
+    contrarian_drift = np.abs(column('contrarian') - column('recordedContrarian'))
+    contrarian_drift = contrarian_drift[~np.isnan(contrarian_drift)]
+
+    report = {
+        'predictions': n,
+        'settled': int(settled.sum()),
+        'unsettled': int(n - settled.sum()),
+        'symbols': len(results),
+        'runtimeSeconds': round(seconds, 3),
+        'secondsPerMillionPredictions': round(seconds / n * 1_000_000, 1) if n else None,
+        'contrarianDrift': {
+            'max': round(float(contrarian_drift.max()), 4) if len(contrarian_drift) else None,
+            'mean': round(float(contrarian_drift.mean()), 6) if len(contrarian_drift) else None,
+        },
+        'rules': {},
+    }
+
+    for name in rules:
+        payouts = np.concatenate([result['payouts'][name] for result in results]) if results else np.empty(0)
+        stats = payout_stats(stakes[settled], payouts[settled])
+        stats['byTimeframe'] = {
+            timeframe: payout_stats(stakes[settled & (timeframes == timeframe)],
+                                    payouts[settled & (timeframes == timeframe)])
+            for timeframe in TIMEFRAMES if (settled & (timeframes == timeframe)).any()
+        }
+        report['rules'][name] = stats
+
+    # What was actually paid out for the same settled predictions, for comparison
+    recorded = settled & column('recordedPaid').astype(bool)
+    report['recorded'] = payout_stats(stakes[recorded], column('recordedRewards')[recorded])
+    return report
+
+
+def run(db_path: str, rules: Optional[Dict[str, str]] = None, symbols: Optional[List[str]] = None,
+        workers: Optional[int] = None) -> Dict[str, Any]:
+    """Replay every symbol in `db_path` (largest first, one process each) and return the report."""
+    rules = rules or parse_rules(list(BUILTIN_RULES))
+    conn = connect(db_path)
+    try:
+        counts = conn.execute(
+            "SELECT symbol, COUNT(*) FROM predictions GROUP BY symbol ORDER BY COUNT(*) DESC").fetchall()
+    finally:
+        conn.close()
+    targets = [symbol for symbol, _ in counts if not symbols or symbol in symbols]
+
+    started = time.perf_counter()
+    if workers == 1:
+        results = [replay_symbol(db_path, symbol, rules) for symbol in targets]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(replay_symbol, [db_path] * len(targets), targets, [rules] * len(targets)))
+    seconds = time.perf_counter() - started
+
+    report = summarize(results, rules, seconds)
+    report['perSymbol'] = {
+        result['symbol']: {
+            'predictions': int(len(result['ids'])),
+            'settled': int(result['settled'].sum()),
+            'interval': result['interval'],
+            'seconds': round(result['seconds'], 3),
+        }
+        for result in results
+    }
+    return report
+
+
+def snapshot(db_path: str) -> str:
+    """Consistent copy of a (possibly live) SQLite database in a temporary directory."""
+    directory = tempfile.mkdtemp(prefix='backtest-')
+    copy_path = os.path.join(directory, os.path.basename(db_path))
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(copy_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    return copy_path
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Replay prediction scoring and payouts over a SQLite copy.')
+    parser.add_argument('database', help='Path to a SQLite database file')
+    parser.add_argument('--rule', action='append', default=[],
+                        help="Payoff rule: 'collect', 'score', or name=module:function (repeatable)")
+    parser.add_argument('--symbol', action='append', default=[], help='Only replay these symbols')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('--snapshot', action='store_true', help='Copy the database first (for a live file)')
+    parser.add_argument('--json', help='Also write the full report to this file')
+    args = parser.parse_args(argv)
+
+    db_path = snapshot(args.database) if args.snapshot else args.database
+    try:
+        report = run(db_path, parse_rules(args.rule or list(BUILTIN_RULES)), args.symbol, args.workers)
+    finally:
+        if args.snapshot:
+            shutil.rmtree(os.path.dirname(db_path), ignore_errors=True)
+
+    print(f"{report['predictions']} predictions over {report['symbols']} symbols, {report['settled']} settled, "
+          f"{report['runtimeSeconds']}s ({report['secondsPerMillionPredictions']}s per million)")
+    for name, stats in list(report['rules'].items()) + [('recorded', report['recorded'])]:
+        multiple = stats.get('payoutMultiple', {})
+        print(f"  {name:>10}: staked {stats['totalStaked']}, paid {stats['totalPaid']}, "
+              f"inflation {stats['inflation']}, payout/stake p50 {multiple.get('p50')} p99 {multiple.get('p99')}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,336 @@
+"""
+Memory-mapped columnar archive of price bars.
+
+Reading long spans of PriceData through SQL builds one Python row per bar.
+The archive keeps a copy of each (symbol, interval) series as fixed-width
+column files under BAR_ARCHIVE_DIR:
+
+    <root>/<symbol>/<interval>/timestamp.i8   int64 epoch seconds
+                               open.f8 high.f8 low.f8 close.f8   float64
+                               volume.i8      int64
+
+Files are opened with numpy.memmap, range reads binary-search the timestamp
+column and return zero-copy slices. Bars are only appended in time order;
+a bar whose timestamp is already archived is overwritten in place, so the
+still-forming last bar can be revised. SQL stays the source of truth: the
+archive is synced from committed PriceData and readers fall back to SQL for
+ranges it does not cover, and for the whole series once bars arrive inside or
+before its span, until the next sync rewrites it. It is disabled unless
+BAR_ARCHIVE_DIR is set.
+"""
+
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from db import db
+from models import PriceData, PriceSeriesMeta
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+BAR_ARCHIVE_DIR = os.environ.get('BAR_ARCHIVE_DIR')
+
+COLUMNS = {
+    'timestamp': np.int64,
+    'open': np.float64,
+    'high': np.float64,
+    'low': np.float64,
+    'close': np.float64,
+    'volume': np.int64,
+}
+EXTENSIONS = {np.int64: 'i8', np.float64: 'f8'}
+ITEM_SIZE = 8
+
+# Written last, so a bar exists only once its timestamp is on disk
+COMMIT_COLUMN = 'timestamp'
+VALUE_COLUMNS = [name for name in COLUMNS if name != COMMIT_COLUMN]
+
+SAFE_NAME = re.compile(r'[^A-Za-z0-9._-]')
+
+
+def empty_bars() -> Dict[str, np.ndarray]:
+    return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+
+
+class BarArchive:
+    """Append-only memory-mapped bar files for every (symbol, interval) under `root`."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._maps: Dict[Tuple[str, str], Tuple[Tuple[int, int], Dict[str, np.memmap]]] = {}
+        self._lock = threading.Lock()
+
+    def series_dir(self, symbol: str, interval: str) -> str:
+        return os.path.join(self.root, SAFE_NAME.sub('_', symbol), SAFE_NAME.sub('_', interval))
+
+    def column_path(self, symbol: str, interval: str, name: str) -> str:
+        return os.path.join(self.series_dir(symbol, interval), f"{name}.{EXTENSIONS[COLUMNS[name]]}")
+
+    def length(self, symbol: str, interval: str) -> int:
+        """Number of complete bars archived for the series."""
+        try:
+            return os.path.getsize(self.column_path(symbol, interval, COMMIT_COLUMN)) // ITEM_SIZE
+        except FileNotFoundError:
+            return 0
+
+    def _columns(self, symbol: str, interval: str) -> Optional[Dict[str, np.memmap]]:
+        """Read-only maps of all columns, reopened when the series has grown or was rewritten."""
+        try:
+            stat = os.stat(self.column_path(symbol, interval, COMMIT_COLUMN))
+        except FileNotFoundError:
+            return None
+        n = stat.st_size // ITEM_SIZE
+        if n == 0:
+            return None
+        key = (symbol, interval)
+        version = (n, stat.st_ino)
+        with self._lock:
+            cached = self._maps.get(key)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            columns = {
+                name: np.memmap(self.column_path(symbol, interval, name), dtype=dtype, mode='r', shape=(n,))
+                for name, dtype in COLUMNS.items()
+            }
+            self._maps[key] = (version, columns)
+            return columns
+
+    def bounds(self, symbol: str, interval: str) -> Optional[Tuple[int, int]]:
+        """First and last archived epoch, or None if the series is empty."""
+        columns = self._columns(symbol, interval)
+        if columns is None:
+            return None
+        timestamps = columns['timestamp']
+        return int(timestamps[0]), int(timestamps[-1])
+
+    def read(self, symbol: str, interval: str, since: Optional[int] = None, until: Optional[int] = None,
+             limit: Optional[int] = None, before: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """
+        Bars with since <= timestamp <= until and timestamp < before (epoch
+        seconds), the latest `limit` of them.
+
+        Returned arrays are views into the mapped files; copy them before
+        holding on to them across writes.
+        """
+        columns = self._columns(symbol, interval)
+        if columns is None:
+            return empty_bars()
+        timestamps = columns['timestamp']
+        lo = 0 if since is None else int(np.searchsorted(timestamps, since, side='left'))
+        hi = len(timestamps) if until is None else int(np.searchsorted(timestamps, until, side='right'))
+        if before is not None:
+            hi = min(hi, int(np.searchsorted(timestamps, before, side='left')))
+        if limit is not None:
+            lo = max(lo, hi - limit)
+        return {name: column[lo:hi] for name, column in columns.items()}
+
+    @contextmanager
+    def _write_lock(self, symbol: str, interval: str):
+        directory = self.series_dir(symbol, interval)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, '.lock'), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def write(self, symbol: str, interval: str, bars: Dict[str, np.ndarray]) -> Tuple[int, int]:
+        """
+        Merge time-sorted `bars` into the series.
+
+        Bars at an archived timestamp are overwritten in place, bars after the
+        last one are appended, and anything else (gaps in older history) is
+        skipped. Returns (updated, appended).
+        """
+        timestamps = np.asarray(bars['timestamp'], dtype=np.int64)
+        if not len(timestamps):
+            return 0, 0
+
+        with self._write_lock(symbol, interval):
+            n = self.length(symbol, interval)
+            updated = 0
+            if n:
+                existing = np.memmap(self.column_path(symbol, interval, COMMIT_COLUMN), dtype=np.int64,
+                                     mode='r', shape=(n,))
+                last = int(existing[-1])
+                old = timestamps <= last
+                positions = np.searchsorted(existing, timestamps[old])
+                positions = np.minimum(positions, n - 1)
+                matches = existing[positions] == timestamps[old]
+                if matches.any():
+                    targets = positions[matches]
+                    source_index = np.flatnonzero(old)[matches]
+                    for name in VALUE_COLUMNS:
+                        column = np.memmap(self.column_path(symbol, interval, name), dtype=COLUMNS[name],
+                                           mode='r+', shape=(n,))
+                        column[targets] = np.asarray(bars[name], dtype=COLUMNS[name])[source_index]
+                        column.flush()
+                    updated = len(targets)
+                del existing
+                new = ~old
+            else:
+                new = np.ones(len(timestamps), dtype=bool)
+
+            appended = int(new.sum())
+            if appended:
+                offset = n * ITEM_SIZE
+                # Values first, timestamps last; truncating to `offset` drops any torn earlier append
+                for name in VALUE_COLUMNS + [COMMIT_COLUMN]:
+                    values = np.asarray(bars[name], dtype=COLUMNS[name])[new]
+                    path = self.column_path(symbol, interval, name)
+                    with open(path, 'r+b' if os.path.exists(path) else 'w+b') as f:
+                        f.truncate(offset)
+                        f.seek(offset)
+                        f.write(np.ascontiguousarray(values).tobytes())
+        return updated, appended
+
+    def clear(self, symbol: str, interval: str):
+        """Remove the series from the archive."""
+        with self._write_lock(symbol, interval):
+            for name in COLUMNS:
+                try:
+                    os.remove(self.column_path(symbol, interval, name))
+                except FileNotFoundError:
+                    pass
+        with self._lock:
+            self._maps.pop((symbol, interval), None)
+
+
+_archive: Optional[BarArchive] = None
+
+
+def get_archive() -> Optional[BarArchive]:
+    """The configured archive, or None when BAR_ARCHIVE_DIR is not set."""
+    global _archive
+    if _archive is None and BAR_ARCHIVE_DIR:
+        _archive = BarArchive(BAR_ARCHIVE_DIR)
+        logger.info(f"Bar archive enabled at {BAR_ARCHIVE_DIR}")
+    return _archive
+
+
+def to_epoch_seconds(timestamp: datetime) -> int:
+    """Naive stored timestamp as epoch seconds, the archive's time axis."""
+    return int(np.datetime64(timestamp, 's').astype(np.int64))
+
+
+def query_bars(symbol: str, interval: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+               limit: Optional[int] = None, before: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+    """Bars from PriceData as column arrays, in time order (latest `limit` when given)."""
+    query = db.session.query(
+        PriceData.timestamp, PriceData.open, PriceData.high, PriceData.low, PriceData.close, PriceData.volume,
+    ).filter(PriceData.symbol == symbol, PriceData.interval == interval)
+    if since is not None:
+        query = query.filter(PriceData.timestamp >= since)
+    if until is not None:
+        query = query.filter(PriceData.timestamp <= until)
+    if before is not None:
+        query = query.filter(PriceData.timestamp < before)
+    if limit is not None:
+        rows = query.order_by(PriceData.timestamp.desc()).limit(limit).all()
+        rows.reverse()
+    else:
+        rows = query.order_by(PriceData.timestamp.asc()).all()
+    if not rows:
+        return empty_bars()
+
+    timestamps, opens, highs, lows, closes, volumes = zip(*rows)
+    return {
+        'timestamp': np.array(timestamps, dtype='datetime64[s]').astype(np.int64),
+        'open': np.array(opens, dtype=np.float64),
+        'high': np.array(highs, dtype=np.float64),
+        'low': np.array(lows, dtype=np.float64),
+        'close': np.array(closes, dtype=np.float64),
+        'volume': np.array([volume or 0 for volume in volumes], dtype=np.int64),
+    }
+
+
+def archived_in_span(archive: BarArchive, meta: PriceSeriesMeta) -> int:
+    """Number of archived bars within the span PriceData holds for the series."""
+    return len(archive.read(meta.symbol, meta.interval, since=to_epoch_seconds(meta.oldest_timestamp),
+                            until=to_epoch_seconds(meta.newest_timestamp))['timestamp'])
+
+
+def covers(archive: BarArchive, symbol: str, interval: str, until: Optional[datetime] = None) -> bool:
+    """
+    True if the archive holds every bar PriceData has up to `until`.
+
+    Appends cannot place bars that arrive inside or before the archived span
+    (retention compaction, imports, backfills), so matching end points are not
+    enough: over PriceData's span the archive must hold as many bars as the
+    series metadata counts, and timestamps are unique, so then it holds them all.
+    """
+    bounds = archive.bounds(symbol, interval)
+    meta = db.session.get(PriceSeriesMeta, (symbol, interval), populate_existing=True)
+    if bounds is None or meta is None or meta.newest_timestamp is None or meta.oldest_timestamp is None:
+        return False
+
+    # The end of the range must already be archived
+    end = meta.newest_timestamp if until is None else min(until, meta.newest_timestamp)
+    if bounds[1] < to_epoch_seconds(end):
+        return False
+    return archived_in_span(archive, meta) == meta.bar_count
+
+
+def load_bars(symbol: str, interval: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+              limit: Optional[int] = None, before: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+    """
+    Bars as column arrays (timestamp in epoch seconds), from the archive when it
+    covers the range and from PriceData otherwise.
+
+    `since` and `until` are inclusive, `before` is exclusive.
+    """
+    archive = get_archive()
+    end = until if before is None else (before if until is None else min(until, before))
+    if archive is not None and covers(archive, symbol, interval, end):
+        return archive.read(
+            symbol, interval,
+            since=None if since is None else to_epoch_seconds(since),
+            until=None if until is None else to_epoch_seconds(until),
+            before=None if before is None else to_epoch_seconds(before),
+            limit=limit,
+        )
+    return query_bars(symbol, interval, since, until, limit, before)
+
+
+def sync_from_db(symbol: str, interval: str, since: Optional[datetime] = None) -> Tuple[int, int]:
+    """
+    Copy committed PriceData bars into the archive.
+
+    Bars from `since` (or from the last archived bar) onwards are re-read, so
+    revised bars are overwritten and new ones appended. If PriceData then still
+    has bars the archive lacks (they landed inside or before its span), the
+    series is rewritten from PriceData. Returns (updated, appended).
+    """
+    archive = get_archive()
+    if archive is None:
+        return 0, 0
+    bounds = archive.bounds(symbol, interval)
+    if bounds is not None:
+        last = datetime.utcfromtimestamp(bounds[1])
+        since = last if since is None else min(since, last)
+    try:
+        result = archive.write(symbol, interval, query_bars(symbol, interval, since=since))
+        meta = db.session.get(PriceSeriesMeta, (symbol, interval), populate_existing=True)
+        if (meta is not None and meta.oldest_timestamp is not None and meta.newest_timestamp is not None
+                and archived_in_span(archive, meta) < meta.bar_count):
+            logger.info(f"Rebuilding the archive of {symbol} @ {interval}: bars arrived inside its span")
+            archive.clear(symbol, interval)
+            result = archive.write(symbol, interval, query_bars(symbol, interval))
+        return result
+    except OSError as e:
+        logger.error(f"Archiving {symbol} @ {interval} failed: {e}")
+        return 0, 0
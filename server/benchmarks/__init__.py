@@ -0,0 +1,9 @@
+"""
+Reproducible load benchmarks for the API.
+
+    seed.py           fill a database with synthetic users, predictions and bars
+    fake_upstream.py  local stand-in for the Twelve Data time_series endpoint
+    run.py            drive the hot endpoints at fixed concurrency and report latency
+
+Run the modules from the server directory, e.g. `python -m benchmarks.run --help`.
+"""
@@ -0,0 +1,184 @@
+"""
+Local stand-in for the Twelve Data API.
+
+Serves /time_series in Twelve Data's response format with a deterministic
+price path per symbol, so cache misses in a benchmark cost a local round trip
+instead of API credits. Point the app at it with
+
+    TWELVE_DATA_BASE_URL=http://127.0.0.1:8765 TWELVE_DATA_API_KEY=benchmark
+
+yfinance is only consulted when Twelve Data fails, so with this server running
+the benchmark never leaves the machine. `--latency-ms` adds a fixed delay to
+every response to model a slow upstream; `--error-rate` answers that share of
+requests with a Twelve Data error body.
+
+Usage:
+
+    python -m benchmarks.fake_upstream --port 8765 --latency-ms 150
+"""
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INTERVAL_SECONDS = {
+    '1min': 60,
+    '5min': 300,
+    '15min': 900,
+    '30min': 1800,
+    '1h': 3600,
+    '4h': 14400,
+    '1day': 86400,
+    '1week': 604800,
+    '1month': 2592000,
+}
+
+MAX_OUTPUTSIZE = 5000
+
+
+def start_price(symbol: str) -> float:
+    """Stable per-symbol price level between 10 and 50,000."""
+    return float(10 ** (1 + (zlib.crc32(symbol.encode()) % 3700) / 1000))
+
+
+def _noise(epochs: np.ndarray, seed: int) -> np.ndarray:
+    """Hash-based noise in [-0.5, 0.5) that depends only on the bar time."""
+    return ((epochs * 2654435761 + seed) % 2 ** 32) / 2 ** 32 - 0.5
+
+
+def price_at(symbol: str, interval: str, epochs: np.ndarray) -> np.ndarray:
+    """Deterministic price path: two slow waves plus per-bar noise."""
+    step = INTERVAL_SECONDS[interval]
+    seed = zlib.crc32(f'{symbol}:{interval}'.encode())
+    phase = epochs / step
+    return start_price(symbol) * (1 + 0.05 * np.sin(phase / 80 + seed) + 0.01 * np.sin(phase / 6)
+                                  + 0.004 * _noise(epochs, seed))
+
+
+def random_walk(symbol: str, interval: str, outputsize: int, now: Optional[datetime] = None) -> List[Dict[str, str]]:
+    """
+    The latest `outputsize` bars ending at `now`, newest first like Twelve Data.
+
+    Each bar depends only on its own timestamp, so overlapping fetches agree on history.
+    """
+    step = INTERVAL_SECONDS[interval]
+    now = now or datetime.utcnow()
+    last = int(now.timestamp()) // step * step
+    epochs = last - step * np.arange(outputsize, dtype=np.int64)
+
+    seed = zlib.crc32(f'{symbol}:{interval}'.encode())
+    closes = price_at(symbol, interval, epochs)
+    opens = price_at(symbol, interval, epochs - step)
+    spread = np.abs(_noise(epochs, seed + 1)) * 0.002 * closes
+    highs = np.maximum(opens, closes) + spread
+    lows = np.minimum(opens, closes) - spread
+    volumes = 1_000 + (np.abs(_noise(epochs, seed + 2)) * 2_000_000).astype(np.int64)
+
+    time_format = '%Y-%m-%d' if step >= 86400 else '%Y-%m-%d %H:%M:%S'
+    return [
+        {
+            'datetime': datetime.utcfromtimestamp(int(epochs[i])).strftime(time_format),
+            'open': f'{opens[i]:.5f}',
+            'high': f'{highs[i]:.5f}',
+            'low': f'{lows[i]:.5f}',
+            'close': f'{closes[i]:.5f}',
+            'volume': str(int(volumes[i])),
+        }
+        for i in range(outputsize)
+    ]
+
+
+class FakeTwelveDataHandler(BaseHTTPRequestHandler):
+    server_version = 'FakeTwelveData/1.0'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        status, body = self.server.respond(url.path, params)
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class FakeTwelveData(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], latency_ms: float = 0, error_rate: float = 0):
+        super().__init__(address, FakeTwelveDataHandler)
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def respond(self, path: str, params: Dict[str, str]) -> Tuple[int, Dict[str, Any]]:
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        if path != '/time_series':
+            return 404, {'status': 'error', 'code': 404, 'message': f'{path} is not implemented'}
+        symbol = params.get('symbol')
+        interval = params.get('interval')
+        if not symbol or interval not in INTERVAL_SECONDS:
+            return 200, {'status': 'error', 'code': 400, 'message': '**symbol** or **interval** is invalid'}
+        if self.error_rate and random.random() < self.error_rate:
+            return 200, {'status': 'error', 'code': 429, 'message': 'You have run out of API credits'}
+
+        outputsize = max(1, min(int(params.get('outputsize', 30)), MAX_OUTPUTSIZE))
+        return 200, {
+            'meta': {'symbol': symbol, 'interval': interval, 'type': 'benchmark'},
+            'values': random_walk(symbol, interval, outputsize),
+            'status': 'ok',
+        }
+
+
+def start(host: str = '127.0.0.1', port: int = 0, latency_ms: float = 0, error_rate: float = 0) -> FakeTwelveData:
+    """Serve in a background thread; port 0 picks a free one (see `.url`)."""
+    server = FakeTwelveData((host, port), latency_ms, error_rate)
+    threading.Thread(target=server.serve_forever, name='fake-twelve-data', daemon=True).start()
+    return server
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Serve a fake Twelve Data API for benchmarks.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0, help='Delay added to every response')
+    parser.add_argument('--error-rate', type=float, default=0, help='Share of requests answered with an API error')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    server = FakeTwelveData((args.host, args.port), args.latency_ms, args.error_rate)
+    logger.info(f"Fake Twelve Data listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,375 @@
+"""
+Drive the hot API endpoints at fixed concurrency and report latency.
+
+Each scenario runs for --duration seconds with --concurrency client threads,
+each logged in as a different seeded user (see seed.py); requests started in
+the --warmup period are not measured, but every thread makes at least one
+measured request. Reported per scenario: p50/p95/p99/max latency,
+throughput, status counts, SQL queries and database time per request.
+
+Without --base-url the app is imported and served in-process on a threaded
+WSGI server, with a fake Twelve Data (fake_upstream.py) started alongside.
+With --base-url an already running server is measured over HTTP (e.g.
+gunicorn with TWELVE_DATA_BASE_URL pointed at `python -m
+benchmarks.fake_upstream`). Queries and database time per request come from
+the X-Query-Count and Server-Timing headers the app adds (instrumentation.py).
+
+    DATABASE_URL=sqlite:////tmp/bench.db python -m benchmarks.run --json results.json
+    python -m benchmarks.run --base-url http://127.0.0.1:8000 --concurrency 32 --duration 30
+    python -m benchmarks.run --compare baseline.json --max-regression 0.2
+    python -m benchmarks.run --scenario submit --rate 200 --concurrency 32
+
+--rate paces the clients to a fixed number of requests per second in total
+(open loop): a request's latency is counted from when it was due, so time
+spent queueing behind a server that cannot keep up shows in the percentiles.
+
+--compare exits with status 1 when a scenario's p95 latency or queries per
+request grew by more than --max-regression over the baseline report.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import queue
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import requests
+
+from benchmarks.seed import BENCH_PASSWORD, CRYPTO_SYMBOLS, SYMBOLS, email_for
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_HEADER = 'X-Query-Count'
+DB_TIMING = re.compile(r'(?:^|,)\s*db;dur=([\d.]+)')
+
+PERCENTILES = (50, 95, 99)
+
+DEFAULT_SCENARIOS = ('prices', 'predictions_all', 'leaderboard', 'user_stats', 'score', 'close')
+
+
+class Client:
+    """One logged-in user with its own HTTP session, used by one thread at a time."""
+
+    def __init__(self, base_url: str, index: int):
+        self.base_url = base_url
+        self.session = requests.Session()
+        response = self.session.post(f'{base_url}/api/auth/login',
+                                     json={'email': email_for(index), 'password': BENCH_PASSWORD})
+        if response.status_code != 200:
+            raise RuntimeError(f'Login as {email_for(index)} failed ({response.status_code}); '
+                               'seed the database with benchmarks.seed first')
+        # Cookie session rather than the bearer token: tokens live in one worker's memory
+        self.user_id = response.json()['user']['id']
+        self.scorable: List[int] = []
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        return self.session.request(method, f'{self.base_url}{path}', timeout=60, **kwargs)
+
+    def load_active_predictions(self):
+        predictions = self.request('GET', '/api/user/predictions').json().get('predictions', [])
+        self.scorable = [p['id'] for p in predictions if p['status'] == 'active' and p['symbol'] in CRYPTO_SYMBOLS]
+
+
+class Scenario:
+    """A named request generator; `make` returns (method, path, kwargs) for a client."""
+
+    def __init__(self, name: str, make: Callable[[Client, 'Context'], Optional[Tuple[str, str, Dict[str, Any]]]]):
+        self.name = name
+        self.make = make
+
+
+class Context:
+    """State shared by the threads of a run: predictions left to close."""
+
+    def __init__(self, clients: List[Client]):
+        self.closable: Dict[str, queue.Queue] = {}
+        for client in clients:
+            pending = queue.Queue()
+            # Keep half for /score, close the other half
+            for prediction_id in client.scorable[len(client.scorable) // 2:]:
+                pending.put(prediction_id)
+            self.closable[client.user_id] = pending
+
+    @staticmethod
+    def current_price() -> float:
+        return round(random.uniform(100, 60_000), 2)
+
+
+def _prices(client: Client, context: Context):
+    return 'GET', f'/api/prices/{random.choice(SYMBOLS)}', {
+        'params': {'interval': random.choice(['1m', '5m', '1h']), 'period': '1d', 'source': 'twelve_data'},
+    }
+
+
+def _predictions_all(client: Client, context: Context):
+    return 'GET', '/api/predictions/all', {'params': {'page': random.randint(1, 50), 'per_page': 20}}
+
+
+def _leaderboard(client: Client, context: Context):
+    return 'GET', '/api/leaderboard', {}
+
+
+def _user_stats(client: Client, context: Context):
+    return 'GET', '/api/user/stats', {}
+
+
+def _score(client: Client, context: Context):
+    if not client.scorable:
+        return None
+    prediction_id = random.choice(client.scorable[:max(1, len(client.scorable) // 2)])
+    return 'POST', f'/api/predictions/{prediction_id}/score', {'json': {'currentPrice': context.current_price()}}
+
+
+def _submit(client: Client, context: Context):
+    # Crypto: the market hours check never refuses them
+    return 'POST', '/api/predictions', {'json': {
+        'symbol': random.choice(CRYPTO_SYMBOLS),
+        'timeframe': random.choice(['hourly', 'daily']),
+        'stakedTokens': 1,
+        'points': [{'x': x, 'y': random.uniform(50, 350)} for x in range(0, 500, 50)],
+        'chartBounds': {'minPrice': 100, 'maxPrice': 200},
+        'canvasDimensions': {'height': 400, 'bottomPadding': 30, 'priceMin': 100, 'priceMax': 200},
+    }}
+
+
+def _close(client: Client, context: Context):
+    try:
+        prediction_id = context.closable[client.user_id].get_nowait()
+    except queue.Empty:
+        return None
+    return 'POST', f'/api/predictions/{prediction_id}/close', {'json': {'currentPrice': context.current_price()}}
+
+
+SCENARIOS = {scenario.name: scenario for scenario in [
+    Scenario('prices', _prices),
+    Scenario('predictions_all', _predictions_all),
+    Scenario('leaderboard', _leaderboard),
+    Scenario('user_stats', _user_stats),
+    Scenario('score', _score),
+    Scenario('close', _close),
+    Scenario('submit', _submit),
+]}
+
+
+def start_in_process(latency_ms: float) -> Tuple[str, Callable[[], None]]:
+    """Serve the app and a fake Twelve Data on free local ports; returns (base_url, stop)."""
+    from werkzeug.serving import make_server
+    from benchmarks import fake_upstream
+
+    upstream = fake_upstream.start(latency_ms=latency_ms)
+    # Read by twelve_data at import time
+    os.environ['TWELVE_DATA_BASE_URL'] = upstream.url
+    os.environ.setdefault('TWELVE_DATA_API_KEY', 'benchmark')
+
+    from app import app
+
+    # The app logs every cache hit at INFO; keep the benchmark output readable
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='benchmark-app', daemon=True).start()
+
+    def stop():
+        server.shutdown()
+        upstream.shutdown()
+
+    return f'http://127.0.0.1:{server.server_port}', stop
+
+
+def run_scenario(scenario: Scenario, clients: List[Client], context: Context, duration: float,
+                 warmup: float, rate: float = 0) -> Dict[str, Any]:
+    """
+    Run one scenario with one thread per client until `duration` elapses or it runs out of work,
+    at `rate` requests per second in total if given, otherwise as fast as the clients go.
+    """
+    latencies: List[float] = []
+    queries: List[int] = []
+    db_ms: List[float] = []
+    statuses: Dict[str, int] = {}
+    lock = threading.Lock()
+    warm_until = time.perf_counter() + warmup
+    stop_at = warm_until + duration
+    schedule = iter(range(sys.maxsize))
+    first_due = time.perf_counter()
+
+    def next_due() -> float:
+        with lock:
+            due = first_due + next(schedule) / rate
+        time.sleep(max(0.0, due - time.perf_counter()))
+        return due
+
+    def worker(client: Client):
+        measured = False
+        # At least one measured request per client, however slow the endpoint
+        while not measured or time.perf_counter() < stop_at:
+            spec = scenario.make(client, context)
+            if spec is None:
+                return
+            method, path, kwargs = spec
+            started = next_due() if rate else time.perf_counter()
+            try:
+                response = client.request(method, path, **kwargs)
+                status = str(response.status_code)
+                query_count = response.headers.get(QUERY_COUNT_HEADER)
+                db_timing = DB_TIMING.search(response.headers.get('Server-Timing', ''))
+            except requests.RequestException as e:
+                status, query_count, db_timing = type(e).__name__, None, None
+            elapsed = time.perf_counter() - started
+            if started < warm_until:
+                continue
+            measured = True
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+                if query_count is not None:
+                    queries.append(int(query_count))
+                if db_timing:
+                    db_ms.append(float(db_timing.group(1)))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+        list(executor.map(worker, clients))
+    wall = max(time.perf_counter() - max(started, warm_until), 1e-9)
+    return summarize(scenario.name, latencies, queries, db_ms, statuses, wall)
+
+
+def summarize(name: str, latencies: List[float], queries: List[int], db_ms: List[float],
+              statuses: Dict[str, int], wall: float) -> Dict[str, Any]:
+    result: Dict[str, Any] = {
+        'scenario': name,
+        'requests': len(latencies),
+        'seconds': round(wall, 2),
+        'throughput': round(len(latencies) / wall, 1),
+        'statuses': statuses,
+        'errorRate': round(sum(count for status, count in statuses.items() if not status.startswith('2'))
+                           / max(len(latencies), 1), 4),
+    }
+    if latencies:
+        values = np.array(latencies) * 1000
+        for p in PERCENTILES:
+            result[f'p{p}Ms'] = round(float(np.percentile(values, p)), 2)
+        result['meanMs'] = round(float(values.mean()), 2)
+        result['maxMs'] = round(float(values.max()), 2)
+    if queries:
+        result['queriesPerRequest'] = round(float(np.mean(queries)), 1)
+        result['maxQueries'] = int(max(queries))
+    if db_ms:
+        result['dbMsPerRequest'] = round(float(np.mean(db_ms)), 2)
+    return result
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Scenarios whose p95 latency or queries per request regressed beyond the threshold."""
+    previous = {result['scenario']: result for result in baseline.get('results', [])}
+    regressions = []
+    for result in report['results']:
+        before = previous.get(result['scenario'])
+        if not before:
+            continue
+        for metric in ('p95Ms', 'queriesPerRequest'):
+            old, new = before.get(metric), result.get(metric)
+            if old and new is not None and new > old * (1 + max_regression):
+                regressions.append(f"{result['scenario']}: {metric} {old} -> {new}")
+    return regressions
+
+
+def print_table(results: List[Dict[str, Any]]):
+    header = (f"{'scenario':<16}{'req':>7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}"
+              f"{'db ms':>9}{'errors':>8}")
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r['scenario']:<16}{r['requests']:>7}{r['throughput']:>9}{r.get('p50Ms', '-'):>9}"
+              f"{r.get('p95Ms', '-'):>9}{r.get('p99Ms', '-'):>9}{r.get('queriesPerRequest', '-'):>9}"
+              f"{r.get('dbMsPerRequest', '-'):>9}"
+              f"{r['errorRate']:>8.1%}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Benchmark the hot API endpoints at fixed concurrency.')
+    parser.add_argument('--base-url', help='Measure a running server instead of serving the app in-process')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help=f'Scenarios to run (default: all, in order {", ".join(DEFAULT_SCENARIOS)})')
+    parser.add_argument('--concurrency', type=int, default=8, help='Client threads, one seeded user each')
+    parser.add_argument('--duration', type=float, default=10, help='Measured seconds per scenario')
+    parser.add_argument('--warmup', type=float, default=2, help='Unmeasured seconds before each scenario')
+    parser.add_argument('--rate', type=float, default=0,
+                        help='Requests per second per scenario over all clients (default: as fast as possible)')
+    parser.add_argument('--upstream-latency-ms', type=float, default=0,
+                        help='Delay of the in-process fake Twelve Data')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for request parameters')
+    parser.add_argument('--json', help='Also write the report to this file')
+    parser.add_argument('--compare', help='Baseline report to check for regressions')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Allowed relative growth of p95 latency and queries per request')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(levelname)s %(message)s')
+    random.seed(args.seed)
+
+    stop = None
+    base_url = args.base_url
+    if base_url is None:
+        base_url, stop = start_in_process(args.upstream_latency_ms)
+
+    try:
+        clients = [Client(base_url, i) for i in range(args.concurrency)]
+        for client in clients:
+            client.load_active_predictions()
+        context = Context(clients)
+
+        results = []
+        for name in args.scenario or DEFAULT_SCENARIOS:
+            result = run_scenario(SCENARIOS[name], clients, context, args.duration, args.warmup, args.rate)
+            results.append(result)
+            logger.warning(f"{name}: {result['requests']} requests, p95 {result.get('p95Ms')} ms")
+    finally:
+        if stop is not None:
+            stop()
+
+    report = {
+        'revision': git_revision(),
+        'target': args.base_url or 'in-process',
+        'database': os.environ.get('DATABASE_URL', 'sqlite (default)').split('@')[-1],
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'concurrency': args.concurrency,
+        'duration': args.duration,
+        'rate': args.rate,
+        'upstreamLatencyMs': args.upstream_latency_ms,
+        'results': results,
+    }
+    print_table(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
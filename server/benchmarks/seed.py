@@ -0,0 +1,318 @@
+"""
+Seed a database with synthetic users, predictions and price bars.
+
+Targets whatever DATABASE_URL points at (SQLite or PostgreSQL) through the
+app's own models, so the schema and indexes are exactly what the API runs on.
+Rows are generated in NumPy chunks and written with executemany inserts; the
+output is deterministic for a given --seed.
+
+    DATABASE_URL=sqlite:////tmp/bench.db python -m benchmarks.seed --preset small
+    DATABASE_URL=postgresql://... python -m benchmarks.seed --preset large --reset
+
+Every user's password is BENCH_PASSWORD. The first --active-users users also
+get --active-per-user active hourly predictions on crypto symbols, which the
+runner scores and closes (crypto markets never close, so /close always works).
+Bars follow the same price path as fake_upstream, so fetched and seeded bars
+line up.
+"""
+
+import argparse
+import json
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+
+from benchmarks.fake_upstream import INTERVAL_SECONDS, price_at
+
+logger = logging.getLogger(__name__)
+
+BENCH_PASSWORD = 'benchmark-password'
+EMAIL_DOMAIN = 'bench.example.com'
+
+PRESETS = {
+    'tiny': {'users': 200, 'predictions': 5_000, 'bars': 50_000},
+    'small': {'users': 1_000, 'predictions': 50_000, 'bars': 500_000},
+    'medium': {'users': 5_000, 'predictions': 250_000, 'bars': 2_500_000},
+    'large': {'users': 10_000, 'predictions': 1_000_000, 'bars': 10_000_000},
+}
+
+SYMBOLS = ['AAPL', 'MSFT', 'NVDA', 'TSLA', 'SPY', 'BTC-USD', 'ETH-USD', 'SOL-USD']
+CRYPTO_SYMBOLS = [symbol for symbol in SYMBOLS if symbol.endswith('-USD')]
+
+# Share of predictions per timeframe, and the series length/step the submit endpoint uses
+TIMEFRAMES = {
+    'hourly': (0.40, 60, timedelta(minutes=1)),
+    'daily': (0.35, 24, timedelta(hours=1)),
+    'weekly': (0.15, 7 * 24, timedelta(hours=1)),
+    'monthly': (0.07, 30, timedelta(days=1)),
+    'yearly': (0.03, 365, timedelta(days=1)),
+}
+TIMEFRAME_DURATIONS = {
+    'hourly': timedelta(hours=1),
+    'daily': timedelta(days=1),
+    'weekly': timedelta(weeks=1),
+    'monthly': timedelta(days=30),
+    'yearly': timedelta(days=365),
+}
+
+# Share of each symbol's bars per interval; daily history is capped at ten years
+BAR_SHARES = {'1day': 0.005, '1h': 0.045, '5min': 0.25, '1min': 0.70}
+MAX_DAILY_BARS = 3650
+
+HISTORY_DAYS = 180
+CHUNK_SIZE = 20_000
+
+
+def email_for(index: int) -> str:
+    return f'user{index:06d}@{EMAIL_DOMAIN}'
+
+
+def _insert(model, rows: List[Dict[str, Any]]):
+    from db import db
+
+    if rows:
+        db.session.execute(insert(model), rows)
+        db.session.commit()
+
+
+def seed_users(n_users: int, rng: np.random.Generator) -> List[str]:
+    """Insert users sharing one password hash (hashing 10k passwords would dominate seeding)."""
+    from models import User
+
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+    now = datetime.utcnow()
+    balances = rng.integers(0, 5_000, n_users)
+    user_ids = [str(uuid.UUID(int=int(value), version=4)) for value in rng.integers(0, 2 ** 63, n_users)]
+    for start in range(0, n_users, CHUNK_SIZE):
+        _insert(User, [
+            {
+                'id': user_ids[i],
+                'email': email_for(i),
+                'password_hash': password_hash,
+                'first_name': 'Bench',
+                'last_name': f'User {i}',
+                'token_balance': int(balances[i]),
+                'created_at': now - timedelta(days=HISTORY_DAYS),
+                'updated_at': now,
+            }
+            for i in range(start, min(start + CHUNK_SIZE, n_users))
+        ])
+    logger.info(f"Seeded {n_users} users")
+    return user_ids
+
+
+def _price_series(start_price: float, created_at: datetime, count: int, step: timedelta,
+                  rng: np.random.Generator) -> List[Dict[str, Any]]:
+    drift = rng.normal(0, 0.03)
+    path = start_price * (1 + np.linspace(0, drift, count) + rng.normal(0, 0.002, count))
+    return [
+        {'price': round(float(price), 2), 'timestamp': (created_at + step * i).isoformat()}
+        for i, price in enumerate(path)
+    ]
+
+
+def _prediction_row(user_id: str, symbol: str, timeframe: str, created_at: datetime, now: datetime,
+                    rng: np.random.Generator) -> Dict[str, Any]:
+    _, count, step = TIMEFRAMES[timeframe]
+    start_price = float(price_at(symbol, '1h', np.array([int(created_at.timestamp())]))[0])
+    series = _price_series(start_price, created_at, count, step, rng)
+    stake = int(rng.choice([0, 10, 25, 50, 100]))
+    mspe = float(rng.gamma(2.0, 0.5))
+    contrarian = round(float(rng.uniform(0.5, 1.0)), 4)
+    active = created_at + TIMEFRAME_DURATIONS[timeframe] > now
+    return {
+        'user_id': user_id,
+        'symbol': symbol,
+        'asset_name': symbol,
+        'timeframe': timeframe,
+        'created_at': created_at,
+        'start_price': series[0]['price'],
+        'end_price': series[-1]['price'],
+        'price_series': json.dumps(series),
+        'staked_tokens': stake,
+        'accuracy_score': None if active else round(mspe, 6),
+        'contrarian_score': contrarian,
+        'rewards_earned': 0 if active or not stake else int(stake * count / (1 + mspe)),
+        'status': 'active' if active else str(rng.choice(['completed', 'closed'])),
+    }
+
+
+def seed_predictions(user_ids: List[str], n_predictions: int, active_users: int, active_per_user: int,
+                     rng: np.random.Generator) -> int:
+    """Insert history spread over HISTORY_DAYS, plus closable active predictions for the first users."""
+    from models import Prediction
+
+    now = datetime.utcnow()
+    names = list(TIMEFRAMES)
+    shares = np.array([TIMEFRAMES[name][0] for name in names])
+    written = 0
+
+    rows = []
+    for i in range(min(active_users, len(user_ids))):
+        for j in range(active_per_user):
+            # 10-50 minutes into an hour: past the 5% early-close floor, still active
+            created_at = now - timedelta(minutes=float(rng.uniform(10, 50)))
+            rows.append(_prediction_row(user_ids[i], CRYPTO_SYMBOLS[j % len(CRYPTO_SYMBOLS)], 'hourly',
+                                        created_at, now, rng))
+    _insert(Prediction, rows)
+    written += len(rows)
+
+    remaining = max(0, n_predictions - written)
+    for start in range(0, remaining, CHUNK_SIZE):
+        size = min(CHUNK_SIZE, remaining - start)
+        owners = rng.integers(0, len(user_ids), size)
+        symbols = rng.integers(0, len(SYMBOLS), size)
+        timeframes = rng.choice(len(names), size, p=shares / shares.sum())
+        ages = rng.uniform(0, HISTORY_DAYS * 86400, size)
+        _insert(Prediction, [
+            _prediction_row(user_ids[owners[k]], SYMBOLS[symbols[k]], names[timeframes[k]],
+                            now - timedelta(seconds=float(ages[k])), now, rng)
+            for k in range(size)
+        ])
+        written += size
+        logger.info(f"Seeded {written}/{n_predictions} predictions")
+    return written
+
+
+def seed_meta_predictions(rng: np.random.Generator):
+    """One meta-prediction per symbol, as if every seeded prediction had been merged."""
+    from db import db
+    from models import MetaPrediction, Prediction
+    from sqlalchemy import func
+
+    counts = dict(db.session.query(Prediction.symbol, func.count(Prediction.id)).group_by(Prediction.symbol).all())
+    now = datetime.utcnow()
+    rows = []
+    for symbol in SYMBOLS:
+        start_price = float(price_at(symbol, '1h', np.array([int(now.timestamp())]))[0])
+        rows.append({
+            'symbol': symbol,
+            'price_series': json.dumps(_price_series(start_price, now, 60, timedelta(minutes=1), rng)),
+            'prediction_count': counts.get(symbol, 0),
+            'last_updated': now,
+        })
+    _insert(MetaPrediction, rows)
+
+
+def bars_per_series(n_bars: int) -> Dict[str, int]:
+    per_symbol = n_bars // len(SYMBOLS)
+    counts = {interval: int(per_symbol * share) for interval, share in BAR_SHARES.items()}
+    counts['1day'] = min(counts['1day'], MAX_DAILY_BARS)
+    counts['1min'] = per_symbol - sum(count for interval, count in counts.items() if interval != '1min')
+    return counts
+
+
+def seed_bars(n_bars: int) -> int:
+    """Insert bars ending now for every symbol and interval, then rebuild series metadata."""
+    from models import PriceData
+    import bar_archive
+    import price_meta
+
+    now = datetime.utcnow()
+    written = 0
+    for symbol in SYMBOLS:
+        for interval, count in bars_per_series(n_bars).items():
+            step = INTERVAL_SECONDS[interval]
+            last = int(now.timestamp()) // step * step
+            for start in range(0, count, CHUNK_SIZE):
+                size = min(CHUNK_SIZE, count - start)
+                epochs = last - step * np.arange(count - start - 1, count - start - size - 1, -1, dtype=np.int64)
+                closes = price_at(symbol, interval, epochs)
+                opens = price_at(symbol, interval, epochs - step)
+                highs = np.maximum(opens, closes) * 1.001
+                lows = np.minimum(opens, closes) * 0.999
+                timestamps = epochs.astype('datetime64[s]').astype(datetime)
+                _insert(PriceData, [
+                    {
+                        'symbol': symbol,
+                        'interval': interval,
+                        'timestamp': timestamps[k],
+                        'open': float(opens[k]),
+                        'high': float(highs[k]),
+                        'low': float(lows[k]),
+                        'close': float(closes[k]),
+                        'volume': 1_000 + int(epochs[k] % 997) * 100,
+                        'fetched_at': now,
+                    }
+                    for k in range(size)
+                ])
+                written += size
+            logger.info(f"Seeded {count} {symbol} @ {interval} bars")
+
+    price_meta.rebuild()
+    for symbol in SYMBOLS:
+        for interval in BAR_SHARES:
+            bar_archive.sync_from_db(symbol, interval)
+    return written
+
+
+def seed(users: int, predictions: int, bars: int, active_users: int = 64, active_per_user: int = 50,
+         seed_value: int = 42, reset: bool = False) -> Dict[str, Any]:
+    """Populate the configured database; call inside an app context."""
+    from sqlalchemy import text
+    from db import db
+    from http_cache import bump_versions, GLOBAL_SCOPE
+    import schema
+    import user_stats
+
+    if reset:
+        db.drop_all()
+        db.session.execute(text('DROP TABLE IF EXISTS alembic_version'))
+        db.session.commit()
+    schema.upgrade()
+
+    rng = np.random.default_rng(seed_value)
+    started = time.perf_counter()
+    user_ids = seed_users(users, rng)
+    n_predictions = seed_predictions(user_ids, predictions, active_users, active_per_user, rng)
+    seed_meta_predictions(rng)
+    user_stats.rebuild()
+    n_bars = seed_bars(bars)
+    bump_versions(GLOBAL_SCOPE)
+    db.session.commit()
+
+    return {
+        'users': users,
+        'predictions': n_predictions,
+        'bars': n_bars,
+        'symbols': SYMBOLS,
+        'activeUsers': min(active_users, users),
+        'seconds': round(time.perf_counter() - started, 1),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Seed DATABASE_URL with synthetic benchmark data.')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='small')
+    parser.add_argument('--users', type=int, help='Override the preset user count')
+    parser.add_argument('--predictions', type=int, help='Override the preset prediction count')
+    parser.add_argument('--bars', type=int, help='Override the preset bar count')
+    parser.add_argument('--active-users', type=int, default=64,
+                        help='Users that get closable active predictions (>= runner concurrency)')
+    parser.add_argument('--active-per-user', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reset', action='store_true', help='Drop and recreate all tables first')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    sizes = dict(PRESETS[args.preset])
+    for name in sizes:
+        if getattr(args, name) is not None:
+            sizes[name] = getattr(args, name)
+
+    from app import app
+
+    with app.app_context():
+        report = seed(active_users=args.active_users, active_per_user=args.active_per_user,
+                      seed_value=args.seed, reset=args.reset, **sizes)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""
+Measure cold start time and per-worker memory.
+
+Two measurements, both in fresh processes:
+
+- import: `import app` in a new interpreter, --runs times. Reports the median
+  and max wall time, peak RSS, and which heavy libraries were already loaded
+  by the import (they should only load on first use).
+- gunicorn: starts `gunicorn app:app` with gunicorn.conf.py and --workers
+  workers, once with the app preloaded in the master and once without. It
+  reports the seconds until /api/health answers, and each worker's RSS, PSS
+  and private memory from /proc/<pid>/smaps_rollup (Linux only). With preload
+  the workers share the imported modules copy-on-write, which shows up as a
+  lower PSS / private size.
+
+    DATABASE_URL=sqlite:////tmp/bench.db python -m benchmarks.startup --json startup.json
+    python -m benchmarks.startup --compare baseline.json --max-regression 0.2
+
+--compare exits with status 1 when the median import time or the mean worker
+PSS grew by more than --max-regression over the baseline report.
+"""
+
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from benchmarks.run import git_revision
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Libraries the app should not import until a request needs them
+LAZY_MODULES = ('yfinance', 'pandas', 'requests', 'pyarrow')
+
+IMPORT_SNIPPET = f"""
+import json, resource, sys, time
+started = time.perf_counter()
+import app
+seconds = time.perf_counter() - started
+print(json.dumps({{
+    'seconds': seconds,
+    'maxRssMb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'loaded': [name for name in {LAZY_MODULES!r} if name in sys.modules],
+}}))
+"""
+
+SMAPS_FIELDS = {'Rss': 'rssMb', 'Pss': 'pssMb', 'Private_Clean': 'privateMb', 'Private_Dirty': 'privateMb'}
+
+
+def _env() -> Dict[str, str]:
+    env = dict(os.environ)
+    # Nothing is queried: the import and /api/health never touch the database
+    env.setdefault('DATABASE_URL', 'sqlite:////tmp/drawtrade-startup.db')
+    return env
+
+
+def measure_import(runs: int) -> Dict[str, Any]:
+    """Import the app `runs` times, each in a new interpreter."""
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET], cwd=SERVER_DIR, env=_env(),
+                                capture_output=True, text=True, check=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    seconds = [sample['seconds'] for sample in samples]
+    return {
+        'runs': runs,
+        'medianMs': round(statistics.median(seconds) * 1000, 1),
+        'maxMs': round(max(seconds) * 1000, 1),
+        'maxRssMb': round(max(sample['maxRssMb'] for sample in samples), 1),
+        'eagerlyLoaded': sorted({name for sample in samples for name in sample['loaded']}),
+    }
+
+
+def memory(pid: int) -> Dict[str, float]:
+    """RSS, PSS and private memory of one process in MB."""
+    values = {'rssMb': 0.0, 'pssMb': 0.0, 'privateMb': 0.0}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            name, _, rest = line.partition(':')
+            if name in SMAPS_FIELDS:
+                values[SMAPS_FIELDS[name]] += int(rest.split()[0]) / 1024
+    return {key: round(value, 1) for key, value in values.items()}
+
+
+def children(pid: int) -> List[int]:
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def measure_gunicorn(workers: int, preload: bool, requests_per_worker: int = 20,
+                     timeout: float = 60) -> Dict[str, Any]:
+    """Boot gunicorn, wait for /api/health, exercise every worker and read their memory."""
+    port = _free_port()
+    env = _env()
+    env.update(WEB_CONCURRENCY=str(workers), GUNICORN_PRELOAD='1' if preload else '0')
+    started = time.perf_counter()
+    master = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'app:app', '--bind', f'127.0.0.1:{port}',
+                               '--log-level', 'warning'], cwd=SERVER_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}/api/health'
+    try:
+        while True:
+            if master.poll() is not None:
+                raise RuntimeError(f'gunicorn exited with status {master.returncode}')
+            if time.perf_counter() - started > timeout:
+                raise RuntimeError(f'gunicorn did not answer within {timeout:g}s')
+            try:
+                if requests.get(url, timeout=1).ok:
+                    break
+            except requests.RequestException:
+                time.sleep(0.05)
+        ready = time.perf_counter() - started
+
+        # Workers answer in turn; wait until all of them are up before reading memory
+        deadline = time.perf_counter() + timeout
+        while len(children(master.pid)) < workers and time.perf_counter() < deadline:
+            time.sleep(0.1)
+        session = requests.Session()
+        for _ in range(requests_per_worker * workers):
+            session.get(url, timeout=5)
+
+        per_worker = [memory(pid) for pid in children(master.pid)]
+        return {
+            'workers': workers,
+            'preload': preload,
+            'readySeconds': round(ready, 2),
+            'master': memory(master.pid),
+            'worker': {key: round(statistics.mean(m[key] for m in per_worker), 1) for key in per_worker[0]},
+            'totalPssMb': round(memory(master.pid)['pssMb'] + sum(m['pssMb'] for m in per_worker), 1),
+        }
+    finally:
+        master.terminate()
+        try:
+            master.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            master.kill()
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Import time and worker PSS that regressed beyond the threshold."""
+    regressions = []
+    old, new = baseline.get('import', {}).get('medianMs'), report['import']['medianMs']
+    if old and new > old * (1 + max_regression):
+        regressions.append(f'import: medianMs {old} -> {new}')
+    previous = {run['preload']: run for run in baseline.get('gunicorn', [])}
+    for run in report['gunicorn']:
+        before = previous.get(run['preload'])
+        if not before:
+            continue
+        old, new = before['worker']['pssMb'], run['worker']['pssMb']
+        if old and new > old * (1 + max_regression):
+            regressions.append(f"gunicorn preload={run['preload']}: worker pssMb {old} -> {new}")
+    return regressions
+
+
+def print_report(report: Dict[str, Any]):
+    imported = report['import']
+    print(f"import app: median {imported['medianMs']} ms, max {imported['maxMs']} ms, "
+          f"peak RSS {imported['maxRssMb']} MB, eagerly loaded: {', '.join(imported['eagerlyLoaded']) or 'none'}")
+    header = f"{'preload':<9}{'workers':>8}{'ready s':>9}{'RSS MB':>9}{'PSS MB':>9}{'private MB':>12}{'total PSS':>11}"
+    print(header)
+    print('-' * len(header))
+    for run in report['gunicorn']:
+        worker = run['worker']
+        print(f"{str(run['preload']):<9}{run['workers']:>8}{run['readySeconds']:>9}{worker['rssMb']:>9}"
+              f"{worker['pssMb']:>9}{worker['privateMb']:>12}{run['totalPssMb']:>11}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Measure app import time and gunicorn worker memory.')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters for the import measurement')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--skip-gunicorn', action='store_true', help='Only measure the import')
+    parser.add_argument('--json', help='Also write the report to this file')
+    parser.add_argument('--compare', help='Baseline report to check for regressions')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Allowed relative growth of import time and worker PSS')
+    args = parser.parse_args(argv)
+
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'import': measure_import(args.runs),
+        'gunicorn': [] if args.skip_gunicorn else [measure_gunicorn(args.workers, preload)
+                                                   for preload in (True, False)],
+    }
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
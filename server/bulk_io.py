@@ -0,0 +1,346 @@
+"""
+Bulk Parquet export and import for PriceData and Prediction history.
+
+Moving months of bars between environments (or into analytics) through the
+JSON API means one Python object and one JSON document per row. These helpers
+stream tables through a server-side cursor in fixed-size chunks straight into
+Arrow record batches, so memory stays constant regardless of table size.
+
+Datasets use Hive-style partition directories:
+
+    <root>/price_data/symbol=AAPL/interval=1min/month=2024-01/part-0.parquet
+    <root>/predictions/symbol=AAPL/month=2024-01/part-0.parquet
+
+Partition values live in the path only, so files can be read back with
+pyarrow.dataset / pandas / DuckDB as one table. Import upserts in batches, which
+makes backfilling the price cache from an export cost no Twelve Data credits.
+
+Requires pyarrow.
+"""
+
+import logging
+import os
+import re
+import tarfile
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import quote, unquote
+
+from sqlalchemy import select, text
+
+from db import db, dialect_insert, without_statement_timeout
+from http_cache import bump_versions, prices_scope, GLOBAL_SCOPE
+from models import PriceData, Prediction, User
+import bar_archive
+import price_meta
+import user_stats
+
+# Set by require_pyarrow() on first use, so workers that never touch Parquet skip the import
+pa = None
+pq = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 10000
+COMPRESSION = 'zstd'
+
+TABLES = ('price_data', 'predictions')
+
+PARTITION_SEGMENT = re.compile(r'^(\w+)=(.+)$')
+
+
+def require_pyarrow():
+    global pa, pq
+    if pa is not None:
+        return
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:  # pragma: no cover - optional dependency
+        raise RuntimeError('pyarrow is not installed; run `pip install pyarrow` to use Parquet export/import')
+    pa, pq = pyarrow, pyarrow.parquet
+
+
+def _schemas() -> Dict[str, Any]:
+    return {
+        'price_data': pa.schema([
+            ('timestamp', pa.timestamp('s')),
+            ('open', pa.float64()),
+            ('high', pa.float64()),
+            ('low', pa.float64()),
+            ('close', pa.float64()),
+            ('volume', pa.int64()),
+            ('fetched_at', pa.timestamp('us')),
+        ]),
+        'predictions': pa.schema([
+            ('id', pa.int64()),
+            ('user_id', pa.string()),
+            ('asset_name', pa.string()),
+            ('timeframe', pa.string()),
+            ('created_at', pa.timestamp('us')),
+            ('start_price', pa.float64()),
+            ('end_price', pa.float64()),
+            ('price_series', pa.string()),
+            ('staked_tokens', pa.int64()),
+            ('accuracy_score', pa.float64()),
+            ('contrarian_score', pa.float64()),
+            ('rewards_earned', pa.int64()),
+            ('status', pa.string()),
+        ]),
+    }
+
+
+# Per table: model, columns encoded in the partition path, and the column the month partition uses
+EXPORT_QUERIES = {
+    'price_data': (PriceData, ('symbol', 'interval'), 'timestamp'),
+    'predictions': (Prediction, ('symbol',), 'created_at'),
+}
+
+
+def partition_path(root: str, table: str, key: Tuple[str, ...], names: Tuple[str, ...]) -> str:
+    # URL-escaped like Hive, so symbols such as EUR/USD stay one path segment
+    segments = [f"{name}={quote(str(value), safe='')}" for name, value in zip(names + ('month',), key)]
+    return os.path.join(root, table, *segments)
+
+
+def _stream_rows(table: str, symbols: Optional[List[str]], intervals: Optional[List[str]],
+                 since: Optional[datetime], until: Optional[datetime], batch_size: int) -> Iterator[Any]:
+    """Rows of `table` ordered by partition, fetched through a server-side cursor."""
+    model, partition_columns, time_column = EXPORT_QUERIES[table]
+    schema = _schemas()[table]
+    columns = [getattr(model, name) for name in partition_columns]
+    columns += [getattr(model, name) for name in schema.names]
+    time_attr = getattr(model, time_column)
+
+    stmt = select(*columns)
+    if symbols:
+        stmt = stmt.where(model.symbol.in_(symbols))
+    if intervals and table == 'price_data':
+        stmt = stmt.where(model.interval.in_(intervals))
+    if since is not None:
+        stmt = stmt.where(time_attr >= since)
+    if until is not None:
+        stmt = stmt.where(time_attr <= until)
+    stmt = stmt.order_by(*[getattr(model, name) for name in partition_columns], time_attr)
+
+    without_statement_timeout()
+    result = db.session.execute(stmt.execution_options(stream_results=True, yield_per=batch_size))
+    for partition in result.partitions():
+        yield from partition
+
+
+def export_table(table: str, root: str, symbols: Optional[List[str]] = None, intervals: Optional[List[str]] = None,
+                 since: Optional[datetime] = None, until: Optional[datetime] = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Write `table` to a partitioned Parquet dataset under `root`.
+
+    Rows arrive in partition order, so only one Parquet writer and one batch
+    are ever held in memory. Returns counts of rows and files written.
+    """
+    require_pyarrow()
+    model, partition_columns, time_column = EXPORT_QUERIES[table]
+    schema = _schemas()[table]
+    n_partition = len(partition_columns)
+    time_index = n_partition + schema.names.index(time_column)
+
+    rows_written = 0
+    files_written = 0
+    writer = None
+    current_key = None
+    buffer: List[Tuple] = []
+
+    def flush():
+        nonlocal rows_written
+        if buffer:
+            columns = list(zip(*buffer))
+            writer.write_batch(pa.record_batch(
+                [pa.array(column, type=field.type) for column, field in zip(columns[n_partition:], schema)],
+                schema=schema,
+            ))
+            rows_written += len(buffer)
+            buffer.clear()
+
+    try:
+        for row in _stream_rows(table, symbols, intervals, since, until, batch_size):
+            key = tuple(row[:n_partition]) + (row[time_index].strftime('%Y-%m'),)
+            if key != current_key:
+                if writer is not None:
+                    flush()
+                    writer.close()
+                directory = partition_path(root, table, key, partition_columns)
+                os.makedirs(directory, exist_ok=True)
+                writer = pq.ParquetWriter(os.path.join(directory, 'part-0.parquet'), schema,
+                                          compression=COMPRESSION)
+                files_written += 1
+                current_key = key
+            buffer.append(tuple(row))
+            if len(buffer) >= batch_size:
+                flush()
+        if writer is not None:
+            flush()
+    finally:
+        if writer is not None:
+            writer.close()
+
+    logger.info(f"Exported {rows_written} {table} rows into {files_written} Parquet files under {root}")
+    return {'rows': rows_written, 'files': files_written}
+
+
+def dataset_files(root: str, table: str) -> Iterator[Tuple[str, Dict[str, str]]]:
+    """Parquet files of a dataset with the partition values encoded in their path."""
+    base = os.path.join(root, table)
+    for directory, _, files in sorted(os.walk(base)):
+        partition = {}
+        for segment in os.path.relpath(directory, base).split(os.sep):
+            match = PARTITION_SEGMENT.match(segment)
+            if match:
+                partition[match.group(1)] = unquote(match.group(2))
+        for name in sorted(files):
+            if name.endswith('.parquet'):
+                yield os.path.join(directory, name), partition
+
+
+def _batches(path: str, batch_size: int) -> Iterable[List[Dict[str, Any]]]:
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+        yield batch.to_pylist()
+
+
+def import_price_data(root: str, overwrite: bool = False, batch_size: int = DEFAULT_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Upsert an exported price_data dataset into the cache.
+
+    Existing bars are kept unless `overwrite`. Each batch commits on its own.
+    Series metadata is rebuilt at the end and imported series are copied into
+    the bar archive.
+    """
+    require_pyarrow()
+    rows = 0
+    series = set()
+    for path, partition in dataset_files(root, 'price_data'):
+        symbol, interval = partition['symbol'], partition['interval']
+        for records in _batches(path, batch_size):
+            for record in records:
+                record['symbol'] = symbol
+                record['interval'] = interval
+            stmt = dialect_insert(PriceData)
+            if stmt is None:
+                raise RuntimeError('Parquet import needs PostgreSQL or SQLite')
+            if overwrite:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=['symbol', 'interval', 'timestamp'],
+                    set_={name: stmt.excluded[name] for name in ('open', 'high', 'low', 'close', 'volume', 'fetched_at')},
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=['symbol', 'interval', 'timestamp'])
+            db.session.execute(stmt, records)
+            bump_versions(prices_scope(symbol, interval))
+            db.session.commit()
+            rows += len(records)
+        series.add((symbol, interval))
+
+    if series:
+        price_meta.rebuild()
+        for symbol, interval in series:
+            bar_archive.sync_from_db(symbol, interval)
+
+    logger.info(f"Imported {rows} price_data rows for {len(series)} series from {root}")
+    return {'rows': rows, 'series': len(series)}
+
+
+def import_predictions(root: str, batch_size: int = DEFAULT_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Insert an exported predictions dataset, skipping ids that already exist.
+
+    Predictions of users missing from this database are kept without a user.
+    """
+    require_pyarrow()
+    rows = 0
+    orphaned = 0
+    imported_users = set()
+    for path, partition in dataset_files(root, 'predictions'):
+        for records in _batches(path, batch_size):
+            user_ids = {record['user_id'] for record in records if record['user_id']}
+            known = {row[0] for row in db.session.query(User.id).filter(User.id.in_(user_ids)).all()} if user_ids else set()
+            for record in records:
+                record['symbol'] = partition['symbol']
+                if record['user_id'] and record['user_id'] not in known:
+                    record['user_id'] = None
+                    orphaned += 1
+            stmt = dialect_insert(Prediction)
+            if stmt is None:
+                raise RuntimeError('Parquet import needs PostgreSQL or SQLite')
+            db.session.execute(stmt.on_conflict_do_nothing(index_elements=['id']), records)
+            db.session.commit()
+            rows += len(records)
+            imported_users |= known
+
+    if rows and db.session.get_bind().dialect.name == 'postgresql':
+        # Explicit ids bypass the sequence; move it past the imported ones
+        db.session.execute(text(
+            "SELECT setval(pg_get_serial_sequence('predictions', 'id'), COALESCE(MAX(id), 1)) FROM predictions"))
+    # Bulk inserts skip user_stats.record(); recount the users that got predictions
+    user_stats.refresh(imported_users)
+    bump_versions(GLOBAL_SCOPE)
+    db.session.commit()
+
+    logger.info(f"Imported {rows} predictions from {root} ({orphaned} without a known user)")
+    return {'rows': rows, 'orphaned': orphaned}
+
+
+def export_dataset(root: str, tables: Iterable[str] = TABLES, **filters) -> Dict[str, Dict[str, int]]:
+    return {table: export_table(table, root, **filters) for table in tables}
+
+
+def import_dataset(root: str, tables: Iterable[str] = TABLES, overwrite: bool = False,
+                   batch_size: int = DEFAULT_BATCH_SIZE) -> Dict[str, Dict[str, int]]:
+    report = {}
+    if 'price_data' in tables:
+        report['price_data'] = import_price_data(root, overwrite=overwrite, batch_size=batch_size)
+    if 'predictions' in tables:
+        report['predictions'] = import_predictions(root, batch_size=batch_size)
+    return report
+
+
+class _ChunkSink:
+    """Write-only file object collecting what tarfile writes, so it can be streamed."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> List[bytes]:
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+def iter_tar(root: str) -> Iterator[bytes]:
+    """Stream the dataset under `root` as an uncompressed tar archive (Parquet is already compressed)."""
+    sink = _ChunkSink()
+    with tarfile.open(fileobj=sink, mode='w|') as tar:
+        for directory, _, files in sorted(os.walk(root)):
+            for name in sorted(files):
+                path = os.path.join(directory, name)
+                tar.add(path, arcname=os.path.relpath(path, root))
+                yield from sink.drain()
+    yield from sink.drain()
+
+
+def extract_tar(fileobj, root: str):
+    """Unpack a dataset archive read from a stream into `root`, refusing unsafe paths."""
+    with tarfile.open(fileobj=fileobj, mode='r|*') as tar:
+        if hasattr(tarfile, 'data_filter'):
+            tar.extractall(root, filter='data')
+            return
+        # Python before 3.11.4 has no extraction filters: allow only plain files
+        # and directories that stay under root
+        base = os.path.realpath(root)
+        for member in tar:
+            target = os.path.realpath(os.path.join(base, member.name))
+            if (not (member.isfile() or member.isdir()) or os.path.isabs(member.name)
+                    or os.path.commonpath([base, target]) != base):
+                raise tarfile.TarError(f'Unsafe archive member: {member.name!r}')
+            tar.extract(member, base)
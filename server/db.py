@@ -1,7 +1,140 @@
+import time
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, exc, text
 from sqlalchemy.orm import DeclarativeBase
 
 class Base(DeclarativeBase):
     pass
 
 db = SQLAlchemy(model_class=Base)
+
+
+def dialect_insert(model):
+    """
+    INSERT for `model` that supports on_conflict_do_update, or None if the
+    current database has no native upsert.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert(model)
+
+# Rows touched per statement by bulk maintenance jobs; each chunk is its own
+# short transaction so row locks are released between chunks.
+DEFAULT_CHUNK_SIZE = 5000
+# Upper bound for caller-supplied chunk sizes; larger chunks hold locks too long
+MAX_CHUNK_SIZE = 50000
+
+
+def delete_in_chunks(model, *criteria, chunk_size=DEFAULT_CHUNK_SIZE, on_progress=None):
+    """
+    Delete rows of `model` matching `criteria` in bounded, separately committed chunks.
+
+    Returns the number of rows deleted. `on_progress(deleted_so_far)` is called
+    after every chunk.
+    """
+    pk = model.__mapper__.primary_key[0]
+    deleted = 0
+    while True:
+        ids = [row[0] for row in db.session.query(pk).filter(*criteria).limit(chunk_size).all()]
+        if not ids:
+            break
+        deleted += model.query.filter(pk.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        if on_progress:
+            on_progress(deleted)
+    return deleted
+
+
+def update_in_chunks(model, values, *criteria, chunk_size=DEFAULT_CHUNK_SIZE, on_progress=None, before_chunk=None):
+    """
+    Apply `values` to rows of `model` matching `criteria` in separately committed chunks.
+
+    Rows are visited once, in primary key order, so a row that changes again
+    after its chunk committed is left alone. Returns the number of rows
+    updated; `before_chunk(ids)` runs in each chunk's transaction ahead of
+    its UPDATE and `on_progress(updated_so_far)` after it commits.
+    """
+    pk = model.__mapper__.primary_key[0]
+    updated = 0
+    last = None
+    while True:
+        query = db.session.query(pk).filter(*criteria)
+        if last is not None:
+            query = query.filter(pk > last)
+        ids = [row[0] for row in query.order_by(pk).limit(chunk_size).all()]
+        if not ids:
+            break
+        if before_chunk:
+            before_chunk(ids)
+        updated += model.query.filter(pk.in_(ids), *criteria).update(values, synchronize_session=False)
+        db.session.commit()
+        last = ids[-1]
+        if on_progress:
+            on_progress(updated)
+    return updated
+
+
+# Pooled connections idle longer than this are pinged when checked out;
+# recently used ones are trusted, so busy request threads never pay for a ping.
+VALIDATE_IDLE_SECONDS = 30
+
+
+def engine_options(database_url, pool_size, max_overflow, statement_timeout_ms, poolclass=None):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for a pool of `pool_size` connections per process.
+
+    On PostgreSQL every statement is cancelled after `statement_timeout_ms`;
+    SQLite has no statement timeout, so it becomes the busy (lock wait) timeout.
+    """
+    options = {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        # Fail fast when the pool is exhausted instead of queueing requests for 30s
+        'pool_timeout': 10,
+        'pool_recycle': 300,
+    }
+    if poolclass is not None:
+        options['poolclass'] = poolclass
+    if database_url.startswith('postgresql'):
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout_ms}'}
+    elif database_url.startswith('sqlite'):
+        options['connect_args'] = {'timeout': statement_timeout_ms / 1000}
+    return options
+
+
+def validate_on_checkout(engine, idle_seconds=VALIDATE_IDLE_SECONDS):
+    """
+    Ping connections that sat idle in the pool for `idle_seconds` before handing them out.
+
+    A cheaper pool_pre_ping: a dead connection raises DisconnectionError, which
+    makes the pool discard it and retry with a fresh one.
+    """
+    @event.listens_for(engine, 'checkin')
+    def mark_idle(dbapi_connection, connection_record):
+        connection_record.info['checked_in_at'] = time.monotonic()
+
+    @event.listens_for(engine, 'checkout')
+    def ping_if_idle(dbapi_connection, connection_record, connection_proxy):
+        checked_in_at = connection_record.info.get('checked_in_at')
+        if checked_in_at is None or time.monotonic() - checked_in_at < idle_seconds:
+            return
+        try:
+            cursor = dbapi_connection.cursor()
+            try:
+                cursor.execute('SELECT 1')
+            finally:
+                cursor.close()
+        except Exception as e:
+            raise exc.DisconnectionError() from e
+
+
+def without_statement_timeout():
+    """Lift the statement timeout for the rest of the current transaction (long scans in bulk jobs)."""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute(text('SET LOCAL statement_timeout = 0'))
@@ -0,0 +1,113 @@
+"""
+Shape-preserving downsampling for chart payloads.
+
+A chart a few hundred pixels wide cannot show 720 bars, so the API can reduce
+a series to `max_points` before sending it. Two methods are available:
+
+- 'lttb': Largest-Triangle-Three-Buckets, picks the bar in each bucket that
+  forms the largest triangle with its neighbours (best visual fidelity).
+- 'minmax': keeps the lowest and highest bar of each bucket, so no spike is
+  ever dropped.
+
+Both work on NumPy arrays and return indices into the original series, so
+bars keep their exact OHLCV values.
+"""
+
+from typing import Any, Callable, List, Optional, Sequence
+
+import numpy as np
+
+METHODS = ('lttb', 'minmax')
+
+# Never downsample below this many points; smaller requests are clamped
+MIN_POINTS = 3
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices selected by Largest-Triangle-Three-Buckets."""
+    n = len(x)
+    if n_out >= n or n_out < MIN_POINTS:
+        return np.arange(n)
+
+    # First and last points are always kept; the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    # Average of every bucket, used as the third triangle vertex for the bucket before it
+    bucket_ids = np.searchsorted(edges, np.arange(1, n - 1), side='right') - 1
+    counts = np.bincount(bucket_ids, minlength=n_out - 2).astype(np.float64)
+    counts[counts == 0] = 1
+    avg_x = np.bincount(bucket_ids, weights=x[1:n - 1], minlength=n_out - 2) / counts
+    avg_y = np.bincount(bucket_ids, weights=y[1:n - 1], minlength=n_out - 2) / counts
+    avg_x = np.append(avg_x, x[-1])
+    avg_y = np.append(avg_y, y[-1])
+
+    a = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], max(edges[bucket + 1], edges[bucket] + 1)
+        bx, by = x[start:end], y[start:end]
+        cx, cy = avg_x[bucket + 1], avg_y[bucket + 1]
+        areas = np.abs((x[a] - cx) * (by - y[a]) - (x[a] - bx) * (cy - y[a]))
+        a = start + int(np.argmax(areas))
+        selected[bucket + 1] = a
+
+    return selected
+
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices of the min and max of each bucket, in time order (about n_out points)."""
+    n = len(y)
+    if n_out >= n or n_out < MIN_POINTS:
+        return np.arange(n)
+
+    n_buckets = max(1, n_out // 2)
+    edges = np.linspace(0, n, n_buckets + 1).astype(np.int64)
+    starts = edges[:-1]
+    bucket_ids = np.repeat(np.arange(n_buckets), np.diff(edges))
+
+    # Sort by (bucket, value) once; the first and last entry of each bucket are its min and max
+    order = np.lexsort((y, bucket_ids))
+    ends = edges[1:] - 1
+    mins = order[starts]
+    maxs = order[ends]
+
+    selected = np.unique(np.concatenate(([0, n - 1], mins, maxs)))
+    return selected
+
+
+def select_indices(x: Sequence[float], y: Sequence[float], max_points: int, method: str = 'lttb') -> np.ndarray:
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    max_points = max(MIN_POINTS, max_points)
+    if method == 'minmax':
+        return minmax_indices(y, max_points)
+    return lttb_indices(x, y, max_points)
+
+
+def downsample(items: List[Any], max_points: Optional[int], y_fn: Callable[[Any], float],
+               x_fn: Optional[Callable[[Any], float]] = None, method: str = 'lttb') -> List[Any]:
+    """
+    Reduce `items` to about `max_points`, keeping the original elements.
+
+    Without `x_fn`, items are treated as evenly spaced and their position is used as x.
+    """
+    if not max_points or len(items) <= max_points:
+        return items
+    n = len(items)
+    y = np.fromiter((y_fn(item) for item in items), dtype=np.float64, count=n)
+    x = np.arange(n, dtype=np.float64) if x_fn is None else np.fromiter(
+        (x_fn(item) for item in items), dtype=np.float64, count=n)
+    return [items[i] for i in select_indices(x, y, max_points, method)]
+
+
+def downsample_bars(bars: List[Any], max_points: Optional[int], method: str = 'lttb', compact: bool = False) -> List[Any]:
+    """
+    Downsample price bars on their close price.
+
+    `bars` are dicts as returned by get_cached_prices, or [t, o, h, l, c, v] rows
+    when `compact`.
+    """
+    close_fn = (lambda bar: bar[4]) if compact else (lambda bar: bar['close'])
+    return downsample(bars, max_points, close_fn, method=method)
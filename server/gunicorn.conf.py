@@ -0,0 +1,94 @@
+"""
+Gunicorn settings, read automatically from the working directory.
+
+Each worker is a separate process, so Prometheus metrics are written to files
+under PROMETHEUS_MULTIPROC_DIR and summed at scrape time (see metrics.py).
+
+Workers are threaded (gthread): requests mostly wait on the database or on
+the price stream, so a few threads per process serve far more concurrent
+requests than one sync worker per CPU. WEB_THREADS is exported so app.py sizes
+the connection pool to match. Every open /api/prices/stream connection holds a
+thread for as long as the client listens, so a worker only accepts
+PRICE_STREAM_MAX_SUBSCRIBERS of them (price_stream.py).
+
+WEB_WORKER_CLASS=gevent serves from an async worker instead, where a stream
+costs a greenlet rather than a thread. It is meant for a separate service that
+only serves the streams (the client's VITE_PRICE_STREAM_URL): one worker
+(WEB_CONCURRENCY=1) holds up to WEB_WORKER_CONNECTIONS of them and refreshes
+each topic once for all its viewers. The standard library and psycopg2 are
+made cooperative before the app is imported.
+
+The app is imported once in the master (preload_app) and the workers are
+forked from it, so the imported modules are shared copy-on-write instead of
+being loaded again by every worker. Nothing connects to the database at
+import; run `flask init-db` before starting a fresh database.
+"""
+
+import gc
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+multiproc_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                                      os.path.join(tempfile.gettempdir(), 'drawtrade-metrics'))
+# A preloaded app creates its metric files before on_starting runs
+os.makedirs(multiproc_dir, exist_ok=True)
+
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gthread')
+if worker_class == 'gevent':
+    # Before anything imports threading, socket or the app (preload_app)
+    from gevent import monkey
+    monkey.patch_all()
+    import psycopg2.extensions
+    import psycopg2.extras
+    psycopg2.extensions.set_wait_callback(psycopg2.extras.wait_select)
+
+    worker_connections = int(os.environ.get('WEB_WORKER_CONNECTIONS', 1000))
+    # Keep some connections for the ordinary requests that reach this service
+    os.environ.setdefault('PRICE_STREAM_MAX_SUBSCRIBERS', str(worker_connections - 50))
+
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.environ.setdefault('WEB_THREADS', '8'))
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+
+def on_starting(server):
+    # Files left by a previous master would be added to this one's counters
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def pre_fork(server, worker):
+    # Move everything the master imported out of the collector's reach, so
+    # collections in the worker do not touch (and copy) those shared pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    if not server.cfg.preload_app:
+        return
+    from app import app
+    from db import db
+    # Connections opened in the master must not be shared with the workers
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def worker_exit(server, worker):
+    # Write the score polls still buffered in this worker (score_buffer.py)
+    from app import app
+    import score_buffer
+    score_buffer.flush_in_context(app)
+
+
+def child_exit(server, worker):
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    # Drop the live gauges of the dead worker; its counters and histograms stay in the totals
+    multiprocess.mark_process_dead(worker.pid)
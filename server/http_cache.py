@@ -0,0 +1,197 @@
+"""
+Conditional GET support for polled read endpoints.
+
+Writers bump per-scope version counters in the `data_versions` table inside
+the same transaction as the data they change. Readers build an ETag from those
+counters with a single primary-key lookup and answer 304 before running the
+expensive query when the client's copy is still current.
+
+The scopes every prediction write touches (SHARED_PREDICTION_SCOPES) are the
+exception: bumped inside the write, their rows would stay locked until it
+commits and every financial transaction would queue behind the others. They
+are bumped after the write commits, in a short transaction of their own.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from flask import g, request, make_response
+
+from db import db, dialect_insert
+from models import DataVersion
+
+logger = logging.getLogger(__name__)
+
+# Bumped by admin operations that rewrite many rows; part of every ETag
+GLOBAL_SCOPE = 'global'
+# Any prediction created, scored or settled
+PREDICTIONS_SCOPE = 'predictions'
+# Anything that can move a leaderboard row: scores, rewards, balances
+LEADERBOARD_SCOPE = 'leaderboard'
+# Bumped by every prediction write, with bump_shared_versions()
+SHARED_PREDICTION_SCOPES = (PREDICTIONS_SCOPE, LEADERBOARD_SCOPE)
+
+
+def user_scope(user_id) -> str:
+    return f'user:{user_id}'
+
+
+def symbol_predictions_scope(symbol: str) -> str:
+    return f'predictions:{symbol}'
+
+
+def prices_scope(symbol: str, interval: str) -> str:
+    return f'prices:{symbol}:{interval}'
+
+
+def prediction_scopes(symbol: str, user_id) -> List[str]:
+    """
+    Scopes touched when a prediction is created, scored or settled, bumped in
+    its transaction. SHARED_PREDICTION_SCOPES follow once it commits.
+    """
+    scopes = [symbol_predictions_scope(symbol)]
+    if user_id:
+        scopes.append(user_scope(user_id))
+    return scopes
+
+
+def bump_versions(*scopes: str):
+    """
+    Increment the version of each scope in the current session's transaction.
+
+    Callers commit as usual; readers see the new version exactly when the data does.
+    """
+    now = datetime.utcnow()
+    # Sorted, so transactions bumping overlapping scopes lock their rows in the same order
+    scopes = sorted(set(scopes))
+    if not scopes:
+        return
+    stmt = dialect_insert(DataVersion.__table__)
+    if stmt is not None:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[DataVersion.scope],
+            set_={'version': DataVersion.version + 1, 'updated_at': now},
+        )
+        # One executemany, so bumping every user's scope is a single round of batched statements
+        db.session.execute(stmt, [{'scope': scope, 'version': 1, 'updated_at': now} for scope in scopes])
+        return
+    for scope in scopes:
+        updated = DataVersion.query.filter_by(scope=scope).update(
+            {'version': DataVersion.version + 1, 'updated_at': now}, synchronize_session=False)
+        if not updated:
+            db.session.add(DataVersion(scope=scope, version=1, updated_at=now))
+
+
+def bump_shared_versions(*scopes: str):
+    """
+    Increment the version of each scope in a transaction of its own and commit.
+
+    Called after the write that changed the data committed. Until then readers
+    may get the new data under the old version; their next poll picks up the
+    new one. A failure is logged rather than raised, as the write already
+    succeeded.
+    """
+    try:
+        bump_versions(*scopes)
+        db.session.commit()
+    except Exception as e:
+        logger.error(f"Bumping versions of {', '.join(scopes)} failed: {e}")
+        db.session.rollback()
+
+
+def get_versions(scopes: Iterable[str]) -> Dict[str, DataVersion]:
+    scopes = list(scopes)
+    rows = DataVersion.query.filter(DataVersion.scope.in_(scopes)).all()
+    return {row.scope: row for row in rows}
+
+
+class BodyCache:
+    """Small thread-safe LRU of serialized response bodies, keyed by ETag."""
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.items: 'OrderedDict[str, bytes]' = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Optional[str]) -> Optional[bytes]:
+        if key is None:
+            return None
+        with self.lock:
+            body = self.items.get(key)
+            if body is not None:
+                self.items.move_to_end(key)
+            return body
+
+    def put(self, key: Optional[str], body: bytes):
+        if key is None:
+            return
+        with self.lock:
+            self.items[key] = body
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+
+def compute_etag(scopes: List[str], ttl: Optional[int] = None, vary: str = '') -> Tuple[str, Optional[datetime]]:
+    """Weak ETag over the request URL, scope versions and an optional time bucket."""
+    versions = get_versions(scopes)
+    parts = [request.full_path, vary]
+    last_modified = None
+    for scope in scopes:
+        row = versions.get(scope)
+        parts.append(f'{scope}={row.version if row else 0}')
+        if row and row.updated_at and (last_modified is None or row.updated_at > last_modified):
+            last_modified = row.updated_at
+    if ttl:
+        parts.append(f't={int(time.time() // ttl)}')
+    digest = hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()[:20]
+    return digest, last_modified
+
+
+def conditional(scopes_fn: Callable[..., List[str]], ttl: Union[int, Callable[..., int], None] = None,
+                vary_fn: Optional[Callable[[], str]] = None):
+    """
+    Answer 304 Not Modified when none of the view's data scopes changed.
+
+    `scopes_fn` receives the view's keyword arguments and returns the scopes the
+    response depends on. `ttl` (seconds, or a callable taking the same arguments)
+    also expires the tag for responses that contain time-derived fields such as
+    progress, or that refresh stale caches.
+    `vary_fn` adds per-caller input (e.g. the user id) to the tag.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            scopes = [GLOBAL_SCOPE, *scopes_fn(**kwargs)]
+            effective_ttl = ttl(**kwargs) if callable(ttl) else ttl
+            etag, last_modified = compute_etag(scopes, effective_ttl, vary_fn() if vary_fn else '')
+            # The tag identifies the response body, so views can use it as a cache key
+            g.etag = etag
+
+            not_modified = False
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            elif request.if_modified_since and last_modified and not effective_ttl:
+                not_modified = last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+
+            if not_modified:
+                response = make_response('', 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)
+            if last_modified:
+                response.last_modified = last_modified
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.vary.update(('Authorization', 'Cookie'))
+            return response
+        return decorated_function
+    return decorator
@@ -0,0 +1,146 @@
+"""
+Per-request SQL instrumentation.
+
+SQLAlchemy engine events count every statement a request executes and time
+it. When the response leaves, the totals are added as headers
+
+    Server-Timing: db;dur=812.4;desc="402 queries", app;dur=1452.8
+    X-Query-Count: 402
+
+and written as one logfmt line on the `instrumentation` logger. A request over
+its query-count or latency budget is logged at WARNING together with its
+slowest statements, which is usually enough to spot an N+1 loop. Statements
+slower than SLOW_QUERY_MS are logged on their own, also outside requests.
+
+Budgets come from REQUEST_QUERY_BUDGET / REQUEST_LATENCY_BUDGET_MS and can be
+raised for individual views with @request_budget.
+"""
+
+import heapq
+import logging
+import os
+import re
+import time
+from typing import Callable, List, Optional, Tuple
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+from db import db
+
+logger = logging.getLogger('instrumentation')
+
+QUERY_BUDGET = int(os.environ.get('REQUEST_QUERY_BUDGET', 50))
+LATENCY_BUDGET_MS = float(os.environ.get('REQUEST_LATENCY_BUDGET_MS', 1000))
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 250))
+
+# Slowest statements kept per request for the budget warning
+SLOWEST_KEPT = 3
+STATEMENT_PREVIEW = 200
+
+QUERY_COUNT_HEADER = 'X-Query-Count'
+
+WHITESPACE = re.compile(r'\s+')
+
+
+def request_budget(queries: Optional[int] = None, latency_ms: Optional[float] = None) -> Callable:
+    """Override the query-count and/or latency budget of one view."""
+    def decorator(f):
+        f.request_budget = (queries, latency_ms)
+        return f
+    return decorator
+
+
+class RequestStats:
+    """SQL totals of the current request."""
+
+    __slots__ = ('started', 'queries', 'db_seconds', 'slowest')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slowest: List[Tuple[float, str]] = []
+
+    def add(self, seconds: float, statement: str):
+        self.queries += 1
+        self.db_seconds += seconds
+        entry = (seconds, statement)
+        if len(self.slowest) < SLOWEST_KEPT:
+            heapq.heappush(self.slowest, entry)
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+
+def preview(statement: str) -> str:
+    statement = WHITESPACE.sub(' ', statement).strip()
+    return statement if len(statement) <= STATEMENT_PREVIEW else statement[:STATEMENT_PREVIEW] + '...'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    pending = conn.info.get('query_started')
+    if not pending:
+        return
+    started = pending.pop()
+    seconds = time.perf_counter() - started
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        logger.warning(f"Slow query ({seconds * 1000:.1f} ms): {preview(statement)}")
+    if has_request_context():
+        stats = g.get('request_stats')
+        if stats is not None:
+            stats.add(seconds, statement)
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('query_started'):
+        connection.info['query_started'].pop()
+
+
+def _budgets() -> Tuple[int, float]:
+    view = current_app.view_functions.get(request.endpoint) if request.endpoint else None
+    queries, latency_ms = getattr(view, 'request_budget', (None, None))
+    return queries or QUERY_BUDGET, latency_ms or LATENCY_BUDGET_MS
+
+
+def init_instrumentation(app):
+    """Count and time SQL per request, report it in headers and logs, and warn over budget."""
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(db.engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(db.engine, 'handle_error', _handle_error)
+
+    @app.before_request
+    def start_request_stats():
+        g.request_stats = RequestStats()
+
+    @app.after_request
+    def report_request_stats(response):
+        stats = g.get('request_stats')
+        if stats is None:
+            return response
+        elapsed_ms = (time.perf_counter() - stats.started) * 1000
+        db_ms = stats.db_seconds * 1000
+
+        response.headers.add('Server-Timing', f'db;dur={db_ms:.1f};desc="{stats.queries} queries"')
+        response.headers.add('Server-Timing', f'app;dur={elapsed_ms:.1f}')
+        response.headers[QUERY_COUNT_HEADER] = str(stats.queries)
+
+        line = (f"request method={request.method} path={request.path} endpoint={request.endpoint} "
+                f"status={response.status_code} ms={elapsed_ms:.1f} queries={stats.queries} db_ms={db_ms:.1f}")
+        query_budget, latency_budget = _budgets()
+        if stats.queries > query_budget or elapsed_ms > latency_budget:
+            slowest = '; '.join(f"{seconds * 1000:.1f} ms {preview(statement)}"
+                                for seconds, statement in sorted(stats.slowest, reverse=True))
+            logger.warning(f"{line} over_budget=queries:{query_budget},ms:{latency_budget:g} slowest=[{slowest}]")
+        else:
+            logger.info(line)
+        return response
+
+    logger.info(f"Request instrumentation: budget {QUERY_BUDGET} queries / {LATENCY_BUDGET_MS:g} ms, "
+                f"slow query log over {SLOW_QUERY_MS:g} ms")
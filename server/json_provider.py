@@ -0,0 +1,116 @@
+"""
+Fast JSON encoding and response compression for the API.
+
+Flask's default provider runs every response through the stdlib encoder. With
+orjson installed, responses are encoded straight to bytes (datetimes and NumPy
+values natively); without it we fall back to Flask's behaviour unchanged.
+Large JSON bodies are compressed with Brotli (if the `Brotli` package is
+installed) or gzip, depending on what the client accepts.
+"""
+
+import gzip
+import json
+import logging
+from typing import Any
+
+from flask import current_app, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Responses smaller than this are not worth compressing
+DEFAULT_COMPRESS_MIN_SIZE = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+JSON_MIMETYPE = 'application/json'
+
+
+def _default(obj: Any) -> Any:
+    """Encode values orjson does not handle natively (NumPy scalars, Decimal, UUID, ...)."""
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    return DefaultJSONProvider.default(obj)
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """Serialize to UTF-8 JSON bytes, e.g. to cache a response body for reuse."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson when available."""
+
+    sort_keys = False
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if orjson is None or kwargs:
+            kwargs.setdefault('default', _default)
+            return super().dumps(obj, **kwargs)
+        return dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        if orjson is None or self._app.debug:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
+
+
+def json_bytes_response(body: bytes, status: int = 200):
+    """Response for an already-serialized JSON body (e.g. from a cache)."""
+    return current_app.response_class(body, status=status, mimetype=JSON_MIMETYPE)
+
+
+def compress_response(response, min_size: int = DEFAULT_COMPRESS_MIN_SIZE):
+    """Compress a large JSON response with the best encoding the client accepts."""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype != JSON_MIMETYPE or 'Content-Encoding' in response.headers):
+        return response
+
+    body = response.get_data()
+    if len(body) < min_size:
+        return response
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        encoded, encoding = brotli.compress(body, quality=BROTLI_QUALITY), 'br'
+    elif accepted['gzip']:
+        encoded, encoding = gzip.compress(body, compresslevel=GZIP_LEVEL), 'gzip'
+    else:
+        return response
+
+    response.set_data(encoded)
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_json(app):
+    """Install the fast JSON provider and response compression on the app."""
+    app.json_provider_class = FastJSONProvider
+    app.json = FastJSONProvider(app)
+    min_size = app.config.get('JSON_COMPRESS_MIN_SIZE', DEFAULT_COMPRESS_MIN_SIZE)
+
+    @app.after_request
+    def compress_json_response(response):
+        return compress_response(response, min_size)
+
+    logger.info(f"JSON encoder: {'orjson' if orjson else 'stdlib'}, "
+                f"compression: {'br+gzip' if brotli else 'gzip'} over {min_size} bytes")
@@ -0,0 +1,89 @@
+"""
+Token balance changes and their ledger.
+
+A balance is never read into Python, changed and written back: two requests
+of the same user would both start from the old balance and one change would
+be lost. Every change is one conditional UPDATE instead,
+
+    UPDATE users SET token_balance = token_balance - :stake
+    WHERE id = :id AND token_balance >= :stake
+    RETURNING token_balance
+
+so concurrent changes apply one after the other on the row, a stake the
+balance does not cover is refused rather than overdrawn, and the row lock is
+only held for the rest of that request's transaction.
+
+Every change appends a TokenLedger row in the same transaction, so the
+ledger cannot disagree with the balances; the rows are flushed with the
+transaction's other inserts on commit, and a bulk reset writes its rows with
+one INSERT ... SELECT per chunk.
+
+Settling a prediction is claimed the same way, by moving its status off
+'active' with a conditional UPDATE, so a prediction scored and closed at the
+same time pays out once.
+"""
+
+from datetime import datetime
+from typing import Iterable, Optional
+
+from sqlalchemy import insert, literal, select, update
+from sqlalchemy.orm.attributes import set_committed_value
+
+from db import db
+from models import User, Prediction, TokenLedger
+
+
+def _change(user_id: str, amount: int, reason: str, prediction: Optional[Prediction], *criteria) -> Optional[int]:
+    stmt = update(User).where(User.id == user_id, *criteria).values(token_balance=User.token_balance + amount)
+    options = {'synchronize_session': False}
+    if db.session.get_bind().dialect.update_returning:
+        balance = db.session.execute(stmt.returning(User.token_balance), execution_options=options).scalar()
+    else:
+        # The UPDATE holds the row lock, so reading the balance back in this transaction is exact
+        updated = db.session.execute(stmt, execution_options=options).rowcount
+        balance = db.session.execute(select(User.token_balance).where(User.id == user_id)).scalar() if updated else None
+    if balance is not None and amount:
+        # `prediction` may not be inserted yet; the flush writes it first
+        db.session.add(TokenLedger(user_id=user_id, prediction=prediction, reason=reason, amount=amount,
+                                   balance_after=balance))
+    return balance
+
+
+def debit(user_id: str, amount: int, reason: str, prediction: Optional[Prediction] = None) -> Optional[int]:
+    """
+    Take `amount` from a balance that covers it. Returns the new balance, or
+    None (and changes nothing) if it does not. Caller commits.
+    """
+    return _change(user_id, -amount, reason, prediction, User.token_balance >= amount)
+
+
+def credit(user_id: str, amount: int, reason: str, prediction: Optional[Prediction] = None) -> Optional[int]:
+    """Add `amount` to a balance. Returns the new balance, or None if the user is gone. Caller commits."""
+    return _change(user_id, amount, reason, prediction)
+
+
+def settle(prediction: Prediction, status: str, rewards: int) -> bool:
+    """
+    Move an active prediction to `status` with `rewards`. False if another
+    request settled it first; only the request that gets True may pay out.
+    Caller commits.
+    """
+    claimed = Prediction.query.filter_by(id=prediction.id, status='active').update(
+        {'status': status, 'rewards_earned': rewards}, synchronize_session=False)
+    if claimed:
+        set_committed_value(prediction, 'status', status)
+        set_committed_value(prediction, 'rewards_earned', rewards)
+    return bool(claimed)
+
+
+def record_resets(user_ids: Iterable[str], balance: int):
+    """
+    Ledger rows for setting the balances of `user_ids` to `balance`, written
+    before the reset itself. Locks the users until the caller commits.
+    """
+    user_ids = list(user_ids)
+    db.session.query(User.id).filter(User.id.in_(user_ids)).order_by(User.id).with_for_update().all()
+    rows = select(User.id, literal('reset'), literal(balance) - User.token_balance, literal(balance),
+                  literal(datetime.utcnow())).where(User.id.in_(user_ids), User.token_balance != balance)
+    db.session.execute(insert(TokenLedger).from_select(
+        ['user_id', 'reason', 'amount', 'balance_after', 'created_at'], rows))
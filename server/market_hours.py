@@ -0,0 +1,79 @@
+"""
+Trading session helpers.
+
+Crypto trades around the clock; everything else follows the regular US
+session, 9:30 AM - 4:00 PM America/New_York, Monday-Friday. Twelve Data
+returns bar timestamps in exchange-local time, so stored (naive) stock bars
+already sit on this clock.
+"""
+
+from datetime import datetime, time, timedelta
+
+import pytz
+
+EASTERN = pytz.timezone('America/New_York')
+SESSION_OPEN = time(9, 30)
+SESSION_CLOSE = time(16, 0)
+
+
+def is_crypto(symbol):
+    """Check if a symbol is a cryptocurrency."""
+    return '-USD' in symbol.upper() or symbol.upper() in ['BTC', 'ETH', 'USDT', 'BNB', 'SOL', 'XRP', 'DOGE']
+
+
+def is_market_open(symbol):
+    """
+    Check if the market is currently open for the given symbol.
+    Crypto markets are always open.
+    US stock market hours: 9:30 AM - 4:00 PM ET, Monday-Friday.
+    Futures have extended hours but we'll use regular hours for simplicity.
+    """
+    if is_crypto(symbol):
+        return True
+
+    # Get current time in Eastern timezone
+    now = datetime.now(EASTERN)
+
+    # Check if it's a weekend
+    if now.weekday() >= 5:  # Saturday = 5, Sunday = 6
+        return False
+
+    # Check market hours (9:30 AM - 4:00 PM ET)
+    market_open = now.replace(hour=SESSION_OPEN.hour, minute=SESSION_OPEN.minute, second=0, microsecond=0)
+    market_close = now.replace(hour=SESSION_CLOSE.hour, minute=SESSION_CLOSE.minute, second=0, microsecond=0)
+
+    return market_open <= now <= market_close
+
+
+def get_next_market_open(symbol):
+    """Get the next market open time for a symbol."""
+    if is_crypto(symbol):
+        return None  # Always open
+
+    now = datetime.now(EASTERN)
+
+    # Find next weekday at 9:30 AM
+    next_open = now.replace(hour=SESSION_OPEN.hour, minute=SESSION_OPEN.minute, second=0, microsecond=0)
+
+    # If we're past market close today, move to next day
+    market_close = now.replace(hour=SESSION_CLOSE.hour, minute=SESSION_CLOSE.minute, second=0, microsecond=0)
+    if now >= market_close or now >= next_open:
+        next_open += timedelta(days=1)
+
+    # Skip weekends
+    while next_open.weekday() >= 5:
+        next_open += timedelta(days=1)
+
+    return next_open.isoformat()
+
+
+def session_bounds_seconds(symbol):
+    """
+    Session open and close as seconds after local midnight, or None for 24/7 markets.
+
+    Used to align intraday rollups so no bar straddles the open or close.
+    """
+    if is_crypto(symbol):
+        return None
+    return (SESSION_OPEN.hour * 3600 + SESSION_OPEN.minute * 60,
+            SESSION_CLOSE.hour * 3600 + SESSION_CLOSE.minute * 60)
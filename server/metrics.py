@@ -0,0 +1,162 @@
+"""
+Prometheus metrics for the request, price cache, upstream and scoring paths.
+
+Served at /metrics in the Prometheus text format. Under gunicorn every worker
+is its own process, so with PROMETHEUS_MULTIPROC_DIR set (gunicorn.conf.py sets
+it) values are kept in per-process files in that directory and /metrics
+aggregates all of them; without it the process-local default registry is used.
+
+Requires prometheus_client; without it every metric is a no-op and /metrics
+answers 501.
+"""
+
+import logging
+import os
+import time
+from typing import Optional, Tuple
+
+from flask import Response, g, request
+from sqlalchemy.pool import QueuePool
+
+try:
+    import prometheus_client
+    from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, multiprocess
+except ImportError:  # pragma: no cover - optional dependency
+    prometheus_client = None
+
+logger = logging.getLogger(__name__)
+
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Latency buckets (seconds) for requests and upstream calls; scoring is much faster
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+
+class _NoopMetric:
+    """Stands in for every metric when prometheus_client is not installed."""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def observe(self, value):
+        pass
+
+    def time(self):
+        return _NoopTimer()
+
+
+class _NoopTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def _metric(kind: str, name: str, documentation: str, labelnames: Tuple[str, ...] = (), **kwargs):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return {'counter': Counter, 'gauge': Gauge, 'histogram': Histogram}[kind](
+        name, documentation, labelnames, **kwargs)
+
+
+REQUEST_LATENCY = _metric('histogram', 'drawtrade_http_request_duration_seconds',
+                          'Request latency by route', ('method', 'route', 'status'), buckets=REQUEST_BUCKETS)
+
+PRICE_SOURCE = _metric('counter', 'drawtrade_price_requests_total',
+                       'Price loads by where the bars came from (cache, rollup, twelve_data, cache_stale, yfinance)',
+                       ('source',))
+
+UPSTREAM_LATENCY = _metric('histogram', 'drawtrade_upstream_request_duration_seconds',
+                           'Market data provider call latency', ('provider',), buckets=REQUEST_BUCKETS)
+UPSTREAM_ERRORS = _metric('counter', 'drawtrade_upstream_errors_total',
+                          'Failed market data provider calls', ('provider', 'reason'))
+
+PRICE_ROWS_STORED = _metric('counter', 'drawtrade_price_rows_stored_total',
+                            'Bars written to price_data; rate() gives rows per second', ('source',))
+PRICE_STORE_DURATION = _metric('histogram', 'drawtrade_price_store_duration_seconds',
+                               'Time to write one batch of bars to price_data', ('source',), buckets=REQUEST_BUCKETS)
+
+SCORING_DURATION = _metric('histogram', 'drawtrade_scoring_duration_seconds',
+                           'Scoring and settlement time, including the commit', ('operation',),
+                           buckets=FAST_BUCKETS)
+
+POOL_CHECKOUT_WAIT = _metric('histogram', 'drawtrade_db_pool_checkout_seconds',
+                             'Time to get a connection from the SQLAlchemy pool', buckets=FAST_BUCKETS)
+POOL_CHECKED_OUT = _metric('gauge', 'drawtrade_db_pool_checked_out', 'Connections currently checked out',
+                           **({'multiprocess_mode': 'livesum'} if prometheus_client else {}))
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited."""
+
+    def connect(self):
+        started = time.perf_counter()
+        connection = super().connect()
+        POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+        return connection
+
+
+def _on_checkout(*args):
+    POOL_CHECKED_OUT.inc()
+
+
+def _on_checkin(*args):
+    POOL_CHECKED_OUT.dec()
+
+
+def render() -> Optional[Tuple[bytes, str]]:
+    """Current metrics in the text exposition format, aggregated over workers when multiprocess."""
+    if prometheus_client is None:
+        return None
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def init_metrics(app):
+    """Time every request by route, track pool usage and serve /metrics."""
+    from sqlalchemy import event
+    from db import db
+
+    with app.app_context():
+        event.listen(db.engine, 'checkout', _on_checkout)
+        event.listen(db.engine, 'checkin', _on_checkin)
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        started = g.get('metrics_started')
+        if started is not None:
+            # The rule, not the path, so /api/prices/AAPL and /api/prices/MSFT share a series
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            REQUEST_LATENCY.labels(request.method, route, str(response.status_code)).observe(
+                time.perf_counter() - started)
+        return response
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+            return Response('Forbidden\n', status=403, mimetype='text/plain')
+        rendered = render()
+        if rendered is None:
+            return Response('prometheus_client is not installed\n', status=501, mimetype='text/plain')
+        body, content_type = rendered
+        return Response(body, content_type=content_type)
+
+    logger.info(f"Metrics: {'disabled (no prometheus_client)' if prometheus_client is None else 'enabled'}"
+                f"{', multiprocess in ' + MULTIPROC_DIR if MULTIPROC_DIR and prometheus_client else ''}")
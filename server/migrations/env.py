@@ -0,0 +1,65 @@
+"""
+Alembic environment for the app's database.
+
+The URL and the target metadata come from the Flask app, so migrations always
+run against DATABASE_URL. `flask init-db` (schema.py) passes its own
+connection in config.attributes; the `alembic` command line imports the app
+and connects itself.
+"""
+
+from logging.config import fileConfig
+
+from alembic import context
+
+config = context.config
+
+
+def _configure(connection):
+    from db import db
+    import models  # noqa: F401 - registers the tables on db.metadata
+
+    context.configure(
+        connection=connection,
+        target_metadata=db.metadata,
+        # SQLite cannot ALTER most things; batch mode recreates the table instead
+        render_as_batch=connection.dialect.name == 'sqlite',
+        compare_type=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_offline():
+    """Emit the SQL instead of running it (`alembic upgrade head --sql`)."""
+    from app import app
+    from db import db
+
+    context.configure(
+        url=app.config['SQLALCHEMY_DATABASE_URI'],
+        target_metadata=db.metadata,
+        literal_binds=True,
+        dialect_opts={'paramstyle': 'named'},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    connection = config.attributes.get('connection')
+    if connection is not None:
+        _configure(connection)
+        return
+
+    if config.config_file_name is not None:
+        fileConfig(config.config_file_name)
+    from app import app
+    from db import db
+
+    with app.app_context(), db.engine.connect() as connection:
+        _configure(connection)
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,117 @@
+"""Baseline schema: the tables db.create_all() built before migrations existed
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 07:47:43.114829
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('meta_predictions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('symbol', sa.String(length=20), nullable=False),
+    sa.Column('price_series', sa.Text(), nullable=False),
+    sa.Column('prediction_count', sa.Integer(), nullable=True),
+    sa.Column('last_updated', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('symbol', name='unique_meta_prediction_symbol')
+    )
+    op.create_index('ix_meta_predictions_symbol', 'meta_predictions', ['symbol'], unique=False)
+    op.create_table('price_data',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('symbol', sa.String(length=20), nullable=False),
+    sa.Column('interval', sa.String(length=10), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.Column('open', sa.Float(), nullable=False),
+    sa.Column('high', sa.Float(), nullable=False),
+    sa.Column('low', sa.Float(), nullable=False),
+    sa.Column('close', sa.Float(), nullable=False),
+    sa.Column('volume', sa.BigInteger(), nullable=True),
+    sa.Column('fetched_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('symbol', 'interval', 'timestamp', name='unique_price_point')
+    )
+    op.create_index('idx_symbol_interval_timestamp', 'price_data', ['symbol', 'interval', 'timestamp'], unique=False)
+    op.create_index('ix_price_data_symbol', 'price_data', ['symbol'], unique=False)
+    op.create_index('ix_price_data_timestamp', 'price_data', ['timestamp'], unique=False)
+    op.create_table('users',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('email', sa.String(), nullable=False),
+    sa.Column('password_hash', sa.String(length=256), nullable=False),
+    sa.Column('first_name', sa.String(), nullable=True),
+    sa.Column('last_name', sa.String(), nullable=True),
+    sa.Column('profile_image_url', sa.String(), nullable=True),
+    sa.Column('token_balance', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('email')
+    )
+    op.create_table('predictions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.String(), nullable=True),
+    sa.Column('symbol', sa.String(length=20), nullable=False),
+    sa.Column('asset_name', sa.String(length=100), nullable=True),
+    sa.Column('timeframe', sa.String(length=20), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('start_price', sa.Float(), nullable=False),
+    sa.Column('end_price', sa.Float(), nullable=False),
+    sa.Column('price_series', sa.Text(), nullable=False),
+    sa.Column('staked_tokens', sa.Integer(), nullable=False),
+    sa.Column('accuracy_score', sa.Float(), nullable=True),
+    sa.Column('contrarian_score', sa.Float(), nullable=True),
+    sa.Column('rewards_earned', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_predictions_symbol', 'predictions', ['symbol'], unique=False)
+    op.create_table('user_performance_history',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('recorded_at', sa.DateTime(), nullable=False),
+    sa.Column('token_balance', sa.Integer(), nullable=False),
+    sa.Column('total_predictions', sa.Integer(), nullable=True),
+    sa.Column('completed_predictions', sa.Integer(), nullable=True),
+    sa.Column('mean_mspe', sa.Float(), nullable=True),
+    sa.Column('time_weighted_mspe', sa.Float(), nullable=True),
+    sa.Column('total_staked', sa.Integer(), nullable=True),
+    sa.Column('total_rewards', sa.Integer(), nullable=True),
+    sa.Column('profit_loss', sa.Integer(), nullable=True),
+    sa.Column('rank', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_user_performance_time', 'user_performance_history', ['user_id', 'recorded_at'], unique=False)
+    op.create_index('ix_user_performance_history_recorded_at', 'user_performance_history', ['recorded_at'], unique=False)
+    op.create_index('ix_user_performance_history_user_id', 'user_performance_history', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_user_performance_history_user_id', table_name='user_performance_history')
+    op.drop_index('ix_user_performance_history_recorded_at', table_name='user_performance_history')
+    op.drop_index('idx_user_performance_time', table_name='user_performance_history')
+    op.drop_table('user_performance_history')
+    op.drop_index('ix_predictions_symbol', table_name='predictions')
+    op.drop_table('predictions')
+    op.drop_table('users')
+    op.drop_index('ix_price_data_timestamp', table_name='price_data')
+    op.drop_index('ix_price_data_symbol', table_name='price_data')
+    op.drop_index('idx_symbol_interval_timestamp', table_name='price_data')
+    op.drop_table('price_data')
+    op.drop_index('ix_meta_predictions_symbol', table_name='meta_predictions')
+    op.drop_table('meta_predictions')
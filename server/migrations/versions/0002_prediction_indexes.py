@@ -0,0 +1,59 @@
+"""Composite, partial and expression indexes for the hot Prediction queries
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 07:52:10.412663
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, Sequence[str], None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SCORED = "accuracy_score IS NOT NULL"
+ACTIVE = "status = 'active'"
+SETTLED = "status IN ('completed', 'closed')"
+
+INDEXES = [
+    ('idx_predictions_user_created', ['user_id', 'created_at'], None),
+    ('idx_predictions_symbol_timeframe_created', ['symbol', 'timeframe', 'created_at'], None),
+    ('idx_predictions_scored_user', ['user_id', 'accuracy_score'], SCORED),
+    ('idx_predictions_active_user', ['user_id'], ACTIVE),
+    ('idx_predictions_profit', [sa.text('(rewards_earned - staked_tokens) DESC')], SETTLED),
+]
+
+
+def _concurrently() -> bool:
+    # Build without locking writes on PostgreSQL; needs to run outside a transaction
+    return op.get_bind().dialect.name == 'postgresql'
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    concurrently = _concurrently()
+    with op.get_context().autocommit_block():
+        for name, columns, where in INDEXES:
+            condition = sa.text(where) if where else None
+            op.create_index(name, 'predictions', columns, unique=False, if_not_exists=True,
+                            postgresql_where=condition, sqlite_where=condition,
+                            postgresql_concurrently=concurrently)
+        # Lookups by symbol alone use the prefix of the composite index
+        op.drop_index('ix_predictions_symbol', table_name='predictions', if_exists=True,
+                      postgresql_concurrently=concurrently)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    concurrently = _concurrently()
+    with op.get_context().autocommit_block():
+        op.create_index('ix_predictions_symbol', 'predictions', ['symbol'], unique=False, if_not_exists=True,
+                        postgresql_concurrently=concurrently)
+        for name, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name='predictions', if_exists=True, postgresql_concurrently=concurrently)
@@ -0,0 +1,44 @@
+"""Per-user prediction statistics (user_stats.py fills it on `flask init-db`)
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 07:55:03.431102
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, Sequence[str], None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('user_stats',
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('total_predictions', sa.Integer(), nullable=False),
+    sa.Column('active_predictions', sa.Integer(), nullable=False),
+    sa.Column('completed_predictions', sa.Integer(), nullable=False),
+    sa.Column('total_staked', sa.BigInteger(), nullable=False),
+    sa.Column('total_rewards', sa.BigInteger(), nullable=False),
+    sa.Column('scored_predictions', sa.Integer(), nullable=False),
+    sa.Column('scored_staked', sa.BigInteger(), nullable=False),
+    sa.Column('scored_rewards', sa.BigInteger(), nullable=False),
+    sa.Column('mspe_sum', sa.Float(), nullable=False),
+    sa.Column('tw_mspe_sum', sa.Float(), nullable=False),
+    sa.Column('tw_weight_sum', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('user_stats')
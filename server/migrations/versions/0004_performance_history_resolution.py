@@ -0,0 +1,30 @@
+"""Resolution of each performance snapshot, for tiered compaction
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 07:59:19.945423
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, Sequence[str], None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('user_performance_history', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('resolution', sa.String(length=10), server_default='raw', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('user_performance_history', schema=None) as batch_op:
+        batch_op.drop_column('resolution')
@@ -0,0 +1,46 @@
+"""Append-only token ledger (ledger.py writes a row per balance change)
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 08:17:02.868206
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, Sequence[str], None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('token_ledger',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('prediction_id', sa.Integer(), nullable=True),
+    sa.Column('reason', sa.String(length=20), nullable=False),
+    sa.Column('amount', sa.Integer(), nullable=False),
+    sa.Column('balance_after', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['prediction_id'], ['predictions.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('token_ledger', schema=None) as batch_op:
+        batch_op.create_index('idx_token_ledger_prediction', ['prediction_id'], unique=False)
+        batch_op.create_index('idx_token_ledger_user_created', ['user_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('token_ledger', schema=None) as batch_op:
+        batch_op.drop_index('idx_token_ledger_user_created')
+        batch_op.drop_index('idx_token_ledger_prediction')
+
+    op.drop_table('token_ledger')
@@ -0,0 +1,38 @@
+"""Cache version counters (http_cache.py)
+
+Not part of the baseline: databases created before migrations existed may
+or may not have the table, depending on the code that created them.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 09:02:11.504318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, Sequence[str], None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if sa.inspect(op.get_bind()).has_table('data_versions'):
+        return
+    op.create_table('data_versions',
+    sa.Column('scope', sa.String(length=120), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('scope')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('data_versions')
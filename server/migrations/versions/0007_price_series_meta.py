@@ -0,0 +1,46 @@
+"""Per-series price metadata (price_meta.py fills it on `flask init-db`)
+
+Not part of the baseline: databases created before migrations existed may
+or may not have the table, depending on the code that created them.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19 09:02:48.117962
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, Sequence[str], None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if sa.inspect(op.get_bind()).has_table('price_series_meta'):
+        return
+    op.create_table('price_series_meta',
+    sa.Column('symbol', sa.String(length=20), nullable=False),
+    sa.Column('interval', sa.String(length=10), nullable=False),
+    sa.Column('last_fetched_at', sa.DateTime(), nullable=True),
+    sa.Column('oldest_timestamp', sa.DateTime(), nullable=True),
+    sa.Column('newest_timestamp', sa.DateTime(), nullable=True),
+    sa.Column('bar_count', sa.Integer(), nullable=False),
+    sa.Column('source', sa.String(length=20), nullable=True),
+    sa.Column('last_error', sa.String(length=500), nullable=True),
+    sa.Column('last_error_at', sa.DateTime(), nullable=True),
+    sa.Column('consecutive_errors', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('symbol', 'interval')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('price_series_meta')
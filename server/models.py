@@ -6,6 +6,13 @@ from db import db
 
 DEFAULT_TOKEN_BALANCE = 100
 
+# Predicates of the partial indexes on predictions. A query can only use such an
+# index when it repeats the predicate literally (SQLite does not match bound
+# parameters against it), so queries filter with db.text() of the same string.
+SCORED_PREDICATE = 'accuracy_score IS NOT NULL'
+ACTIVE_PREDICATE = "status = 'active'"
+SETTLED_PREDICATE = "status IN ('completed', 'closed')"
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
     id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
@@ -26,7 +33,7 @@ class Prediction(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String, db.ForeignKey('users.id'), nullable=True)
-    symbol = db.Column(db.String(20), nullable=False, index=True)
+    symbol = db.Column(db.String(20), nullable=False)
     asset_name = db.Column(db.String(100), nullable=True)
     timeframe = db.Column(db.String(20), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -39,6 +46,23 @@ class Prediction(db.Model):
     rewards_earned = db.Column(db.Integer, default=0, nullable=False)
     status = db.Column(db.String(20), default='active')
 
+    # Access paths of the hot queries; `flask explain-queries` checks the planner uses them
+    __table_args__ = (
+        # A user's predictions, newest first
+        db.Index('idx_predictions_user_created', 'user_id', 'created_at'),
+        # Predictions for a symbol and timeframe, newest first (replaces the index on symbol alone)
+        db.Index('idx_predictions_symbol_timeframe_created', 'symbol', 'timeframe', 'created_at'),
+        # Users with scored predictions (leaderboard)
+        db.Index('idx_predictions_scored_user', 'user_id', 'accuracy_score',
+                 postgresql_where=db.text(SCORED_PREDICATE), sqlite_where=db.text(SCORED_PREDICATE)),
+        # Open positions, a small slice of the table
+        db.Index('idx_predictions_active_user', 'user_id',
+                 postgresql_where=db.text(ACTIVE_PREDICATE), sqlite_where=db.text(ACTIVE_PREDICATE)),
+        # Most profitable settled trades
+        db.Index('idx_predictions_profit', db.text('(rewards_earned - staked_tokens) DESC'),
+                 postgresql_where=db.text(SETTLED_PREDICATE), sqlite_where=db.text(SETTLED_PREDICATE)),
+    )
+
 
 class MetaPrediction(db.Model):
     """Aggregated community prediction for each symbol."""
@@ -92,7 +116,94 @@ class UserPerformanceHistory(db.Model):
     total_rewards = db.Column(db.Integer, default=0)
     profit_loss = db.Column(db.Integer, default=0)
     rank = db.Column(db.Integer, nullable=True)
+    # raw, or day / week once compacted to one snapshot per bucket (performance_history.py)
+    resolution = db.Column(db.String(10), default='raw', server_default='raw', nullable=False)
 
     __table_args__ = (
         db.Index('idx_user_performance_time', 'user_id', 'recorded_at'),
     )
+
+
+class DataVersion(db.Model):
+    """Cheap change counters used to build ETags without re-running the underlying queries."""
+    __tablename__ = 'data_versions'
+
+    scope = db.Column(db.String(120), primary_key=True)  # e.g. 'predictions:AAPL', 'user:<id>'
+    version = db.Column(db.BigInteger, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class PriceSeriesMeta(db.Model):
+    """Per-(symbol, interval) state of the price cache, maintained alongside PriceData writes."""
+    __tablename__ = 'price_series_meta'
+
+    symbol = db.Column(db.String(20), primary_key=True)
+    interval = db.Column(db.String(10), primary_key=True)
+    last_fetched_at = db.Column(db.DateTime, nullable=True)  # Last successful upstream fetch or rollup
+    oldest_timestamp = db.Column(db.DateTime, nullable=True)
+    newest_timestamp = db.Column(db.DateTime, nullable=True)
+    bar_count = db.Column(db.Integer, default=0, nullable=False)
+    source = db.Column(db.String(20), nullable=True)  # twelve_data, rollup
+    last_error = db.Column(db.String(500), nullable=True)
+    last_error_at = db.Column(db.DateTime, nullable=True)
+    consecutive_errors = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class UserStats(db.Model):
+    """
+    Running per-user totals over their predictions, updated in the same
+    transaction as every prediction write (see user_stats.py).
+    """
+    __tablename__ = 'user_stats'
+
+    user_id = db.Column(db.String, db.ForeignKey('users.id'), primary_key=True)
+    total_predictions = db.Column(db.Integer, default=0, nullable=False)
+    active_predictions = db.Column(db.Integer, default=0, nullable=False)
+    completed_predictions = db.Column(db.Integer, default=0, nullable=False)  # Completed or closed
+    total_staked = db.Column(db.BigInteger, default=0, nullable=False)
+    total_rewards = db.Column(db.BigInteger, default=0, nullable=False)
+    # Over scored predictions only (accuracy_score set)
+    scored_predictions = db.Column(db.Integer, default=0, nullable=False)
+    scored_staked = db.Column(db.BigInteger, default=0, nullable=False)
+    scored_rewards = db.Column(db.BigInteger, default=0, nullable=False)
+    mspe_sum = db.Column(db.Float, default=0.0, nullable=False)
+    # Σ(weight * mspe) and Σ(weight), weights growing from a fixed epoch (user_stats.TW_EPOCH)
+    tw_mspe_sum = db.Column(db.Float, default=0.0, nullable=False)
+    tw_weight_sum = db.Column(db.Float, default=0.0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def mean_mspe(self):
+        return self.mspe_sum / self.scored_predictions if self.scored_predictions else None
+
+    @property
+    def time_weighted_mspe(self):
+        return self.tw_mspe_sum / self.tw_weight_sum if self.tw_weight_sum else None
+
+    @property
+    def profit_loss(self):
+        return self.total_rewards - self.total_staked
+
+
+class TokenLedger(db.Model):
+    """
+    Append-only record of every token_balance change, written in the same
+    transaction as the change (see ledger.py).
+    """
+    __tablename__ = 'token_ledger'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String, db.ForeignKey('users.id'), nullable=False)
+    prediction_id = db.Column(db.Integer, db.ForeignKey('predictions.id'), nullable=True)
+    reason = db.Column(db.String(20), nullable=False)  # stake, reward, payoff or reset
+    amount = db.Column(db.Integer, nullable=False)  # Signed change of the balance
+    balance_after = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    prediction = db.relationship('Prediction')
+
+    __table_args__ = (
+        db.Index('idx_token_ledger_user_created', 'user_id', 'created_at'),
+        db.Index('idx_token_ledger_prediction', 'prediction_id'),
+    )
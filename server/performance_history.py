@@ -0,0 +1,219 @@
+"""
+Windowed reads and tiered compaction of user performance snapshots.
+
+A snapshot is recorded per user on every cron run, forever. Reads are
+bounded: a request covers a since/until window, reads at most
+MAX_HISTORY_ROWS snapshots through idx_user_performance_time (newest first,
+with a cursor to page further back) and downsamples them to `max_points`.
+
+record_snapshots() takes the snapshot of every user at once: one query over
+user_stats, NumPy for the MSPE ratios and ranks, one bulk insert.
+
+Old snapshots are compacted like price bars (retention.py): after a week only
+the last snapshot of each day is kept, after 90 days the last of each week.
+Snapshot values are running totals at the time they were taken, so the last
+one of a bucket is its rollup. Each row records its resolution, so a run only
+looks at rows that have not been compacted to their tier yet.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import insert
+
+from db import db, DEFAULT_CHUNK_SIZE
+from downsample import select_indices
+from http_cache import bump_versions, user_scope
+from models import User, UserPerformanceHistory, UserStats
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_POINTS = 500
+MAX_POINTS = 2000
+MAX_HISTORY_ROWS = 5000
+
+# (age, resolution): snapshots older than `age` keep one per resolution bucket.
+# Coarsest first, so rows that skipped a tier go straight to the coarser one.
+COMPACTION_TIERS = [
+    (timedelta(days=90), 'week'),
+    (timedelta(days=7), 'day'),
+]
+RESOLUTIONS = ('raw', 'day', 'week')
+
+# Series drawn by the account page chart; downsampling keeps the shape of each
+CHART_METRICS = ('token_balance', 'profit_loss', 'time_weighted_mspe', 'rank')
+
+
+def bucket_start(recorded_at: datetime, resolution: str) -> datetime:
+    day = recorded_at.replace(hour=0, minute=0, second=0, microsecond=0)
+    if resolution == 'week':
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def to_dict(h: UserPerformanceHistory) -> Dict[str, Any]:
+    return {
+        'recordedAt': h.recorded_at.isoformat(),
+        'tokenBalance': h.token_balance,
+        'totalPredictions': h.total_predictions,
+        'completedPredictions': h.completed_predictions,
+        'meanMspe': h.mean_mspe,
+        'timeWeightedMspe': h.time_weighted_mspe,
+        'totalStaked': h.total_staked,
+        'totalRewards': h.total_rewards,
+        'profitLoss': h.profit_loss,
+        'rank': h.rank
+    }
+
+
+def window_query(user_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """Snapshots of a user within [since, until], newest first (idx_user_performance_time)."""
+    query = UserPerformanceHistory.query.filter(UserPerformanceHistory.user_id == user_id)
+    if since is not None:
+        query = query.filter(UserPerformanceHistory.recorded_at >= since)
+    if until is not None:
+        query = query.filter(UserPerformanceHistory.recorded_at <= until)
+    return query.order_by(UserPerformanceHistory.recorded_at.desc())
+
+
+def load_window(user_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                limit: int = MAX_HISTORY_ROWS) -> Tuple[List[UserPerformanceHistory], bool]:
+    """
+    The newest `limit` snapshots of a user within [since, until], oldest first.
+
+    Also returns whether older snapshots in the window were left out.
+    """
+    rows = window_query(user_id, since, until).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    return rows[:limit][::-1], has_more
+
+
+def downsample_history(rows: List[UserPerformanceHistory], max_points: int) -> List[UserPerformanceHistory]:
+    """Reduce `rows` to at most `max_points`, splitting the budget over the chart metrics."""
+    if len(rows) <= max_points:
+        return rows
+    x = [h.recorded_at.timestamp() for h in rows]
+    per_metric = max(3, max_points // len(CHART_METRICS))
+    selected = set()
+    for metric in CHART_METRICS:
+        y = [getattr(h, metric) or 0 for h in rows]
+        selected.update(int(i) for i in select_indices(x, y, per_metric))
+    return [rows[i] for i in sorted(selected)]
+
+
+def ranks(values: np.ndarray) -> np.ndarray:
+    """1-based rank of each value among the non-NaN ones, lowest first (ties share a rank); 0 for NaN."""
+    ranked = ~np.isnan(values)
+    ordered = np.sort(values[ranked])
+    result = np.zeros(len(values), dtype=np.int64)
+    result[ranked] = np.searchsorted(ordered, values[ranked], side='left') + 1
+    return result
+
+
+def record_snapshots(now: Optional[datetime] = None) -> int:
+    """
+    Record a snapshot for every user with predictions in one transaction.
+
+    Totals come from user_stats; rank is by time-weighted MSPE as in
+    user_stats.rank(). Returns the number of snapshots recorded.
+    """
+    now = now or datetime.utcnow()
+    rows = db.session.query(
+        UserStats.user_id, User.token_balance, UserStats.total_predictions, UserStats.completed_predictions,
+        UserStats.scored_predictions, UserStats.mspe_sum, UserStats.tw_mspe_sum, UserStats.tw_weight_sum,
+        UserStats.total_staked, UserStats.total_rewards,
+    ).join(User, User.id == UserStats.user_id).filter(UserStats.total_predictions > 0).all()
+    if not rows:
+        return 0
+
+    (user_ids, balances, totals, completed, scored, mspe_sums, tw_mspe_sums, tw_weight_sums,
+     staked, rewards) = zip(*rows)
+    scored = np.array(scored, dtype=np.float64)
+    tw_weight_sums = np.array(tw_weight_sums, dtype=np.float64)
+    mean_mspe = np.divide(mspe_sums, scored, out=np.full(len(rows), np.nan), where=scored > 0)
+    tw_mspe = np.divide(tw_mspe_sums, tw_weight_sums, out=np.full(len(rows), np.nan), where=tw_weight_sums > 0)
+    rank = ranks(tw_mspe)
+
+    snapshots = [{
+        'user_id': user_id,
+        'recorded_at': now,
+        'token_balance': balance,
+        'total_predictions': total,
+        'completed_predictions': done,
+        'mean_mspe': None if np.isnan(mean) else mean,
+        'time_weighted_mspe': None if np.isnan(tw) else tw,
+        'total_staked': user_staked,
+        'total_rewards': user_rewards,
+        'profit_loss': user_rewards - user_staked,
+        'rank': position or None,
+        'resolution': 'raw',
+    } for user_id, balance, total, done, user_staked, user_rewards, mean, tw, position in zip(
+        user_ids, balances, totals, completed, staked, rewards, mean_mspe.tolist(), tw_mspe.tolist(), rank.tolist())]
+
+    # Table-level insert: batched multi-row VALUES, without fetching back every new id
+    db.session.execute(insert(UserPerformanceHistory.__table__), snapshots)
+    bump_versions(*(user_scope(user_id) for user_id in user_ids))
+    db.session.commit()
+    logger.info(f"Recorded {len(snapshots)} performance snapshots")
+    return len(snapshots)
+
+
+def compact_user(user_id: str, resolution: str, cutoff: datetime) -> Tuple[int, int]:
+    """Keep the last snapshot of each `resolution` bucket before `cutoff` for one user. Caller commits."""
+    finer = RESOLUTIONS[:RESOLUTIONS.index(resolution)]
+    rows = db.session.query(UserPerformanceHistory.id, UserPerformanceHistory.recorded_at).filter(
+        UserPerformanceHistory.user_id == user_id,
+        UserPerformanceHistory.recorded_at < cutoff,
+        UserPerformanceHistory.resolution.in_(finer),
+    ).order_by(UserPerformanceHistory.recorded_at, UserPerformanceHistory.id).all()
+
+    # Rows are in time order, so the last one seen per bucket is the one kept
+    last = {bucket_start(recorded_at, resolution): row_id for row_id, recorded_at in rows}
+    keep = set(last.values())
+    drop = [row_id for row_id, _ in rows if row_id not in keep]
+    keep = list(keep)
+    # Bounded IN lists: a user that was never compacted can have years of snapshots
+    for start in range(0, len(keep), DEFAULT_CHUNK_SIZE):
+        ids = keep[start:start + DEFAULT_CHUNK_SIZE]
+        UserPerformanceHistory.query.filter(UserPerformanceHistory.id.in_(ids)).update(
+            {'resolution': resolution}, synchronize_session=False)
+    for start in range(0, len(drop), DEFAULT_CHUNK_SIZE):
+        ids = drop[start:start + DEFAULT_CHUNK_SIZE]
+        UserPerformanceHistory.query.filter(UserPerformanceHistory.id.in_(ids)).delete(synchronize_session=False)
+    if drop:
+        # Cached history bodies of this user are stale now
+        bump_versions(user_scope(user_id))
+    return len(keep), len(drop)
+
+
+def compact(now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Apply COMPACTION_TIERS to every user's snapshots, one committed transaction
+    per user. Returns rows kept and deleted per tier.
+    """
+    now = now or datetime.utcnow()
+    report = {'tiers': {}, 'rowsDeleted': 0}
+    for age, resolution in COMPACTION_TIERS:
+        # Cut on a bucket boundary so a bucket is never split between runs
+        cutoff = bucket_start(now - age, resolution)
+        finer = RESOLUTIONS[:RESOLUTIONS.index(resolution)]
+        user_ids = [row[0] for row in db.session.query(UserPerformanceHistory.user_id).filter(
+            UserPerformanceHistory.recorded_at < cutoff,
+            UserPerformanceHistory.resolution.in_(finer),
+        ).distinct().all()]
+
+        kept = deleted = 0
+        for user_id in user_ids:
+            user_kept, user_deleted = compact_user(user_id, resolution, cutoff)
+            db.session.commit()
+            kept += user_kept
+            deleted += user_deleted
+
+        report['tiers'][resolution] = {'cutoff': cutoff.isoformat(), 'users': len(user_ids),
+                                       'rowsKept': kept, 'rowsDeleted': deleted}
+        report['rowsDeleted'] += deleted
+
+    logger.info(f"Performance history compaction deleted {report['rowsDeleted']} snapshots")
+    return report
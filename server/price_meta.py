@@ -0,0 +1,207 @@
+"""
+Per-series metadata for the price cache.
+
+One PriceSeriesMeta row per (symbol, interval) records when the series was
+last fetched, its oldest and newest bar, how many bars are cached, where they
+came from and the state of the last upstream call. Every write to PriceData
+updates it in the same transaction, so freshness checks, cache stats and
+upstream backoff are primary-key lookups instead of scans over price_data.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import case, func
+
+from db import db, dialect_insert, without_statement_timeout
+from models import PriceData, PriceSeriesMeta
+
+logger = logging.getLogger(__name__)
+
+# Upstream backoff after consecutive failures: doubles per failure, capped
+BACKOFF_BASE = timedelta(seconds=30)
+BACKOFF_MAX = timedelta(minutes=15)
+
+MAX_ERROR_LENGTH = 500
+
+
+def get_meta(symbol: str, interval: str) -> Optional[PriceSeriesMeta]:
+    """Metadata for one series, or None if it was never stored."""
+    return db.session.get(PriceSeriesMeta, (symbol, interval))
+
+
+def _upsert(symbol: str, interval: str, insert_values: Dict[str, Any], update_values: Dict[str, Any]):
+    """Insert the row for (symbol, interval) or apply `update_values` to it. Caller commits."""
+    stmt = dialect_insert(PriceSeriesMeta)
+    if stmt is not None:
+        stmt = stmt.values(symbol=symbol, interval=interval, **insert_values).on_conflict_do_update(
+            index_elements=[PriceSeriesMeta.symbol, PriceSeriesMeta.interval],
+            set_=update_values,
+        )
+        db.session.execute(stmt)
+        return
+
+    updated = PriceSeriesMeta.query.filter_by(symbol=symbol, interval=interval).update(
+        update_values, synchronize_session=False)
+    if not updated:
+        db.session.add(PriceSeriesMeta(symbol=symbol, interval=interval, **insert_values))
+
+
+def record_bars(symbol: str, interval: str, inserted: int, oldest: Optional[datetime],
+                newest: Optional[datetime], source: str, fetched: bool = True):
+    """
+    Account for bars written to PriceData (caller commits).
+
+    `inserted` counts new rows only; updated bars do not change the count.
+    With `fetched=False` (backfilled or compacted history) the series does not
+    become fresh and its source is left as it was.
+    """
+    now = datetime.utcnow()
+    insert_values = {
+        'bar_count': inserted,
+        'oldest_timestamp': oldest,
+        'newest_timestamp': newest,
+        'source': source,
+        'consecutive_errors': 0,
+        'updated_at': now,
+    }
+    update_values = {
+        'bar_count': PriceSeriesMeta.bar_count + inserted,
+        'updated_at': now,
+    }
+    if oldest is not None:
+        update_values['oldest_timestamp'] = case(
+            (PriceSeriesMeta.oldest_timestamp <= oldest, PriceSeriesMeta.oldest_timestamp), else_=oldest)
+    if newest is not None:
+        update_values['newest_timestamp'] = case(
+            (PriceSeriesMeta.newest_timestamp >= newest, PriceSeriesMeta.newest_timestamp), else_=newest)
+    if fetched:
+        insert_values['last_fetched_at'] = now
+        update_values.update({
+            'last_fetched_at': now,
+            'source': source,
+            'last_error': None,
+            'consecutive_errors': 0,
+        })
+    _upsert(symbol, interval, insert_values, update_values)
+
+
+def record_deleted(symbol: str, interval: str, deleted: int):
+    """Account for bars removed from PriceData (caller commits)."""
+    if not deleted:
+        return
+    # One index seek on idx_symbol_interval_timestamp
+    oldest = db.session.query(func.min(PriceData.timestamp)).filter(
+        PriceData.symbol == symbol,
+        PriceData.interval == interval,
+    ).scalar()
+    values = {
+        'bar_count': case((PriceSeriesMeta.bar_count > deleted, PriceSeriesMeta.bar_count - deleted), else_=0),
+        'oldest_timestamp': oldest,
+        'updated_at': datetime.utcnow(),
+    }
+    if oldest is None:
+        # Nothing left of the series
+        values.update({'bar_count': 0, 'newest_timestamp': None})
+    PriceSeriesMeta.query.filter_by(symbol=symbol, interval=interval).update(values, synchronize_session=False)
+
+
+def record_error(symbol: str, interval: str, message: str):
+    """Remember a failed upstream fetch for the series and commit it."""
+    now = datetime.utcnow()
+    message = (message or 'unknown error')[:MAX_ERROR_LENGTH]
+    try:
+        _upsert(symbol, interval, {
+            'bar_count': 0,
+            'last_error': message,
+            'last_error_at': now,
+            'consecutive_errors': 1,
+            'updated_at': now,
+        }, {
+            'last_error': message,
+            'last_error_at': now,
+            'consecutive_errors': PriceSeriesMeta.consecutive_errors + 1,
+            'updated_at': now,
+        })
+        db.session.commit()
+    except Exception as e:
+        logger.warning(f"Could not record upstream error for {symbol} @ {interval}: {e}")
+        db.session.rollback()
+
+
+def is_fresh(meta: Optional[PriceSeriesMeta], max_age: timedelta, now: Optional[datetime] = None) -> bool:
+    """True if the series was fetched less than `max_age` ago."""
+    if meta is None or meta.last_fetched_at is None:
+        return False
+    return (now or datetime.utcnow()) - meta.last_fetched_at < max_age
+
+
+def in_backoff(meta: Optional[PriceSeriesMeta], now: Optional[datetime] = None) -> bool:
+    """True if recent upstream failures mean the series should not be fetched again yet."""
+    if meta is None or not meta.consecutive_errors or meta.last_error_at is None:
+        return False
+    delay = min(BACKOFF_BASE * (2 ** (meta.consecutive_errors - 1)), BACKOFF_MAX)
+    return (now or datetime.utcnow()) - meta.last_error_at < delay
+
+
+def to_dict(meta: PriceSeriesMeta) -> Dict[str, Any]:
+    return {
+        'symbol': meta.symbol,
+        'interval': meta.interval,
+        'count': meta.bar_count,
+        'oldest': meta.oldest_timestamp.isoformat() if meta.oldest_timestamp else None,
+        'newest': meta.newest_timestamp.isoformat() if meta.newest_timestamp else None,
+        'lastFetchedAt': meta.last_fetched_at.isoformat() if meta.last_fetched_at else None,
+        'source': meta.source,
+        'lastError': meta.last_error,
+        'lastErrorAt': meta.last_error_at.isoformat() if meta.last_error_at else None,
+        'consecutiveErrors': meta.consecutive_errors,
+    }
+
+
+def all_series() -> List[PriceSeriesMeta]:
+    return PriceSeriesMeta.query.order_by(PriceSeriesMeta.symbol, PriceSeriesMeta.interval).all()
+
+
+def ensure_populated():
+    """Build the table once for a database that has price data but no metadata yet."""
+    if PriceSeriesMeta.query.first() is None and PriceData.query.first() is not None:
+        rebuild()
+
+
+def rebuild() -> int:
+    """
+    Recompute every row from price_data with one grouped scan and commit.
+
+    For databases populated before this table existed, or after counts drift.
+    Upstream error state is kept.
+    """
+    without_statement_timeout()
+    stats = db.session.query(
+        PriceData.symbol,
+        PriceData.interval,
+        func.count(PriceData.id),
+        func.min(PriceData.timestamp),
+        func.max(PriceData.timestamp),
+        func.max(PriceData.fetched_at),
+    ).group_by(PriceData.symbol, PriceData.interval).all()
+
+    existing = {(meta.symbol, meta.interval): meta for meta in PriceSeriesMeta.query.all()}
+    for symbol, interval, count, oldest, newest, last_fetched in stats:
+        meta = existing.pop((symbol, interval), None)
+        if meta is None:
+            meta = PriceSeriesMeta(symbol=symbol, interval=interval, consecutive_errors=0)
+            db.session.add(meta)
+        meta.bar_count = count
+        meta.oldest_timestamp = oldest
+        meta.newest_timestamp = newest
+        meta.last_fetched_at = last_fetched
+    for meta in existing.values():
+        meta.bar_count = 0
+        meta.oldest_timestamp = None
+        meta.newest_timestamp = None
+
+    db.session.commit()
+    logger.info(f"Rebuilt price series metadata for {len(stats)} series")
+    return len(stats)
@@ -0,0 +1,252 @@
+"""
+Server-Sent Events fan-out for live price updates.
+
+Instead of every chart polling /api/prices/<symbol> and re-downloading the
+whole window, a client subscribes to a (symbol, interval, period) topic. One
+refresher thread per topic reloads prices through the normal cache path and
+publishes only the bars that are new or changed since the previous refresh,
+so upstream and database load no longer scale with the number of viewers.
+
+Under the threaded gunicorn worker every open stream holds a request thread,
+so a process only accepts PRICE_STREAM_MAX_SUBSCRIBERS streams (default: half
+of WEB_THREADS) and answers further ones with 503; clients then poll
+/api/prices instead. Under an async worker (WEB_WORKER_CLASS=gevent, see
+gunicorn.conf.py) a stream costs a greenlet and the cap can be far higher.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Optional, List, Dict, Any, Callable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# How often a topic re-reads the price cache, per interval. The cache itself
+# decides whether that results in an upstream fetch.
+REFRESH_SECONDS = {
+    '1m': 15,
+    '5m': 30,
+    '15m': 60,
+    '30m': 60,
+    '1h': 120,
+    '4h': 300,
+    '1d': 600,
+    '1wk': 1800,
+    '1mo': 3600,
+}
+DEFAULT_REFRESH_SECONDS = 60
+
+# Events buffered per subscriber before it is considered too slow and dropped
+SUBSCRIBER_QUEUE_SIZE = 32
+
+# Open streams per process; 0 means no limit
+MAX_SUBSCRIBERS = int(os.environ.get('PRICE_STREAM_MAX_SUBSCRIBERS',
+                                     max(1, int(os.environ.get('WEB_THREADS', 8)) // 2)))
+
+TopicKey = Tuple[str, str, str]
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Encode a single Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def diff_bars(previous: List[Dict[str, Any]], current: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Return bars in `current` that are newer than, or differ from, `previous`."""
+    if not previous:
+        return list(current)
+
+    known = {bar['timestamp']: bar for bar in previous}
+    last_timestamp = previous[-1]['timestamp']
+    changed = []
+    for bar in current:
+        old = known.get(bar['timestamp'])
+        if old is None:
+            if bar['timestamp'] > last_timestamp:
+                changed.append(bar)
+        elif old != bar:
+            changed.append(bar)
+    return changed
+
+
+def summarize(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Chart bounds sent alongside every snapshot and delta."""
+    return {
+        'minPrice': payload.get('minPrice'),
+        'maxPrice': payload.get('maxPrice'),
+        'lastPrice': payload.get('lastPrice'),
+        'lastTimestamp': payload.get('lastTimestamp'),
+        'source': payload.get('source'),
+    }
+
+
+class Subscription:
+    """A single client's view of a topic."""
+
+    def __init__(self, topic: 'Topic'):
+        self.topic = topic
+        self.queue: 'queue.Queue[Tuple[str, Dict[str, Any]]]' = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.closed = False
+
+    def push(self, event: str, data: Dict[str, Any]) -> bool:
+        try:
+            self.queue.put_nowait((event, data))
+            return True
+        except queue.Full:
+            self.closed = True
+            return False
+
+    def get(self, timeout: float) -> Optional[Tuple[str, Dict[str, Any]]]:
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Topic:
+    """One upstream refresh loop shared by every subscriber of a (symbol, interval, period)."""
+
+    def __init__(self, hub: 'PriceStreamHub', key: TopicKey):
+        self.hub = hub
+        self.key = key
+        self.subscribers: List[Subscription] = []
+        self.payload: Optional[Dict[str, Any]] = None
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def refresh_seconds(self) -> int:
+        return REFRESH_SECONDS.get(self.key[1], DEFAULT_REFRESH_SECONDS)
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        symbol, interval, period = self.key
+        try:
+            payload = self.hub.run_loader(symbol, interval, period)
+        except Exception as e:
+            logger.error(f"Price stream refresh failed for {symbol} @ {interval}: {e}")
+            return None
+        if not payload or not payload.get('prices'):
+            return None
+        return payload
+
+    def snapshot(self) -> Optional[Dict[str, Any]]:
+        """Latest full payload, loading it on first use."""
+        with self.lock:
+            if self.payload is None:
+                self.payload = self.load()
+            return self.payload
+
+    def refresh(self):
+        payload = self.load()
+        if payload is None:
+            return
+
+        with self.lock:
+            previous = self.payload
+            self.payload = payload
+            subscribers = list(self.subscribers)
+
+        bars = diff_bars(previous['prices'] if previous else [], payload['prices'])
+        if not bars:
+            return
+
+        data = {'bars': bars, **summarize(payload)}
+        for subscriber in subscribers:
+            if not subscriber.push('bars', data):
+                logger.info(f"Dropping slow price stream subscriber on {self.key}")
+                self.hub.unsubscribe(subscriber)
+
+    def run(self):
+        while not self.stop_event.wait(self.refresh_seconds):
+            self.refresh()
+
+
+class PriceStreamHub:
+    """Registry of live topics. A topic's refresher thread runs only while it has subscribers."""
+
+    def __init__(self, loader: Callable[[str, str, str], Optional[Dict[str, Any]]], app=None,
+                 max_subscribers: int = MAX_SUBSCRIBERS):
+        self.loader = loader
+        self.app = app
+        self.max_subscribers = max_subscribers
+        self.subscriber_count = 0
+        self.topics: Dict[TopicKey, Topic] = {}
+        self.lock = threading.Lock()
+
+    def run_loader(self, symbol: str, interval: str, period: str) -> Optional[Dict[str, Any]]:
+        if self.app is None:
+            return self.loader(symbol, interval, period)
+        with self.app.app_context():
+            return self.loader(symbol, interval, period)
+
+    def subscribe(self, symbol: str, interval: str, period: str) -> Optional[Subscription]:
+        """Subscribe to a topic, or None if this process already serves `max_subscribers` streams."""
+        key = (symbol, interval, period)
+        with self.lock:
+            if self.max_subscribers and self.subscriber_count >= self.max_subscribers:
+                return None
+            self.subscriber_count += 1
+            topic = self.topics.get(key)
+            if topic is None:
+                topic = Topic(self, key)
+                self.topics[key] = topic
+            subscription = Subscription(topic)
+            topic.subscribers.append(subscription)
+            if topic.thread is None:
+                topic.thread = threading.Thread(target=topic.run, name=f"price-stream-{symbol}-{interval}",
+                                                daemon=True)
+                topic.thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscription.closed = True
+        topic = subscription.topic
+        with self.lock:
+            if subscription in topic.subscribers:
+                topic.subscribers.remove(subscription)
+                self.subscriber_count -= 1
+            if not topic.subscribers and self.topics.get(topic.key) is topic:
+                topic.stop_event.set()
+                del self.topics[topic.key]
+
+    def stream(self, subscription: Subscription, keepalive_seconds: float = 15, max_seconds: float = 300,
+               on_bars: Optional[Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]] = None):
+        """
+        Generator of SSE frames for one subscriber: the snapshot once, then deltas.
+
+        `on_bars` is called with each snapshot/delta payload and may return extra
+        data to emit as a `score` event. Streams end after `max_seconds`; the
+        browser's EventSource reconnects on its own and receives a fresh snapshot.
+        """
+        try:
+            yield f"retry: {int(keepalive_seconds * 1000)}\n\n"
+
+            payload = subscription.topic.snapshot()
+            if payload is None:
+                yield format_sse('error', {'error': 'No price data available'})
+                return
+
+            yield format_sse('snapshot', {'prices': payload['prices'], **summarize(payload)})
+            if on_bars:
+                score = on_bars(payload)
+                if score:
+                    yield format_sse('score', score)
+
+            deadline = time.monotonic() + max_seconds
+            while not subscription.closed and time.monotonic() < deadline:
+                message = subscription.get(timeout=keepalive_seconds)
+                if message is None:
+                    yield ": keepalive\n\n"
+                    continue
+                event, data = message
+                yield format_sse(event, data)
+                if event == 'bars' and on_bars:
+                    score = on_bars(data)
+                    if score:
+                        yield format_sse('score', score)
+        finally:
+            self.unsubscribe(subscription)
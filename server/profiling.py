@@ -0,0 +1,326 @@
+"""
+Opt-in sampling profiler for individual requests.
+
+A request is profiled when it carries a valid X-Profile-Token header, or when
+an admin has armed profiling for its path (POST /api/admin/profiling). While
+the view runs, a background thread samples the request thread's Python stack
+every PROFILE_INTERVAL_MS and counts identical stacks. The result is written
+to PROFILE_DIR in the folded format (`frame;frame;frame count` per line) that
+flamegraph.pl, speedscope and inferno read directly, with a JSON sidecar
+describing the request.
+
+Tokens are `<expires>:<hmac>` over the expiry and path, signed with
+PROFILE_SECRET (`flask profile-token PATH` prints one); without the secret
+only admin arming works. The arming rule lives in a file under PROFILE_DIR so
+every gunicorn worker on the host sees it and the profile budget is shared.
+Each process profiles at most PROFILE_MAX_PER_MINUTE requests, one at a time,
+and only the newest PROFILE_KEEP profiles are kept.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from flask import g, request
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'drawtrade-profiles'))
+PROFILE_SECRET = os.environ.get('PROFILE_SECRET')
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+PROFILE_MAX_PER_MINUTE = int(os.environ.get('PROFILE_MAX_PER_MINUTE', 6))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 200))
+
+TOKEN_HEADER = 'X-Profile-Token'
+# Longest validity a token may claim, so a leaked one cannot be used for long
+MAX_TOKEN_SECONDS = 3600
+
+ARMED_FILE = 'armed.json'
+PROFILE_ID = re.compile(r'^[0-9]{8}T[0-9]{12}-[0-9a-f]{8}$')
+
+
+def sign(path: str, expires: int, secret: Optional[str] = None) -> str:
+    """Token allowing requests to `path` to be profiled until `expires` (epoch seconds)."""
+    secret = secret or PROFILE_SECRET
+    if not secret:
+        raise RuntimeError('PROFILE_SECRET is not set')
+    digest = hmac.new(secret.encode(), f'{expires}:{path}'.encode(), hashlib.sha256).hexdigest()
+    return f'{expires}:{digest}'
+
+
+def token_valid(token: str, path: str) -> bool:
+    if not PROFILE_SECRET or not token:
+        return False
+    expires, _, _ = token.partition(':')
+    try:
+        expires_at = int(expires)
+    except ValueError:
+        return False
+    now = time.time()
+    if not now <= expires_at <= now + MAX_TOKEN_SECONDS:
+        return False
+    return hmac.compare_digest(token, sign(path, expires_at))
+
+
+class RateLimiter:
+    """Token bucket allowing `per_minute` profiles per process, one at a time."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = max(per_minute, 0)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.active = False
+        self.lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / 60)
+            self.updated = now
+            if self.active or self.tokens < 1:
+                return False
+            self.tokens -= 1
+            self.active = True
+            return True
+
+    def release(self):
+        with self.lock:
+            self.active = False
+
+
+def collapse(frame) -> str:
+    """One stack as `outer;...;inner` frame names."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler(threading.Thread):
+    """Samples one thread's stack at a fixed interval until stopped."""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            self.stacks[collapse(frame)] += 1
+            self.samples += 1
+            del frame
+
+    def stop(self) -> Counter:
+        self._stop_event.set()
+        self.join()
+        return self.stacks
+
+
+@contextmanager
+def _locked(path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.lock', 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class ArmedRule:
+    """Admin-armed profiling of the next N requests under a path prefix, shared through a file."""
+
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, ARMED_FILE)
+        self._cached: Optional[Dict[str, Any]] = None
+        self._mtime: Optional[float] = None
+
+    def _read(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def current(self) -> Optional[Dict[str, Any]]:
+        """The active rule; re-read only when the file changed (one stat per request)."""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            self._cached, self._mtime = None, None
+            return None
+        if mtime != self._mtime:
+            self._cached, self._mtime = self._read(), mtime
+        rule = self._cached
+        if rule and (rule['remaining'] <= 0 or rule['expiresAt'] < time.time()):
+            return None
+        return rule
+
+    def arm(self, prefix: str, count: int, minutes: float) -> Dict[str, Any]:
+        rule = {'prefix': prefix, 'remaining': count, 'expiresAt': time.time() + minutes * 60,
+                'armedAt': datetime.utcnow().isoformat()}
+        with _locked(self.path):
+            self._write(rule)
+        return rule
+
+    def disarm(self):
+        with _locked(self.path):
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def claim(self, path: str) -> bool:
+        """Take one profile from the rule if it matches `path`."""
+        rule = self.current()
+        if rule is None or not path.startswith(rule['prefix']):
+            return False
+        with _locked(self.path):
+            rule = self._read()
+            if not rule or rule['remaining'] <= 0 or rule['expiresAt'] < time.time():
+                return False
+            rule['remaining'] -= 1
+            self._write(rule)
+        return True
+
+    def _write(self, rule: Dict[str, Any]):
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(rule, f)
+        os.replace(tmp, self.path)
+
+
+class ProfileStore:
+    """Folded stacks plus a JSON sidecar per profile, newest PROFILE_KEEP kept."""
+
+    def __init__(self, directory: str, keep: int):
+        self.directory = directory
+        self.keep = keep
+
+    def save(self, stacks: Counter, info: Dict[str, Any]) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+        with open(os.path.join(self.directory, f'{profile_id}.folded'), 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        with open(os.path.join(self.directory, f'{profile_id}.json'), 'w') as f:
+            json.dump({'id': profile_id, **info}, f)
+        self.prune()
+        return profile_id
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Metadata of stored profiles, newest first."""
+        profiles = []
+        try:
+            names = sorted(os.listdir(self.directory), reverse=True)
+        except FileNotFoundError:
+            return []
+        for name in names:
+            if name.endswith('.json') and name != ARMED_FILE:
+                try:
+                    with open(os.path.join(self.directory, name)) as f:
+                        profiles.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return profiles
+
+    def folded_path(self, profile_id: str) -> Optional[str]:
+        if not PROFILE_ID.match(profile_id):
+            return None
+        path = os.path.join(self.directory, f'{profile_id}.folded')
+        return path if os.path.exists(path) else None
+
+    def prune(self):
+        ids = sorted(name[:-len('.folded')] for name in os.listdir(self.directory) if name.endswith('.folded'))
+        for profile_id in ids[:max(len(ids) - self.keep, 0)]:
+            for extension in ('.folded', '.json'):
+                try:
+                    os.remove(os.path.join(self.directory, profile_id + extension))
+                except FileNotFoundError:
+                    pass
+
+
+limiter = RateLimiter(PROFILE_MAX_PER_MINUTE)
+armed = ArmedRule(PROFILE_DIR)
+store = ProfileStore(PROFILE_DIR, PROFILE_KEEP)
+
+
+def init_profiling(app):
+    """Profile requests that carry a valid token or match the armed rule."""
+
+    @app.before_request
+    def start_profile():
+        token = request.headers.get(TOKEN_HEADER)
+        if token:
+            trigger = 'token' if token_valid(token, request.path) else None
+        else:
+            rule = armed.current()
+            trigger = 'armed' if rule is not None and request.path.startswith(rule['prefix']) else None
+        if trigger is None or not limiter.acquire():
+            return
+        if trigger == 'armed' and not armed.claim(request.path):
+            limiter.release()
+            return
+        sampler = StackSampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000)
+        g.profile = {'sampler': sampler, 'trigger': trigger, 'started': time.perf_counter()}
+        sampler.start()
+
+    @app.after_request
+    def mark_profile_status(response):
+        profile = g.get('profile')
+        if profile is not None:
+            profile['status'] = response.status_code
+            response.headers['X-Profile-Captured'] = '1'
+        return response
+
+    @app.teardown_request
+    def finish_profile(exc):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return
+        try:
+            stacks = profile['sampler'].stop()
+            profile_id = store.save(stacks, {
+                'method': request.method,
+                'path': request.path,
+                'endpoint': request.endpoint,
+                'status': profile.get('status', 500),
+                'trigger': profile['trigger'],
+                'durationMs': round((time.perf_counter() - profile['started']) * 1000, 1),
+                'samples': profile['sampler'].samples,
+                'intervalMs': PROFILE_INTERVAL_MS,
+                'createdAt': datetime.utcnow().isoformat(),
+                'pid': os.getpid(),
+            })
+            logger.info(f"Captured profile {profile_id} for {request.method} {request.path}")
+        except OSError as e:
+            logger.error(f"Saving profile failed: {e}")
+        finally:
+            limiter.release()
@@ -0,0 +1,106 @@
+"""
+Query plan checks for the hot Prediction and performance history queries.
+
+Each entry mirrors a query the API runs and names the index it should use.
+`flask explain-queries` prints the plan of each query on the configured
+database (EXPLAIN on PostgreSQL, EXPLAIN QUERY PLAN on SQLite) and exits
+non-zero when one of them does not use its index or scans a whole table, so a
+dropped or unusable index shows up before it shows up in latency.
+tests/test_query_plans.py runs the same check on SQLite, and on PostgreSQL
+when TEST_DATABASE_URL is set.
+
+PostgreSQL prefers a sequential scan on small tables whatever the indexes,
+so sequential scans are disabled for the EXPLAIN: the check is whether the
+index can serve the query, not whether the planner picks it on this data.
+"""
+
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+
+from sqlalchemy import text
+
+from db import db
+from models import Prediction, SETTLED_PREDICATE
+import performance_history
+
+SAMPLE_USER = 'user-id'
+SAMPLE_SYMBOL = 'AAPL'
+SAMPLE_TIMEFRAME = 'daily'
+
+
+class HotQuery(NamedTuple):
+    name: str
+    build: Callable[[], Any]
+    indexes: Tuple[str, ...]  # Any of these satisfies the check
+
+
+HOT_QUERIES: List[HotQuery] = [
+    # /api/user/predictions, /api/user/predictions/detailed
+    HotQuery('user_predictions', lambda: Prediction.query.filter_by(
+        user_id=SAMPLE_USER).order_by(Prediction.created_at.desc()),
+        ('idx_predictions_user_created',)),
+    # /api/predictions/<symbol>
+    HotQuery('symbol_predictions', lambda: Prediction.query.filter_by(
+        symbol=SAMPLE_SYMBOL, timeframe=SAMPLE_TIMEFRAME).order_by(Prediction.created_at.desc()).limit(100),
+        ('idx_predictions_symbol_timeframe_created',)),
+    # /api/user/prediction/<symbol>
+    HotQuery('user_latest_prediction', lambda: Prediction.query.filter_by(
+        user_id=SAMPLE_USER, symbol=SAMPLE_SYMBOL, timeframe=SAMPLE_TIMEFRAME).order_by(
+        Prediction.created_at.desc()).limit(1),
+        ('idx_predictions_user_created', 'idx_predictions_symbol_timeframe_created')),
+    # Leaderboard and rank: users with scored predictions
+    HotQuery('scored_users', lambda: db.session.query(Prediction.user_id).filter(
+        Prediction.user_id.isnot(None), Prediction.accuracy_score.isnot(None)).distinct(),
+        ('idx_predictions_scored_user',)),
+    HotQuery('user_scored_predictions', lambda: Prediction.query.filter(
+        Prediction.user_id == SAMPLE_USER, Prediction.accuracy_score.isnot(None)),
+        ('idx_predictions_scored_user', 'idx_predictions_user_created')),
+    # Open positions of a user
+    HotQuery('user_active_predictions', lambda: Prediction.query.filter(
+        Prediction.user_id == SAMPLE_USER, Prediction.status == 'active'),
+        ('idx_predictions_active_user', 'idx_predictions_user_created')),
+    # /api/top-profitable
+    HotQuery('top_profitable', lambda: Prediction.query.filter(
+        db.text(SETTLED_PREDICATE),
+        Prediction.rewards_earned.isnot(None),
+        Prediction.user_id.isnot(None)).order_by(
+        (Prediction.rewards_earned - Prediction.staked_tokens).desc()).limit(20),
+        ('idx_predictions_profit',)),
+    # /api/user/performance-history
+    HotQuery('user_performance_window', lambda: performance_history.window_query(
+        SAMPLE_USER, datetime(2026, 1, 1), datetime(2026, 2, 1)).limit(performance_history.MAX_HISTORY_ROWS + 1),
+        ('idx_user_performance_time',)),
+]
+
+
+def explain(query) -> List[str]:
+    """Plan lines of `query` on the current database."""
+    bind = db.session.get_bind()
+    statement = query.statement.compile(bind, compile_kwargs={'literal_binds': True})
+    if bind.dialect.name == 'postgresql':
+        db.session.execute(text('SET LOCAL enable_seqscan = off'))
+        rows = db.session.execute(text(f'EXPLAIN {statement}')).all()
+        lines = [row[0] for row in rows]
+    else:
+        rows = db.session.execute(text(f'EXPLAIN QUERY PLAN {statement}')).all()
+        lines = [row[-1] for row in rows]
+    db.session.rollback()
+    return lines
+
+
+def sequential_scans(plan: List[str]) -> List[str]:
+    """Plan lines that read a whole table rather than an index."""
+    return [line for line in plan
+            if 'Seq Scan' in line or (line.lstrip().startswith('SCAN ') and ' USING ' not in line)]
+
+
+def check() -> List[Dict[str, Any]]:
+    """Plan of every hot query, the expected index it uses, if any, and its sequential scans."""
+    results = []
+    for hot in HOT_QUERIES:
+        plan = explain(hot.build())
+        used = next((index for index in hot.indexes if any(index in line for line in plan)), None)
+        scans = sequential_scans(plan)
+        results.append({'name': hot.name, 'ok': used is not None and not scans, 'index': used,
+                        'expected': hot.indexes, 'seq_scans': scans, 'plan': plan})
+    return results
@@ -0,0 +1,143 @@
+"""
+Tiered retention for cached price data.
+
+Fine bars are only useful for recent charts, coarse bars for long history.
+Each interval has its own retention; before bars expire they are compacted
+into the next coarser tier that is kept longer (1min -> 5min -> 1h -> 1day),
+so history is never lost, only reduced in resolution. Deletes run in small
+committed chunks so ingestion is never blocked behind one long DELETE.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import func, text
+
+from db import db, delete_in_chunks, DEFAULT_CHUNK_SIZE
+from models import PriceData, PriceSeriesMeta
+import price_meta
+import rollup
+
+logger = logging.getLogger(__name__)
+
+# How long bars of each interval are kept. Intervals not listed are kept forever.
+RETENTION_POLICY = {
+    '1min': timedelta(days=7),
+    '5min': timedelta(days=30),
+    '15min': timedelta(days=60),
+    '30min': timedelta(days=90),
+    '1h': timedelta(days=365),
+    '4h': timedelta(days=730),
+}
+
+# Where expiring bars are compacted to before deletion; each target outlives its source
+COMPACT_INTO = {
+    '1min': '5min',
+    '5min': '1h',
+    '15min': '1h',
+    '30min': '1h',
+    '1h': '1day',
+    '4h': '1day',
+}
+
+# Rough on-disk size of a price_data row including its indexes, used when the
+# database cannot tell us (SQLite)
+ESTIMATED_ROW_BYTES = 160
+
+
+def estimate_row_bytes() -> int:
+    """Average bytes per price_data row, including indexes."""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        size, rows = db.session.execute(text(
+            "SELECT pg_total_relation_size('price_data'), reltuples FROM pg_class WHERE relname = 'price_data'"
+        )).one()
+        if rows and rows > 0:
+            return int(size / rows)
+    return ESTIMATED_ROW_BYTES
+
+
+def compact_expiring(symbol: str, interval: str, cutoff: datetime) -> int:
+    """Roll bars of `interval` older than `cutoff` into its compaction target, a day at a time."""
+    target = COMPACT_INTO.get(interval)
+    if not target:
+        return 0
+
+    oldest = db.session.query(func.min(PriceData.timestamp)).filter(
+        PriceData.symbol == symbol,
+        PriceData.interval == interval,
+        PriceData.timestamp < cutoff,
+    ).scalar()
+    if oldest is None:
+        return 0
+
+    compacted = 0
+    day = oldest.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day < cutoff:
+        next_day = min(day + timedelta(days=1), cutoff)
+        compacted += rollup.compact_range(symbol, interval, target, day, next_day)
+        db.session.commit()
+        day = next_day
+    return compacted
+
+
+def apply_retention(policy: Optional[Dict[str, timedelta]] = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                    now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Compact and delete expired price bars according to `policy`.
+
+    Returns a report with rows compacted and deleted per interval and the
+    estimated space reclaimed.
+    """
+    policy = RETENTION_POLICY if policy is None else policy
+    now = now or datetime.utcnow()
+    row_bytes = estimate_row_bytes()
+    report = {'intervals': {}, 'rowsDeleted': 0, 'rowsCompacted': 0}
+
+    for interval, keep_for in policy.items():
+        # Cut on a day boundary so compaction never splits a bucket
+        cutoff = (now - keep_for).replace(hour=0, minute=0, second=0, microsecond=0)
+
+        # Series with expiring bars, from the metadata table rather than a scan of price_data
+        symbols = [row[0] for row in db.session.query(PriceSeriesMeta.symbol).filter(
+            PriceSeriesMeta.interval == interval,
+            PriceSeriesMeta.oldest_timestamp < cutoff,
+        ).all()]
+        if not symbols:
+            continue
+
+        compacted = 0
+        deleted = 0
+        for symbol in symbols:
+            try:
+                compacted += compact_expiring(symbol, interval, cutoff)
+            except Exception as e:
+                # Never delete what could not be compacted
+                logger.error(f"Compacting {symbol} @ {interval} failed, keeping its bars: {e}")
+                db.session.rollback()
+                continue
+
+            removed = delete_in_chunks(
+                PriceData,
+                PriceData.symbol == symbol,
+                PriceData.interval == interval,
+                PriceData.timestamp < cutoff,
+                chunk_size=chunk_size,
+            )
+            price_meta.record_deleted(symbol, interval, removed)
+            db.session.commit()
+            deleted += removed
+
+        report['intervals'][interval] = {
+            'cutoff': cutoff.isoformat(),
+            'symbols': len(symbols),
+            'rowsCompacted': compacted,
+            'rowsDeleted': deleted,
+        }
+        report['rowsDeleted'] += deleted
+        report['rowsCompacted'] += compacted
+
+    report['estimatedBytesReclaimed'] = max(0, report['rowsDeleted'] - report['rowsCompacted']) * row_bytes
+    logger.info(f"Price retention: deleted {report['rowsDeleted']} rows, compacted into "
+                f"{report['rowsCompacted']}, ~{report['estimatedBytesReclaimed']} bytes reclaimed")
+    return report
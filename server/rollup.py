@@ -0,0 +1,287 @@
+"""
+Bar rollup engine.
+
+Coarse intervals are derived from cached fine bars instead of being fetched
+separately: 5min/15min/30min/1h/4h from 1min, and 1week/1month from 1day.
+Aggregation is vectorized with NumPy (first open, max high, min low, last
+close, summed volume). Intraday buckets for stocks are anchored at the session
+open and never cross the close, matching how Twelve Data builds its own bars.
+
+Derived bars are written to PriceData under their own interval, so readers
+(get_cached_prices, charts, trade overlays) need no changes.
+"""
+
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import bar_archive
+from db import db
+from http_cache import bump_versions, prices_scope
+from market_hours import session_bounds_seconds
+from models import PriceData
+import metrics
+import price_meta
+
+logger = logging.getLogger(__name__)
+
+DAY_SECONDS = 86400
+
+# Bucket of each interval a rollup can produce: size in seconds, or a calendar unit
+BUCKETS = {
+    '5min': 5 * 60,
+    '15min': 15 * 60,
+    '30min': 30 * 60,
+    '1h': 60 * 60,
+    '4h': 4 * 60 * 60,
+    '1day': 'day',
+    '1week': 'week',
+    '1month': 'month',
+}
+
+# Intervals served from a finer cached interval: derived interval -> source interval
+DERIVED_INTERVALS = {
+    '5min': '1min',
+    '15min': '1min',
+    '30min': '1min',
+    '1h': '1min',
+    '4h': '1min',
+    '1week': '1day',
+    '1month': '1day',
+}
+
+# Approximate number of source bars per derived bar, for coverage checks
+SOURCE_BARS_PER_BAR = {
+    '5min': 5,
+    '15min': 15,
+    '30min': 30,
+    '1h': 60,
+    '4h': 240,
+    '1week': 5,
+    '1month': 21,
+}
+
+
+def derived_from(source_interval: str) -> List[str]:
+    """Derived intervals built from `source_interval`."""
+    return [target for target, source in DERIVED_INTERVALS.items() if source == source_interval]
+
+
+def to_seconds(timestamps: List[datetime]) -> np.ndarray:
+    """Naive timestamps as int64 seconds on their own (exchange-local) clock."""
+    return np.array(timestamps, dtype='datetime64[s]').astype(np.int64)
+
+
+def bucket_keys(seconds: np.ndarray, bucket, session: Optional[Tuple[int, int]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Bucket start (seconds) for every bar, plus a mask of bars that belong to a session.
+
+    Intraday buckets of session-bound symbols start at the session open;
+    bars outside regular hours are excluded.
+    """
+    if bucket == 'day':
+        midnight = seconds // DAY_SECONDS * DAY_SECONDS
+        if session is None:
+            return midnight, np.ones(len(seconds), dtype=bool)
+        offset = seconds - midnight
+        return midnight, (offset >= session[0]) & (offset < session[1])
+    if bucket == 'week':
+        days = seconds // DAY_SECONDS
+        weekday = (days + 3) % 7  # 1970-01-01 was a Thursday; Monday = 0
+        return (days - weekday) * DAY_SECONDS, np.ones(len(seconds), dtype=bool)
+    if bucket == 'month':
+        months = seconds.astype('datetime64[s]').astype('datetime64[M]')
+        return months.astype('datetime64[s]').astype(np.int64), np.ones(len(seconds), dtype=bool)
+
+    if session is None:
+        return seconds // bucket * bucket, np.ones(len(seconds), dtype=bool)
+
+    session_open, session_close = session
+    midnight = seconds // DAY_SECONDS * DAY_SECONDS
+    offset = seconds - midnight
+    in_session = (offset >= session_open) & (offset < session_close)
+    anchor = midnight + session_open
+    return anchor + (seconds - anchor) // bucket * bucket, in_session
+
+
+def aggregate(seconds: np.ndarray, opens: np.ndarray, highs: np.ndarray, lows: np.ndarray,
+              closes: np.ndarray, volumes: np.ndarray, keys: np.ndarray) -> Dict[str, np.ndarray]:
+    """OHLCV aggregation of time-sorted bars grouped by consecutive equal keys."""
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+    ends = np.concatenate((starts[1:], [len(keys)])) - 1
+    return {
+        'timestamp': keys[starts],
+        'first': seconds[starts],
+        'open': opens[starts],
+        'high': np.maximum.reduceat(highs, starts),
+        'low': np.minimum.reduceat(lows, starts),
+        'close': closes[ends],
+        'volume': np.add.reduceat(volumes, starts),
+    }
+
+
+def rollup(symbol: str, target: str, source_bars: Dict[str, np.ndarray],
+           drop_partial_first: bool = True) -> Dict[str, np.ndarray]:
+    """
+    Aggregate source bars (column arrays as returned by load_source_bars) into `target` bars.
+
+    Source bars may come from any interval finer than `target`.
+
+    With `drop_partial_first`, a leading bucket whose first source bar is after
+    the bucket start is dropped: the source window began mid-bucket, so the
+    bar would be incomplete. For weeks and months that also drops a complete
+    bucket whose first day was not a trading day, which only costs a bar at
+    the window's start.
+    """
+    bucket = BUCKETS[target]
+    if not len(source_bars['timestamp']):
+        return {}
+
+    seconds = np.asarray(source_bars['timestamp'], dtype=np.int64)
+    values = np.column_stack([source_bars[name] for name in ('open', 'high', 'low', 'close')])
+    volumes = np.asarray(source_bars['volume'], dtype=np.int64)
+
+    session = session_bounds_seconds(symbol) if isinstance(bucket, int) or bucket == 'day' else None
+    keys, mask = bucket_keys(seconds, bucket, session)
+    if not mask.all():
+        seconds, values, volumes, keys = seconds[mask], values[mask], volumes[mask], keys[mask]
+    if not len(seconds):
+        return {}
+
+    bars = aggregate(seconds, values[:, 0], values[:, 1], values[:, 2], values[:, 3], volumes, keys)
+    partial_first = bars['first'][0] != bars['timestamp'][0]
+    if drop_partial_first and (isinstance(bucket, int) or bucket in ('week', 'month')) and partial_first:
+        bars = {name: column[1:] for name, column in bars.items()}
+    return bars
+
+
+def upsert_bars(symbol: str, interval: str, bars: Dict[str, np.ndarray], overwrite: bool = True,
+                mark_fetched: bool = True) -> int:
+    """
+    Insert or update derived bars in PriceData (caller commits).
+
+    With `overwrite=False`, existing bars are left alone and only missing ones inserted.
+    With `mark_fetched=False`, bars get their own timestamp as fetched_at so that
+    backfilled history does not make the interval look freshly fetched.
+    """
+    if not bars or not len(bars['timestamp']):
+        return 0
+
+    timestamps = bars['timestamp'].astype('datetime64[s]').astype(datetime)
+    existing = {
+        record.timestamp: record
+        for record in PriceData.query.filter(
+            PriceData.symbol == symbol,
+            PriceData.interval == interval,
+            PriceData.timestamp >= timestamps[0],
+            PriceData.timestamp <= timestamps[-1],
+        ).all()
+    }
+
+    now = datetime.utcnow()
+    written = 0
+    inserted = 0
+    for i, timestamp in enumerate(timestamps):
+        record = existing.get(timestamp)
+        if record is not None and not overwrite:
+            continue
+        values = {
+            'open': float(bars['open'][i]),
+            'high': float(bars['high'][i]),
+            'low': float(bars['low'][i]),
+            'close': float(bars['close'][i]),
+            'volume': int(bars['volume'][i]),
+            'fetched_at': now if mark_fetched else timestamp,
+        }
+        if record is None:
+            db.session.add(PriceData(symbol=symbol, interval=interval, timestamp=timestamp, **values))
+            inserted += 1
+        else:
+            for name, value in values.items():
+                setattr(record, name, value)
+        written += 1
+
+    if written:
+        metrics.PRICE_ROWS_STORED.labels('rollup').inc(written)
+        bump_versions(prices_scope(symbol, interval))
+        price_meta.record_bars(symbol, interval, inserted, timestamps[0], timestamps[-1], 'rollup',
+                               fetched=mark_fetched)
+    return written
+
+
+def load_source_bars(symbol: str, source: str, since: Optional[datetime] = None,
+                     limit: Optional[int] = None, before: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+    """
+    Source bars as column arrays in time order: those in [since, before), or the latest `limit` of them.
+
+    Served from the memory-mapped bar archive when it covers the range.
+    """
+    return bar_archive.load_bars(symbol, source, since=since, limit=limit, before=before)
+
+
+def bucket_start(symbol: str, target: str, timestamp: datetime) -> datetime:
+    """Start of the `target` bucket containing `timestamp`."""
+    bucket = BUCKETS[target]
+    session = session_bounds_seconds(symbol) if isinstance(bucket, int) else None
+    keys, _ = bucket_keys(to_seconds([timestamp]), bucket, session)
+    return keys.astype('datetime64[s]').astype(datetime)[0]
+
+
+def update_derived(symbol: str, source: str, earliest: datetime) -> Dict[str, int]:
+    """
+    Incrementally rebuild derived bars after new `source` bars at or after `earliest` arrived.
+
+    Only buckets from the one containing `earliest` onwards are recomputed. The
+    targets do not become fresh: they hold only the buckets the new source bars
+    cover, so a request for them still fetches or derives its full window. Caller commits.
+    """
+    updated = {}
+    meta = price_meta.get_meta(symbol, source)
+    for target in derived_from(source):
+        start = bucket_start(symbol, target, earliest)
+        # Straight from SQL: the new source bars are not committed, so not archived, yet
+        source_bars = bar_archive.query_bars(symbol, source, since=start)
+        bars = rollup(symbol, target, source_bars, drop_partial_first=False)
+        if not bars:
+            updated[target] = 0
+            continue
+        written = 0
+        if meta is None or meta.oldest_timestamp is None or meta.oldest_timestamp > start:
+            # The cache starts inside the first bucket, so its bar may be incomplete: only
+            # fill it in if missing, never replace a complete (e.g. upstream) one
+            written += upsert_bars(symbol, target, {name: column[:1] for name, column in bars.items()},
+                                   overwrite=False, mark_fetched=False)
+            bars = {name: column[1:] for name, column in bars.items()}
+        updated[target] = written + upsert_bars(symbol, target, bars, mark_fetched=False)
+    return updated
+
+
+def source_coverage(symbol: str, target: str) -> int:
+    """Number of cached source bars available for a derived interval."""
+    meta = price_meta.get_meta(symbol, DERIVED_INTERVALS[target])
+    return meta.bar_count if meta is not None else 0
+
+
+def derive_interval(symbol: str, target: str, outputsize: int) -> int:
+    """Build the latest `outputsize` bars of `target` from cached source bars. Caller commits."""
+    source = DERIVED_INTERVALS[target]
+    # One extra bucket of source bars so a partial leading bucket can be dropped
+    limit = (outputsize + 1) * SOURCE_BARS_PER_BAR[target]
+    source_bars = load_source_bars(symbol, source, limit=limit)
+    count = upsert_bars(symbol, target, rollup(symbol, target, source_bars))
+    logger.info(f"Derived {count} {target} bars for {symbol} from {len(source_bars['timestamp'])} {source} bars")
+    return count
+
+
+def compact_range(symbol: str, source: str, target: str, since: datetime, before: datetime) -> int:
+    """
+    Roll `source` bars in [since, before) into `target` bars that do not exist yet. Caller commits.
+
+    Used by retention before fine bars are deleted, so history survives at a
+    coarser resolution. Existing target bars (e.g. fetched upstream) are kept.
+    """
+    source_bars = load_source_bars(symbol, source, since=since, before=before)
+    bars = rollup(symbol, target, source_bars, drop_partial_first=False)
+    return upsert_bars(symbol, target, bars, overwrite=False, mark_fetched=False)
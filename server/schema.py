@@ -0,0 +1,54 @@
+"""
+Schema migrations, run through Alembic (alembic.ini, migrations/).
+
+`flask init-db` calls upgrade(): a new database gets every migration, and a
+database created before migrations existed (tables but no alembic_version) is
+first stamped at the baseline revision, which matches what db.create_all()
+built before this series of changes. Tables that create_all() added later
+(data_versions, price_series_meta) come from revisions that skip them when
+they already exist. Alembic is imported here on first use only, so serving
+requests never pays for it.
+"""
+
+import logging
+import os
+
+from sqlalchemy import inspect
+
+from db import db
+
+logger = logging.getLogger(__name__)
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_REVISION = '0001'
+
+
+def alembic_config(connection=None):
+    from alembic.config import Config
+
+    config = Config(os.path.join(SERVER_DIR, 'alembic.ini'))
+    config.set_main_option('script_location', os.path.join(SERVER_DIR, 'migrations'))
+    config.attributes['connection'] = connection
+    return config
+
+
+def current_revision(connection):
+    from alembic.runtime.migration import MigrationContext
+
+    return MigrationContext.configure(connection).get_current_revision()
+
+
+def upgrade(revision='head'):
+    """Bring the database up to `revision`; call inside an app context."""
+    from alembic import command
+
+    tables = set(inspect(db.engine).get_table_names())
+    # Not in a transaction: Alembic commits each migration itself, and index
+    # builds on PostgreSQL run outside any transaction (CONCURRENTLY)
+    with db.engine.connect() as connection:
+        config = alembic_config(connection)
+        if tables and 'alembic_version' not in tables:
+            logger.info(f"Database predates migrations, stamping revision {BASELINE_REVISION}")
+            command.stamp(config, BASELINE_REVISION)
+        command.upgrade(config, revision)
+        return current_revision(connection)
@@ -0,0 +1,131 @@
+"""
+Write-behind buffer for the accuracy scores of score polling.
+
+Clients poll /api/predictions/<id>/score every few seconds while a
+prediction runs. Until it settles the score is informational, so each poll
+only records the latest score of its prediction here, and a background
+thread writes all of them every SCORE_FLUSH_SECONDS in one transaction:
+the scores, their user_stats changes (one UPDATE per user) and the cache
+version bumps, the shared ones right after it. A prediction polled a
+hundred times between flushes is written once.
+
+Settlement writes its final score, the payout and the balance synchronously
+as before and drops the buffered score. A flush only touches predictions
+that are still active, with their rows locked, so it never overwrites a
+final score.
+
+Scores are lost if a process dies without flushing; the next poll records
+them again. Workers flush on exit (gunicorn.conf.py worker_exit, atexit
+otherwise). SCORE_FLUSH_SECONDS=0 writes every poll through.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from db import db, DEFAULT_CHUNK_SIZE
+from http_cache import bump_versions, bump_shared_versions, prediction_scopes, SHARED_PREDICTION_SCOPES
+from models import Prediction
+import user_stats
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SECONDS = float(os.environ.get('SCORE_FLUSH_SECONDS', 5))
+
+_pending: Dict[int, float] = {}
+_pending_lock = threading.Lock()
+# One flush at a time: the timer thread and a flush on exit can overlap
+_flush_lock = threading.Lock()
+
+
+def put(prediction_id: int, score: float):
+    """Record the latest score of an active prediction; written now if write-behind is off."""
+    if FLUSH_SECONDS <= 0:
+        write({prediction_id: score})
+        return
+    with _pending_lock:
+        _pending[prediction_id] = score
+
+
+def discard(prediction_id: int):
+    """Drop a buffered score, superseded by the one settlement writes."""
+    with _pending_lock:
+        _pending.pop(prediction_id, None)
+
+
+def write(scores: Dict[int, float]) -> int:
+    """Write `scores` of predictions that are still active and commit; returns how many changed."""
+    changed = []
+    # Lock in id order, like the other writers that lock several rows, so concurrent flushes cannot deadlock
+    ids = sorted(scores)
+    for start in range(0, len(ids), DEFAULT_CHUNK_SIZE):
+        predictions = Prediction.query.filter(
+            Prediction.id.in_(ids[start:start + DEFAULT_CHUNK_SIZE]), Prediction.status == 'active',
+        ).order_by(Prediction.id).with_for_update().populate_existing().all()
+        for prediction in predictions:
+            if prediction.accuracy_score != scores[prediction.id]:
+                before = user_stats.state(prediction)
+                prediction.accuracy_score = scores[prediction.id]
+                changed.append((prediction, before))
+    if changed:
+        user_stats.record_many(changed)
+        bump_versions(*(scope for prediction, _ in changed
+                        for scope in prediction_scopes(prediction.symbol, prediction.user_id)))
+    db.session.commit()
+    if changed:
+        bump_shared_versions(*SHARED_PREDICTION_SCOPES)
+    return len(changed)
+
+
+def flush() -> int:
+    """Write every buffered score. On failure they go back to the buffer, behind any newer ones."""
+    with _flush_lock:
+        with _pending_lock:
+            scores = dict(_pending)
+            _pending.clear()
+        if not scores:
+            return 0
+        try:
+            return write(scores)
+        except Exception:
+            db.session.rollback()
+            with _pending_lock:
+                for prediction_id, score in scores.items():
+                    _pending.setdefault(prediction_id, score)
+            raise
+
+
+_flusher: Optional[threading.Thread] = None
+_flusher_lock = threading.Lock()
+
+
+def flush_in_context(app):
+    with app.app_context():
+        try:
+            flush()
+        except Exception as e:
+            logger.error(f"Flushing buffered scores failed: {e}")
+        finally:
+            db.session.remove()
+
+
+def _flush_forever(app, interval: float):
+    while True:
+        time.sleep(interval)
+        flush_in_context(app)
+
+
+def start_flusher(app):
+    """Start the background flushes of this process, once, and flush on exit."""
+    global _flusher
+    if _flusher is not None or FLUSH_SECONDS <= 0:
+        return
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_forever, args=(app, FLUSH_SECONDS),
+                                        name='score-flush', daemon=True)
+            _flusher.start()
+            atexit.register(flush_in_context, app)
@@ -0,0 +1,215 @@
+"""
+Prediction scoring helpers.
+
+Pure functions shared by the HTTP handlers, the price stream and the backtest
+engine, so that a live score pushed to a subscriber or a replayed settlement
+is computed exactly like the one returned by the API. The array variants take
+NumPy price arrays and are what the backtest calls in bulk; the dict-based
+functions used by the handlers delegate to them.
+"""
+
+import math
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any
+
+import numpy as np
+
+# How long each prediction timeframe runs before it can be settled
+TIMEFRAME_DURATIONS = {
+    'hourly': timedelta(hours=1),
+    'daily': timedelta(days=1),
+    'weekly': timedelta(weeks=1),
+    'monthly': timedelta(days=30),
+    'yearly': timedelta(days=365),
+}
+
+
+def calculate_progress(created_at: datetime, timeframe: str, now: Optional[datetime] = None) -> float:
+    """Fraction (0.0 - 1.0) of the prediction timeframe that has elapsed."""
+    now = now or datetime.utcnow()
+    total_duration = TIMEFRAME_DURATIONS.get(timeframe, timedelta(days=1))
+    elapsed = now - created_at
+    return min(1.0, elapsed.total_seconds() / total_duration.total_seconds())
+
+
+def series_prices(price_series: List[Dict[str, Any]]) -> np.ndarray:
+    return np.fromiter((point['price'] for point in price_series), dtype=np.float64, count=len(price_series))
+
+
+def calculate_mspe_batch(predicted: np.ndarray, current_prices: np.ndarray) -> np.ndarray:
+    """
+    MSPE of every row of `predicted` (k x N) against its current price (k).
+
+    MSPE = (1/N) * Σ [(actual - predicted)² / actual]; rows with a
+    non-positive price score 0.
+    """
+    current = np.asarray(current_prices, dtype=np.float64)[:, None]
+    if predicted.shape[1] == 0:
+        return np.zeros(len(current))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        spe = np.where(current > 0, (current - predicted) ** 2 / current, 0.0)
+    return spe.mean(axis=1)
+
+
+def calculate_mspe(price_series: List[Dict[str, Any]], current_price: float, n_elapsed: int) -> float:
+    """
+    Mean Squared Percentage Error of the first n_elapsed predicted points.
+
+    MSPE = (1/N) * Σ [(actual - predicted)² / actual]
+    """
+    if n_elapsed <= 0:
+        return 0
+    predicted = series_prices(price_series[:n_elapsed])[None, :]
+    return float(calculate_mspe_batch(predicted, [current_price])[0])
+
+
+def contrarian_score_prices(predicted: np.ndarray, meta: np.ndarray) -> float:
+    """
+    How different a predicted price path is from the meta-prediction's.
+
+    Uses 1 - |correlation| of the two paths' percentage changes, scaled to
+    0.5 (same as consensus) - 1.0 (uncorrelated). 0.5 when no comparison is possible.
+    """
+    n = min(len(predicted), len(meta))
+    if n < 2:
+        return 0.5
+    changes = []
+    for prices in (predicted[:n], meta[:n]):
+        previous = prices[:-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            changes.append(np.where(previous != 0, (prices[1:] - previous) / previous, 0.0))
+    pred_changes, meta_changes = changes
+
+    pred_centered = pred_changes - pred_changes.sum() / len(pred_changes)
+    meta_centered = meta_changes - meta_changes.sum() / len(meta_changes)
+    pred_variance = float(np.dot(pred_centered, pred_centered))
+    meta_variance = float(np.dot(meta_centered, meta_centered))
+    if pred_variance == 0 or meta_variance == 0:
+        return 0.5
+
+    correlation = float(np.dot(pred_centered, meta_centered)) / math.sqrt(pred_variance * meta_variance)
+
+    # Contrarian score: 0 = same as consensus, 1 = completely opposite
+    # We reward both being different AND being accurate
+    return round((1 - abs(correlation)) * 0.5 + 0.5, 4)  # Scale to 0.5-1.0 range
+
+
+def calculate_contrarian_score(prediction_series: List[Dict[str, Any]], meta_series: List[Dict[str, Any]]) -> float:
+    """
+    Calculate how different a prediction is from the meta-prediction.
+    Returns a score where higher = more contrarian.
+    Uses correlation-based measure: contrarian_score = 1 - abs(correlation)
+    """
+    if not prediction_series or not meta_series:
+        return 0.5  # Neutral score if no comparison possible
+    return contrarian_score_prices(series_prices(prediction_series), series_prices(meta_series))
+
+
+def calculate_new_payoff(staked_tokens: int, accuracy_score: Optional[float], contrarian_score: Optional[float],
+                         n_points: int, is_early_close: bool = False, progress: float = 1.0) -> int:
+    """
+    New payoff function that rewards both accuracy and contrarian predictions.
+
+    Payoff = stake * (accuracy_multiplier * contrarian_bonus) * progress_factor
+
+    Where:
+    - accuracy_multiplier = n_points / (1 + MSPE)  (higher for lower MSPE)
+    - contrarian_bonus = 1 + (contrarian_score - 0.5) * 2  (1.0 to 2.0x)
+    - progress_factor = 0.5 + 0.5 * progress (for early close)
+    """
+    if staked_tokens <= 0 or accuracy_score is None:
+        return 0
+
+    # Base accuracy multiplier (capped to prevent extreme values)
+    mspe_capped = max(accuracy_score, 0.001)  # Prevent division by near-zero
+    accuracy_multiplier = min(n_points / (1 + mspe_capped), n_points * 10)  # Cap at 10x n_points
+
+    # Contrarian bonus (1.0x to 2.0x)
+    c_score = contrarian_score if contrarian_score is not None else 0.5
+    contrarian_bonus = 1.0 + (c_score - 0.5) * 2.0
+
+    # Progress factor for early close
+    progress_factor = 1.0 if not is_early_close else (0.5 + 0.5 * progress)
+
+    # Calculate final payoff
+    raw_payoff = staked_tokens * accuracy_multiplier * contrarian_bonus * progress_factor
+
+    # Apply reasonable bounds (0.1x to 100x stake)
+    min_payoff = int(staked_tokens * 0.1)
+    max_payoff = int(staked_tokens * 100)
+
+    return max(min_payoff, min(int(raw_payoff), max_payoff))
+
+
+def calculate_payoff(staked_tokens: int, n_total: int, mspe: Optional[float]) -> int:
+    """Calculate payoff based on stake, prediction length, and MSPE.
+
+    Payoff = stake * N / MSPE
+    Lower MSPE = higher rewards
+    """
+    if mspe is None or mspe <= 0 or staked_tokens <= 0:
+        return 0
+    return int((staked_tokens * n_total) / mspe)
+
+
+def merge_meta_prices(existing: np.ndarray, count: int, new: np.ndarray) -> np.ndarray:
+    """
+    Meta-prediction prices after adding one prediction.
+
+    Overlapping points are a weighted average (existing weighs `count`, the new
+    prediction 1), rounded to cents; the longer series supplies the tail.
+    """
+    n = min(len(existing), len(new))
+    merged = np.array(existing if len(existing) >= len(new) else new, dtype=np.float64)
+    averages = (existing[:n] * count + new[:n]) / (count + 1)
+    merged[:n] = np.round(averages, 2)
+    # np.round scales by 100 first, which can turn a value just below a .xx5
+    # tie into an exact tie; cent prices hit those often. Settle them with
+    # Python's round so the result matches what the handlers always stored.
+    scaled = averages * 100
+    for i in np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6):
+        merged[i] = round(float(averages[i]), 2)
+    return merged
+
+
+def merge_meta_series(existing_series: List[Dict[str, Any]], count: int,
+                      new_series: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """merge_meta_prices for stored series of {'price', 'timestamp'} points."""
+    prices = merge_meta_prices(series_prices(existing_series), count, series_prices(new_series)).tolist()
+    merged = []
+    for i, price in enumerate(prices):
+        if i < len(new_series):
+            timestamp = new_series[i].get('timestamp', existing_series[i].get('timestamp') if i < len(existing_series) else None)
+        else:
+            timestamp = existing_series[i].get('timestamp')
+        merged.append({'price': price, 'timestamp': timestamp})
+    return merged
+
+
+def calculate_live_score(price_series: List[Dict[str, Any]], timeframe: str, created_at: datetime,
+                         current_price: float, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Read-only score for a prediction at the given price.
+
+    Returns the same fields as the score endpoint without touching the database.
+    """
+    progress = calculate_progress(created_at, timeframe, now)
+    n_total = len(price_series)
+    current_point_index = 0
+    predicted_price = None
+    mspe = None
+
+    if progress >= 0.01 and n_total:
+        current_point_index = min(int(progress * n_total), n_total - 1)
+        predicted_price = price_series[current_point_index]['price']
+        mspe = round(calculate_mspe(price_series, current_price, current_point_index + 1), 6)
+
+    return {
+        'mspe': mspe,
+        'progress': round(progress * 100, 1),
+        'currentPointIndex': current_point_index,
+        'nElapsed': current_point_index + 1 if mspe is not None else 0,
+        'nTotal': n_total,
+        'predictedPrice': predicted_price,
+        'actualPrice': current_price,
+    }
@@ -0,0 +1,35 @@
+"""
+Fixtures for tests against a real database.
+
+Every test runs on a fresh SQLite file. When TEST_DATABASE_URL points at a
+PostgreSQL database it runs there as well; that database is migrated to head
+and the tests leave their rows in it, so do not point it at one you care about.
+"""
+
+import os
+
+import pytest
+
+import schema
+import score_buffer
+import user_stats
+from app import create_app
+from db import db
+
+DATABASE_URLS = ['sqlite'] + ([os.environ['TEST_DATABASE_URL']] if os.environ.get('TEST_DATABASE_URL') else [])
+
+
+@pytest.fixture(params=DATABASE_URLS, ids=lambda url: url.split(':', 1)[0].split('+', 1)[0])
+def app(request, tmp_path, monkeypatch):
+    """An app on a migrated database, with an app context pushed."""
+    url = f'sqlite:///{tmp_path / "test.db"}' if request.param == 'sqlite' else request.param
+    monkeypatch.setenv('DATABASE_URL', url)
+    # No background threads, which would outlive this test's database; score polls write through
+    monkeypatch.setattr(user_stats, 'RECONCILE_MINUTES', 0)
+    monkeypatch.setattr(score_buffer, 'FLUSH_SECONDS', 0)
+    app = create_app()
+    with app.app_context():
+        schema.upgrade()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
@@ -0,0 +1,16 @@
+"""Admin endpoints reject a chunkSize they cannot use before doing any work."""
+
+import os
+
+import pytest
+
+BAD_CHUNK_SIZES = [0, -5, 50001, 2.5, '1e9', 'lots', None, True, [100]]
+
+
+@pytest.mark.parametrize('path', ['/api/admin/reset-balances', '/api/admin/cleanup-price-data'])
+@pytest.mark.parametrize('chunk_size', BAD_CHUNK_SIZES)
+def test_bad_chunk_size_is_rejected(app, path, chunk_size):
+    admin_key = os.environ.get('ADMIN_SECRET_KEY', 'admin-reset-key-2024')
+    response = app.test_client().post(path, json={'adminKey': admin_key, 'chunkSize': chunk_size})
+    assert response.status_code == 400
+    assert 'chunkSize' in response.get_json()['error']
@@ -0,0 +1,52 @@
+"""The bar archive is only read when it holds every bar PriceData has (bar_archive.covers)."""
+
+import uuid
+
+import numpy as np
+import pytest
+
+import bar_archive
+from db import db
+import rollup
+
+INTERVAL = '1day'
+DAY = 86400
+START = 1767225600  # 2026-01-01
+
+
+def daily_bars(days):
+    seconds = np.array([START + day * DAY for day in days], dtype=np.int64)
+    prices = np.arange(len(days), dtype=np.float64) + 100
+    return {'timestamp': seconds, 'open': prices, 'high': prices + 1, 'low': prices - 1, 'close': prices,
+            'volume': np.full(len(days), 10, dtype=np.int64)}
+
+
+def store(symbol, days):
+    rollup.upsert_bars(symbol, INTERVAL, daily_bars(days), mark_fetched=False)
+    db.session.commit()
+
+
+@pytest.fixture
+def archive(app, tmp_path, monkeypatch):
+    archive = bar_archive.BarArchive(str(tmp_path / 'archive'))
+    monkeypatch.setattr(bar_archive, '_archive', archive)
+    return archive
+
+
+@pytest.mark.parametrize('late_days', [[5], [-3, -2]], ids=['middle', 'before-start'])
+def test_out_of_order_bars_end_coverage_until_synced(archive, late_days):
+    # Unique, as TEST_DATABASE_URL keeps the rows of earlier runs
+    symbol = f'T{uuid.uuid4().hex[:12]}'
+    store(symbol, [day for day in range(10) if day != 5])
+    bar_archive.sync_from_db(symbol, INTERVAL)
+    assert bar_archive.covers(archive, symbol, INTERVAL)
+
+    store(symbol, late_days)
+    # Appends cannot place these bars: reads go to PriceData until the archive is rebuilt
+    assert not bar_archive.covers(archive, symbol, INTERVAL)
+    assert len(bar_archive.load_bars(symbol, INTERVAL)['timestamp']) == 9 + len(late_days)
+
+    bar_archive.sync_from_db(symbol, INTERVAL)
+    assert bar_archive.covers(archive, symbol, INTERVAL)
+    expected = sorted(START + day * DAY for day in set(range(10)) - {5} | set(late_days))
+    assert archive.read(symbol, INTERVAL)['timestamp'].tolist() == expected
@@ -0,0 +1,61 @@
+"""Concurrent balance changes of one user neither get lost nor overdraw it (ledger.py)."""
+
+import threading
+import uuid
+
+from db import db
+from models import User, TokenLedger
+import ledger
+
+THREADS = 8
+CHANGES_PER_THREAD = 40
+INITIAL_BALANCE = 20
+
+
+def test_concurrent_debits_and_credits_match_the_ledger(app):
+    # Unique, as TEST_DATABASE_URL keeps the rows of earlier runs
+    user = User(email=f'ledger-{uuid.uuid4()}@example.com', password_hash='x', token_balance=INITIAL_BALANCE)
+    db.session.add(user)
+    db.session.commit()
+    user_id = user.id
+
+    applied = []
+    errors = []
+
+    def worker(index):
+        with app.app_context():
+            try:
+                for i in range(CHANGES_PER_THREAD):
+                    # Debits outweigh credits, so some are refused once the balance runs low
+                    if (index + i) % 3:
+                        changed = ledger.debit(user_id, 3, 'stake') is not None
+                        amount = -3
+                    else:
+                        changed = ledger.credit(user_id, 2, 'reward') is not None
+                        amount = 2
+                    db.session.commit()
+                    if changed:
+                        applied.append(amount)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+
+    balance = db.session.get(User, user_id, populate_existing=True).token_balance
+    rows = TokenLedger.query.filter_by(user_id=user_id).order_by(TokenLedger.id).all()
+    assert balance >= 0
+    assert balance == INITIAL_BALANCE + sum(applied)
+    assert balance == INITIAL_BALANCE + sum(row.amount for row in rows)
+    assert len(rows) == len(applied)
+    # Every row follows the one before it: no change was applied to a stale balance
+    running = INITIAL_BALANCE
+    for row in rows:
+        running += row.amount
+        assert row.balance_after == running
@@ -0,0 +1,28 @@
+"""The hot queries use their indexes and never scan a whole table (query_plans.py)."""
+
+from sqlalchemy import text
+
+from db import db
+import query_plans
+
+
+def test_hot_queries_use_their_indexes(app):
+    failures = [f"{result['name']}: index {result['index']}, sequential scans {result['seq_scans']}, "
+                f"plan {result['plan']}" for result in query_plans.check() if not result['ok']]
+    assert not failures, '\n'.join(failures)
+
+
+def test_dropped_index_is_reported(app):
+    # On PostgreSQL explain() rolls the DROP back with its own transaction
+    db.session.execute(text('DROP INDEX idx_predictions_user_created'))
+    hot = next(hot for hot in query_plans.HOT_QUERIES if hot.name == 'user_predictions')
+    plan = query_plans.explain(hot.build())
+    assert query_plans.sequential_scans(plan), plan
+
+
+def test_sequential_scans():
+    assert query_plans.sequential_scans(['Seq Scan on predictions  (cost=0.00..1.01 rows=1 width=8)'])
+    assert query_plans.sequential_scans(['SCAN predictions'])
+    assert not query_plans.sequential_scans(['SCAN predictions USING INDEX idx_predictions_profit'])
+    assert not query_plans.sequential_scans(
+        ['Index Scan using idx_predictions_user_created on predictions  (cost=0.29..8.30 rows=1 width=8)'])
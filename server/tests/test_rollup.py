@@ -0,0 +1,89 @@
+"""Calendar rollups never replace a complete bar with one built from part of its bucket (rollup.py)."""
+
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from db import db
+from models import PriceData
+import rollup
+
+DAY = 86400
+MONDAY = 1767571200  # 2026-01-05
+UPSTREAM = {'open': 50.0, 'high': 500.0, 'low': 5.0, 'close': 55.0, 'volume': 12345}
+
+
+@pytest.fixture
+def symbol(app):
+    # Unique, as TEST_DATABASE_URL keeps the rows of earlier runs
+    return f'T{uuid.uuid4().hex[:12]}'
+
+
+def bars(seconds, price=100.0):
+    seconds = np.array(seconds, dtype=np.int64)
+    prices = np.full(len(seconds), price)
+    return {'timestamp': seconds, 'open': prices, 'high': prices + 1, 'low': prices - 1, 'close': prices,
+            'volume': np.full(len(seconds), 10, dtype=np.int64)}
+
+
+def store_upstream_week(symbol):
+    upstream = {name: np.array([value]) for name, value in UPSTREAM.items()}
+    upstream['timestamp'] = np.array([MONDAY], dtype=np.int64)
+    rollup.upsert_bars(symbol, '1week', upstream)
+    db.session.commit()
+
+
+def store_days(symbol, days):
+    rollup.upsert_bars(symbol, '1day', bars([MONDAY + day * DAY for day in days]), mark_fetched=False)
+    db.session.commit()
+
+
+def week_bar(symbol, monday):
+    return PriceData.query.filter_by(symbol=symbol, interval='1week',
+                                     timestamp=datetime.utcfromtimestamp(monday)).one()
+
+
+def assert_upstream(bar):
+    assert {name: getattr(bar, name) for name in UPSTREAM} == UPSTREAM
+
+
+def test_partial_leading_week_is_dropped():
+    # Wednesday to the next Friday: the first week is cut short, the second is whole
+    weeks = rollup.rollup('BTC/USD', '1week', bars([MONDAY + day * DAY for day in (2, 3, 4, 7, 8, 9, 10, 11)]))
+    assert weeks['timestamp'].tolist() == [MONDAY + 7 * DAY]
+    assert weeks['volume'].tolist() == [50]
+
+
+def test_derive_keeps_upstream_week_when_days_start_mid_week(symbol):
+    store_upstream_week(symbol)
+    store_days(symbol, [2, 3, 4, 7, 8, 9, 10, 11])
+
+    rollup.derive_interval(symbol, '1week', outputsize=2)
+    db.session.commit()
+    assert_upstream(week_bar(symbol, MONDAY))
+    assert week_bar(symbol, MONDAY + 7 * DAY).volume == 50
+
+
+def test_update_derived_keeps_upstream_week_when_days_start_mid_week(symbol):
+    store_upstream_week(symbol)
+    store_days(symbol, [2, 3, 4, 7, 8])
+
+    rollup.update_derived(symbol, '1day', datetime.utcfromtimestamp(MONDAY + 2 * DAY))
+    db.session.commit()
+    assert_upstream(week_bar(symbol, MONDAY))
+    assert week_bar(symbol, MONDAY + 7 * DAY).volume == 20
+
+
+def test_update_derived_rebuilds_a_week_the_cache_covers(symbol):
+    store_days(symbol, [0, 1, 2])
+    rollup.update_derived(symbol, '1day', datetime.utcfromtimestamp(MONDAY))
+    db.session.commit()
+    assert week_bar(symbol, MONDAY).volume == 30
+
+    # A new day in the same week revises the bar
+    store_days(symbol, [3])
+    rollup.update_derived(symbol, '1day', datetime.utcfromtimestamp(MONDAY + 3 * DAY))
+    db.session.commit()
+    assert week_bar(symbol, MONDAY).volume == 40
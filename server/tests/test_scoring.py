@@ -0,0 +1,114 @@
+"""Score polls and settlement: one payout per prediction, settled scores stay put, buffered scores land."""
+
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import auth
+from db import db
+from models import Prediction, TokenLedger, User, UserStats
+import score_buffer
+import user_stats
+
+PREDICTION = {
+    'symbol': 'BTC-USD', 'timeframe': 'daily', 'stakedTokens': 10,
+    'points': [{'x': 0, 'y': 100}, {'x': 100, 'y': 150}], 'chartBounds': {'minPrice': 90, 'maxPrice': 110},
+    'canvasDimensions': {'height': 400, 'bottomPadding': 30, 'priceMin': 90, 'priceMax': 110},
+}
+
+
+@pytest.fixture
+def user(app):
+    user = User(email=f'scoring-{uuid.uuid4()}@example.com', password_hash='x', token_balance=1000)
+    db.session.add(user)
+    db.session.commit()
+    token = f'scoring-{user.id}'
+    auth.auth_tokens[token] = user.id
+    return user.id, {'Authorization': f'Bearer {token}'}
+
+
+def submit(app, headers, age: timedelta) -> int:
+    response = app.test_client().post('/api/predictions', json=PREDICTION, headers=headers)
+    assert response.status_code == 200, response.get_json()
+    prediction_id = response.get_json()['predictionId']
+    db.session.get(Prediction, prediction_id).created_at = datetime.utcnow() - age
+    db.session.commit()
+    return prediction_id
+
+
+def stats_match(user_id) -> bool:
+    db.session.expire_all()
+    return user_stats._matches(db.session.get(UserStats, user_id), user_stats.compute([user_id])[user_id])
+
+
+def test_scoring_a_settled_prediction_returns_its_stored_score(app, user):
+    user_id, headers = user
+    prediction_id = submit(app, headers, timedelta(days=2))
+    client = app.test_client()
+    assert client.post(f'/api/predictions/{prediction_id}/close', json={'currentPrice': 101},
+                       headers=headers).status_code == 200
+    db.session.expire_all()
+    stored = db.session.get(Prediction, prediction_id).accuracy_score
+
+    response = client.post(f'/api/predictions/{prediction_id}/score', json={'currentPrice': 150}, headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['mspe'] == stored
+    db.session.expire_all()
+    assert db.session.get(Prediction, prediction_id).accuracy_score == stored
+
+
+def test_concurrent_score_and_close_pay_once(app, user):
+    user_id, headers = user
+    prediction_ids = [submit(app, headers, timedelta(days=2)) for _ in range(4)]
+    balance_before = db.session.get(User, user_id).token_balance
+    errors = []
+
+    def settle(prediction_id, action):
+        with app.app_context():
+            response = app.test_client().post(f'/api/predictions/{prediction_id}/{action}',
+                                              json={'currentPrice': 101}, headers=headers)
+            if response.status_code not in (200, 400):
+                errors.append(response.status_code)
+            db.session.remove()
+
+    threads = [threading.Thread(target=settle, args=(prediction_id, action))
+               for prediction_id in prediction_ids for action in ('close', 'score', 'close', 'score')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+
+    db.session.expire_all()
+    predictions = Prediction.query.filter(Prediction.id.in_(prediction_ids)).all()
+    assert all(prediction.status != 'active' for prediction in predictions)
+    paid = db.session.get(User, user_id).token_balance - balance_before
+    assert paid == sum(prediction.rewards_earned for prediction in predictions)
+    payouts = TokenLedger.query.filter(TokenLedger.prediction_id.in_(prediction_ids),
+                                       TokenLedger.amount > 0).count()
+    assert payouts <= len(prediction_ids)
+    assert stats_match(user_id)
+
+
+def test_buffered_scores_are_written_by_a_flush(app, user, monkeypatch):
+    user_id, headers = user
+    # Buffer polls, with no flusher thread: the test flushes
+    monkeypatch.setattr(score_buffer, 'FLUSH_SECONDS', 60)
+    monkeypatch.setattr(score_buffer, '_flusher', threading.current_thread())
+    monkeypatch.setattr(score_buffer, '_pending', {})
+    prediction_id = submit(app, headers, timedelta(hours=6))
+
+    client = app.test_client()
+    for price in (95, 105, 102):
+        response = client.post(f'/api/predictions/{prediction_id}/score', json={'currentPrice': price},
+                               headers=headers)
+    latest = response.get_json()['mspe']
+    db.session.expire_all()
+    assert db.session.get(Prediction, prediction_id).accuracy_score is None
+
+    assert score_buffer.flush() == 1
+    db.session.expire_all()
+    assert db.session.get(Prediction, prediction_id).accuracy_score == latest
+    assert stats_match(user_id)
@@ -0,0 +1,49 @@
+"""since/until values the API cannot represent are a 400, never a 500 (twelve_data.parse_timestamp)."""
+
+import os
+import uuid
+
+import pytest
+
+import auth
+from db import db
+from models import User
+import twelve_data
+
+BAD_TIMESTAMPS = ['1e20', 'inf', '-inf', 'nan', 'yesterday']
+
+
+@pytest.mark.parametrize('value', BAD_TIMESTAMPS)
+def test_parse_timestamp_raises_value_error(value):
+    with pytest.raises(ValueError):
+        twelve_data.parse_timestamp(value)
+
+
+def test_parse_timestamp():
+    assert twelve_data.parse_timestamp('') is None
+    assert twelve_data.parse_timestamp('1700000000').isoformat() == '2023-11-14T22:13:20'
+    assert twelve_data.parse_timestamp('2026-01-01T01:00:00+01:00').isoformat() == '2026-01-01T00:00:00'
+
+
+@pytest.mark.parametrize('value', BAD_TIMESTAMPS)
+def test_prices_reject_bad_timestamps(app, value):
+    response = app.test_client().get(f'/api/prices/BTC-USD?interval=1h&period=1mo&since={value}')
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('value', BAD_TIMESTAMPS)
+def test_performance_history_rejects_bad_timestamps(app, value):
+    user = User(email=f'history-{uuid.uuid4()}@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    auth.auth_tokens['history-token'] = user.id
+    response = app.test_client().get(f'/api/user/performance-history?until={value}',
+                                     headers={'Authorization': 'Bearer history-token'})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('value', BAD_TIMESTAMPS)
+def test_export_rejects_bad_timestamps(app, value):
+    response = app.test_client().post('/api/admin/export-parquet', json={
+        'adminKey': os.environ.get('ADMIN_SECRET_KEY', 'admin-reset-key-2024'), 'since': value})
+    assert response.status_code == 400
@@ -9,19 +9,29 @@ API Documentation: https://twelvedata.com/docs
 """
 
 import os
+import calendar
 import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 
-import requests
+from flask import current_app
 
+import bar_archive
 from db import db
+from http_cache import bump_versions, prices_scope
 from models import PriceData
+import metrics
+import price_meta
+import retention
+import rollup
 
 logger = logging.getLogger(__name__)
 
 TWELVE_DATA_API_KEY = os.environ.get('TWELVE_DATA_API_KEY')
-TWELVE_DATA_BASE_URL = 'https://api.twelvedata.com'
+TWELVE_DATA_BASE_URL = os.environ.get('TWELVE_DATA_BASE_URL', 'https://api.twelvedata.com')
 
 # Map our internal intervals to Twelve Data intervals
 INTERVAL_MAP = {
@@ -49,6 +59,15 @@ CACHE_FRESHNESS = {
     '1month': timedelta(days=7),
 }
 
+# Upstream fetches run on this many background threads per process, never on a
+# request thread; a request only waits (at most UPSTREAM_WAIT_SECONDS) when
+# there is nothing cached to serve.
+UPSTREAM_WORKERS = int(os.environ.get('UPSTREAM_WORKERS', 4))
+UPSTREAM_WAIT_SECONDS = float(os.environ.get('UPSTREAM_WAIT_SECONDS', 20))
+
+# Column order of the compact (array-of-arrays) price format
+COMPACT_COLUMNS = ['t', 'o', 'h', 'l', 'c', 'v']
+
 # Symbol format conversion for Twelve Data
 # Twelve Data uses different formats for some assets
 def convert_symbol_for_twelve_data(symbol: str) -> str:
@@ -102,6 +121,8 @@ def fetch_from_twelve_data(symbol: str, interval: str, outputsize: int = 100) ->
     td_symbol = convert_symbol_for_twelve_data(symbol)
     td_interval = get_twelve_data_interval(interval)
 
+    import requests  # Imported on first fetch, off the worker boot path
+
     url = f"{TWELVE_DATA_BASE_URL}/time_series"
     params = {
         'symbol': td_symbol,
@@ -112,7 +133,8 @@ def fetch_from_twelve_data(symbol: str, interval: str, outputsize: int = 100) ->
 
     try:
         logger.info(f"Fetching from Twelve Data: {td_symbol} @ {td_interval}")
-        response = requests.get(url, params=params, timeout=30)
+        with metrics.UPSTREAM_LATENCY.labels('twelve_data').time():
+            response = requests.get(url, params=params, timeout=30)
         response.raise_for_status()
 
         data = response.json()
@@ -120,10 +142,14 @@ def fetch_from_twelve_data(symbol: str, interval: str, outputsize: int = 100) ->
         # Check for API errors
         if data.get('status') == 'error':
             logger.error(f"Twelve Data API error: {data.get('message')}")
+            metrics.UPSTREAM_ERRORS.labels('twelve_data', 'api_error').inc()
+            price_meta.record_error(symbol, td_interval, f"API error: {data.get('message')}")
             return None
 
         if 'values' not in data:
             logger.error(f"Unexpected response format: {data}")
+            metrics.UPSTREAM_ERRORS.labels('twelve_data', 'bad_response').inc()
+            price_meta.record_error(symbol, td_interval, 'Unexpected response format')
             return None
 
         # Parse the values - they come in reverse chronological order
@@ -152,9 +178,13 @@ def fetch_from_twelve_data(symbol: str, interval: str, outputsize: int = 100) ->
 
     except requests.RequestException as e:
         logger.error(f"Request to Twelve Data failed: {e}")
+        metrics.UPSTREAM_ERRORS.labels('twelve_data', 'request_failed').inc()
+        price_meta.record_error(symbol, td_interval, f"Request failed: {e}")
         return None
     except Exception as e:
         logger.error(f"Error fetching from Twelve Data: {e}")
+        metrics.UPSTREAM_ERRORS.labels('twelve_data', 'exception').inc()
+        price_meta.record_error(symbol, td_interval, str(e))
         return None
 
 
@@ -171,7 +201,11 @@ def store_price_data(symbol: str, interval: str, prices: List[Dict[str, Any]]) -
         Number of records stored
     """
     td_interval = get_twelve_data_interval(interval)
+    started = time.perf_counter()
     stored_count = 0
+    inserted_count = 0
+    earliest = None
+    latest = None
 
     for price in prices:
         try:
@@ -210,46 +244,110 @@ def store_price_data(symbol: str, interval: str, prices: List[Dict[str, Any]]) -
                     volume=price.get('volume'),
                 )
                 db.session.add(price_data)
+                inserted_count += 1
 
             stored_count += 1
+            if earliest is None or timestamp < earliest:
+                earliest = timestamp
+            if latest is None or timestamp > latest:
+                latest = timestamp
 
         except Exception as e:
             logger.warning(f"Error storing price data: {e}")
             continue
 
     try:
+        bump_versions(prices_scope(symbol, td_interval))
+        price_meta.record_bars(symbol, td_interval, inserted_count, earliest, latest, 'twelve_data')
+        if earliest is not None and rollup.derived_from(td_interval):
+            # Keep coarser intervals built from these bars in step
+            rollup.update_derived(symbol, td_interval, earliest)
         db.session.commit()
         logger.info(f"Stored/updated {stored_count} price records for {symbol}")
+        metrics.PRICE_ROWS_STORED.labels('twelve_data').inc(stored_count)
+        metrics.PRICE_STORE_DURATION.labels('twelve_data').observe(time.perf_counter() - started)
     except Exception as e:
         logger.error(f"Error committing price data: {e}")
         db.session.rollback()
         return 0
 
+    if earliest is not None and bar_archive.get_archive() is not None:
+        bar_archive.sync_from_db(symbol, td_interval, earliest)
+        for target in rollup.derived_from(td_interval):
+            bar_archive.sync_from_db(symbol, target, rollup.bucket_start(symbol, target, earliest))
+
     return stored_count
 
 
-def get_cached_prices(symbol: str, interval: str, limit: int = 100) -> List[Dict[str, Any]]:
+def to_epoch(timestamp: datetime) -> int:
+    """Epoch seconds for a stored (naive UTC) or timezone-aware timestamp."""
+    return calendar.timegm(timestamp.utctimetuple())
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """
+    Parse a since/until query value: epoch seconds or an ISO 8601 timestamp.
+
+    Returns a naive UTC datetime comparable with PriceData.timestamp, or None if
+    the value is empty. Raises ValueError for anything else.
+    """
+    if value is None or value == '':
+        return None
+    try:
+        try:
+            return datetime.utcfromtimestamp(float(value))
+        except ValueError:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+            if parsed.tzinfo is not None:
+                parsed = datetime.utcfromtimestamp(parsed.timestamp())
+            return parsed
+    except (OverflowError, OSError, TypeError, AttributeError) as e:
+        # Epochs out of datetime's (or the platform's) range, e.g. 1e20 or inf, and non-string JSON values
+        raise ValueError(f'Invalid timestamp: {value!r}') from e
+
+
+def get_cached_prices(symbol: str, interval: str, limit: int = 100, since: Optional[datetime] = None,
+                      until: Optional[datetime] = None, compact: bool = False) -> List[Any]:
     """
     Get price data from our database cache.
 
     Args:
         symbol: The trading symbol
         interval: Time interval
-        limit: Maximum number of records to return
+        limit: Maximum number of records to return (the most recent ones in range)
+        since: Only return bars at or after this time. Inclusive, so a poll with
+            the last timestamp it has also receives that bar if it was updated.
+        until: Only return bars at or before this time
+        compact: Return [epoch, open, high, low, close, volume] rows instead of dicts
 
     Returns:
-        List of price data dictionaries
+        List of price data dictionaries (or rows when compact)
     """
     td_interval = get_twelve_data_interval(interval)
 
-    price_records = PriceData.query.filter_by(
-        symbol=symbol,
-        interval=td_interval
-    ).order_by(PriceData.timestamp.desc()).limit(limit).all()
+    # Plain column tuples served from idx_symbol_interval_timestamp; no ORM objects
+    query = db.session.query(
+        PriceData.timestamp, PriceData.open, PriceData.high, PriceData.low, PriceData.close, PriceData.volume,
+    ).filter(
+        PriceData.symbol == symbol,
+        PriceData.interval == td_interval,
+    )
+    if since is not None:
+        query = query.filter(PriceData.timestamp >= since)
+    if until is not None:
+        query = query.filter(PriceData.timestamp <= until)
+
+    price_records = query.order_by(PriceData.timestamp.desc()).limit(limit).all()
 
     # Reverse to get chronological order
     price_records.reverse()
 
+    if compact:
+        return [
+            [to_epoch(record.timestamp), record.open, record.high, record.low, record.close, record.volume]
+            for record in price_records
+        ]
+
     prices = []
     for record in price_records:
         prices.append({
@@ -264,6 +362,31 @@ def get_cached_prices(symbol: str, interval: str, limit: int = 100) -> List[Dict
     return prices
 
 
+def build_price_payload(prices: List[Any], source: Optional[str], compact: bool = False) -> Dict[str, Any]:
+    """Wrap bars (dicts, or rows when compact) with the summary fields the chart uses."""
+    if compact:
+        closes = [row[4] for row in prices]
+        last_timestamp = prices[-1][0] if prices else None
+    else:
+        closes = [p['close'] for p in prices]
+        last_timestamp = prices[-1]['timestamp'] if prices else None
+
+    payload = {
+        'minPrice': min(closes) if closes else None,
+        'maxPrice': max(closes) if closes else None,
+        'lastPrice': closes[-1] if closes else 0,
+        'lastTimestamp': last_timestamp,
+        'source': source,
+        'count': len(prices)
+    }
+    if compact:
+        payload['columns'] = COMPACT_COLUMNS
+        payload['bars'] = prices
+    else:
+        payload['prices'] = prices
+    return payload
+
+
 def is_cache_fresh(symbol: str, interval: str) -> bool:
     """
     Check if our cached data is fresh enough.
@@ -277,98 +400,163 @@ def is_cache_fresh(symbol: str, interval: str) -> bool:
     """
     td_interval = get_twelve_data_interval(interval)
 
-    # Get the most recent record
-    latest = PriceData.query.filter_by(
-        symbol=symbol,
-        interval=td_interval
-    ).order_by(PriceData.fetched_at.desc()).first()
+    # Primary-key lookup on the series metadata kept current by store_price_data
+    freshness_duration = CACHE_FRESHNESS.get(td_interval, timedelta(hours=1))
+    return price_meta.is_fresh(price_meta.get_meta(symbol, td_interval), freshness_duration)
+
+
+def cache_freshness_seconds(interval: str) -> int:
+    """How long data for an interval is considered fresh, in seconds."""
+    td_interval = get_twelve_data_interval(interval)
+    return int(CACHE_FRESHNESS.get(td_interval, timedelta(hours=1)).total_seconds())
+
+
+_refresh_executor = ThreadPoolExecutor(max_workers=UPSTREAM_WORKERS, thread_name_prefix='upstream-refresh')
+_refreshes: Dict[Tuple[str, str], Future] = {}
+_refreshes_lock = threading.Lock()
 
-    if not latest:
+
+def _refresh(app, symbol: str, interval: str, outputsize: int) -> bool:
+    with app.app_context():
+        try:
+            fetched_prices = fetch_from_twelve_data(symbol, interval, outputsize)
+            if not fetched_prices:
+                return False
+            return store_price_data(symbol, interval, fetched_prices) > 0
+        finally:
+            db.session.remove()
+
+
+def schedule_refresh(symbol: str, interval: str, outputsize: int) -> Future:
+    """
+    Fetch and store a series from Twelve Data in the background.
+
+    Concurrent callers for the same series share one fetch. The future
+    resolves to True once new bars are committed.
+    """
+    key = (symbol, get_twelve_data_interval(interval))
+    with _refreshes_lock:
+        future = _refreshes.get(key)
+        if future is None or future.done():
+            future = _refresh_executor.submit(_refresh, current_app._get_current_object(), symbol, interval,
+                                              outputsize)
+            _refreshes[key] = future
+        return future
+
+
+def can_derive_from_cache(symbol: str, interval: str, outputsize: int) -> bool:
+    """True if `interval` can be rolled up from fresh cached finer bars covering `outputsize` bars."""
+    td_interval = get_twelve_data_interval(interval)
+    if td_interval not in rollup.DERIVED_INTERVALS:
+        return False
+    source = rollup.DERIVED_INTERVALS[td_interval]
+    if not is_cache_fresh(symbol, source):
         return False
+    return rollup.source_coverage(symbol, td_interval) >= outputsize * rollup.SOURCE_BARS_PER_BAR[td_interval]
 
-    freshness_duration = CACHE_FRESHNESS.get(td_interval, timedelta(hours=1))
-    age = datetime.utcnow() - latest.fetched_at
 
-    return age < freshness_duration
+def derive_from_cache(symbol: str, interval: str, outputsize: int) -> int:
+    """Roll up `outputsize` bars of `interval` from cached finer bars and commit them."""
+    td_interval = get_twelve_data_interval(interval)
+    try:
+        count = rollup.derive_interval(symbol, td_interval, outputsize)
+        db.session.commit()
+        bar_archive.sync_from_db(symbol, td_interval)
+        return count
+    except Exception as e:
+        logger.error(f"Error deriving {td_interval} bars for {symbol}: {e}")
+        db.session.rollback()
+        return 0
 
 
-def get_prices_with_cache(symbol: str, interval: str, outputsize: int = 100) -> Dict[str, Any]:
+def get_prices_with_cache(symbol: str, interval: str, outputsize: int = 100, since: Optional[datetime] = None,
+                          until: Optional[datetime] = None, compact: bool = False) -> Dict[str, Any]:
     """
     Get price data, using cache when fresh and fetching from Twelve Data when needed.
 
     This is the main function to use for getting price data. It:
     1. Checks if we have fresh cached data
-    2. If not, fetches from Twelve Data and stores in cache
-    3. Returns the price data
+    2. If not, derives it from fresh finer cached bars when they cover the window
+       (e.g. 1h from 1min, 1week from 1day)
+    3. Otherwise schedules a background fetch from Twelve Data, unless recent
+       upstream failures for the series put it in backoff, and serves the stale
+       cache meanwhile (waiting for the fetch only when the series was never
+       fetched or derived in full)
+    4. Returns the price data, optionally restricted to a since/until range
 
     Args:
         symbol: The trading symbol
         interval: Time interval
         outputsize: Number of data points to fetch
+        since: Only return bars at or after this time (delta polling)
+        until: Only return bars at or before this time
+        compact: Return epoch/OHLCV rows under 'bars' instead of dicts under 'prices'
 
     Returns:
-        Dictionary with prices and metadata
+        Dictionary with prices and metadata. With since/until, minPrice and
+        maxPrice cover only the returned bars.
     """
     # Check if cache is fresh
     if is_cache_fresh(symbol, interval):
         logger.info(f"Using cached data for {symbol} @ {interval}")
-        prices = get_cached_prices(symbol, interval, outputsize)
         source = 'cache'
+    elif can_derive_from_cache(symbol, interval, outputsize):
+        # Build this interval from fresh finer bars instead of another upstream call
+        derive_from_cache(symbol, interval, outputsize)
+        source = 'rollup'
+    elif price_meta.in_backoff(price_meta.get_meta(symbol, get_twelve_data_interval(interval))):
+        # Upstream failed repeatedly for this series; serve what we have until the backoff expires
+        logger.info(f"Upstream backoff active for {symbol} @ {interval}, serving stale cache")
+        source = 'cache_stale'
     else:
-        # Try to fetch from Twelve Data
-        fetched_prices = fetch_from_twelve_data(symbol, interval, outputsize)
-
-        if fetched_prices:
-            # Store in cache
-            store_price_data(symbol, interval, fetched_prices)
-            prices = get_cached_prices(symbol, interval, outputsize)
-            source = 'twelve_data'
+        # Refresh from Twelve Data off the request thread
+        refresh = schedule_refresh(symbol, interval, outputsize)
+        meta = price_meta.get_meta(symbol, get_twelve_data_interval(interval))
+        if meta is not None and meta.bar_count and meta.last_fetched_at is not None:
+            # Serve the stale bars now; the next poll gets the refreshed ones
+            source = 'cache_stale'
         else:
-            # Fall back to cache even if stale
-            prices = get_cached_prices(symbol, interval, outputsize)
-            source = 'cache_stale' if prices else None
+            # Nothing to serve yet, or only the few buckets rolled up from newer finer
+            # bars: wait for the fetch without holding a DB connection
+            db.session.close()
+            try:
+                source = 'twelve_data' if refresh.result(timeout=UPSTREAM_WAIT_SECONDS) else 'cache_stale'
+            except FutureTimeoutError:
+                source = 'cache_stale'
+
+    metrics.PRICE_SOURCE.labels(source).inc()
+    prices = get_cached_prices(symbol, interval, outputsize, since=since, until=until, compact=compact)
 
     if not prices:
+        if (since is not None or until is not None) and source != 'cache_stale':
+            # An empty delta is a valid answer when the range has no new bars
+            return build_price_payload([], source, compact)
         return {
             'prices': [],
             'error': 'No price data available',
             'source': None
         }
 
-    closes = [p['close'] for p in prices]
-
-    return {
-        'prices': prices,
-        'minPrice': min(closes),
-        'maxPrice': max(closes),
-        'lastPrice': closes[-1] if closes else 0,
-        'lastTimestamp': prices[-1]['timestamp'] if prices else None,
-        'source': source,
-        'count': len(prices)
-    }
+    return build_price_payload(prices, source, compact)
 
 
-def cleanup_old_data(days_to_keep: int = 30) -> int:
+def cleanup_old_data(policy: Optional[Dict[str, timedelta]] = None, chunk_size: int = 5000) -> Dict[str, Any]:
     """
     Clean up old price data to manage database size.
 
+    Applies the tiered retention policy in retention.py: expiring fine bars are
+    compacted into coarser intervals first, then deleted in bounded chunks.
+
     Args:
-        days_to_keep: Number of days of data to keep
+        policy: Retention per interval (defaults to retention.RETENTION_POLICY)
+        chunk_size: Rows deleted per committed chunk
 
     Returns:
-        Number of records deleted
+        Report with rows compacted/deleted per interval and estimated bytes reclaimed
     """
-    cutoff = datetime.utcnow() - timedelta(days=days_to_keep)
-
     try:
-        deleted = PriceData.query.filter(
-            PriceData.timestamp < cutoff
-        ).delete()
-
-        db.session.commit()
-        logger.info(f"Cleaned up {deleted} old price records")
-        return deleted
+        return retention.apply_retention(policy, chunk_size)
     except Exception as e:
         logger.error(f"Error cleaning up old data: {e}")
         db.session.rollback()
-        return 0
+        return {'error': str(e), 'rowsDeleted': 0}
@@ -0,0 +1,263 @@
+"""
+Per-user prediction statistics.
+
+One UserStats row per user holds running counts and sums over their
+predictions: totals, active and completed counts, staked and earned tokens,
+and the sums behind mean and time-weighted MSPE. Every request that creates,
+scores or settles a prediction applies its change to the row in the same
+transaction, so account pages, rank and snapshots read one row instead of
+every prediction of the user.
+
+Time-weighted MSPE weighs each score by exp(-k * age). Measuring the weight
+from a fixed epoch instead of from now multiplies every weight by the same
+factor, which cancels in Σ(w * mspe) / Σ(w), so both sums can be kept as
+running totals.
+
+reconcile() recomputes the rows from predictions and repairs any drift; it
+runs in a background thread every USER_STATS_RECONCILE_MINUTES and from
+`flask reconcile-user-stats`.
+"""
+
+import logging
+import math
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from db import db, dialect_insert, without_statement_timeout
+from models import Prediction, UserStats
+
+logger = logging.getLogger(__name__)
+
+HALF_LIFE_DAYS = 30
+TW_EPOCH = datetime(2024, 1, 1)
+SETTLED_STATUSES = ('completed', 'closed')
+
+COLUMNS = ('total_predictions', 'active_predictions', 'completed_predictions', 'total_staked', 'total_rewards',
+           'scored_predictions', 'scored_staked', 'scored_rewards', 'mspe_sum', 'tw_mspe_sum', 'tw_weight_sum')
+
+RECONCILE_MINUTES = float(os.environ.get('USER_STATS_RECONCILE_MINUTES', 60))
+
+# (status, accuracy_score, staked_tokens, rewards_earned, created_at)
+State = Tuple[Optional[str], Optional[float], int, int, Optional[datetime]]
+
+
+def time_weight(created_at: datetime) -> float:
+    days = (created_at - TW_EPOCH).total_seconds() / 86400.0
+    return math.exp(math.log(2) / HALF_LIFE_DAYS * days)
+
+
+def state(prediction: Prediction) -> State:
+    """The fields of `prediction` the statistics depend on; take it before changing them."""
+    return (prediction.status, prediction.accuracy_score, prediction.staked_tokens or 0,
+            prediction.rewards_earned or 0, prediction.created_at)
+
+
+def contribution(values: Optional[State]) -> Dict[str, float]:
+    """What one prediction in `values` adds to its user's row."""
+    totals = dict.fromkeys(COLUMNS, 0)
+    if values is None:
+        return totals
+    status, score, staked, rewards, created_at = values
+    totals.update(total_predictions=1, active_predictions=int(status == 'active'),
+                  completed_predictions=int(status in SETTLED_STATUSES), total_staked=staked, total_rewards=rewards)
+    if score is not None:
+        weight = time_weight(created_at)
+        totals.update(scored_predictions=1, scored_staked=staked, scored_rewards=rewards, mspe_sum=score,
+                      tw_mspe_sum=weight * score, tw_weight_sum=weight)
+    return totals
+
+
+def empty(user_id: str) -> UserStats:
+    """Statistics of a user without predictions (not added to the session)."""
+    return UserStats(user_id=user_id, **dict.fromkeys(COLUMNS, 0))
+
+
+def get(user_id: str) -> UserStats:
+    return db.session.get(UserStats, user_id) or empty(user_id)
+
+
+def _delta(prediction: Prediction, before: Optional[State]) -> Dict[str, float]:
+    old, new = contribution(before), contribution(state(prediction))
+    return {column: new[column] - old[column] for column in COLUMNS if new[column] != old[column]}
+
+
+def _apply(user_id: str, delta: Dict[str, float]):
+    values = {getattr(UserStats, column): getattr(UserStats, column) + change for column, change in delta.items()}
+    values[UserStats.updated_at] = datetime.utcnow()
+    updated = UserStats.query.filter_by(user_id=user_id).update(values, synchronize_session=False)
+    if not updated:
+        # First prediction of the user, or a row lost to drift: count from scratch
+        refresh([user_id])
+
+
+def record(prediction: Prediction, before: Optional[State] = None):
+    """
+    Apply a created (`before` None) or changed prediction to its user's row.
+
+    One UPDATE of col = col + delta, so concurrent requests of the same user
+    add up instead of overwriting each other. Caller commits.
+    """
+    if not prediction.user_id:
+        return
+    db.session.flush()  # Column defaults (status, created_at) are filled in on flush
+    delta = _delta(prediction, before)
+    if delta:
+        _apply(prediction.user_id, delta)
+
+
+def record_many(changes: Iterable[Tuple[Prediction, Optional[State]]]):
+    """record() for many (prediction, before) pairs: one UPDATE per user with their summed change. Caller commits."""
+    db.session.flush()
+    deltas: Dict[str, Dict[str, float]] = {}
+    for prediction, before in changes:
+        if prediction.user_id:
+            totals = deltas.setdefault(prediction.user_id, {})
+            for column, change in _delta(prediction, before).items():
+                totals[column] = totals.get(column, 0) + change
+    # In user id order, so two transactions updating the same users lock them in the same order
+    for user_id in sorted(deltas):
+        if any(deltas[user_id].values()):
+            _apply(user_id, deltas[user_id])
+
+
+def compute(user_ids: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, float]]:
+    """Statistics of `user_ids` (default: every user) recomputed from predictions."""
+    query = db.session.query(Prediction.user_id, Prediction.status, Prediction.accuracy_score,
+                             Prediction.staked_tokens, Prediction.rewards_earned, Prediction.created_at)
+    if user_ids is None:
+        query = query.filter(Prediction.user_id.isnot(None))
+    else:
+        query = query.filter(Prediction.user_id.in_(list(user_ids)))
+
+    stats: Dict[str, Dict[str, float]] = {}
+    for user_id, status, score, staked, rewards, created_at in query.yield_per(5000):
+        totals = stats.setdefault(user_id, dict.fromkeys(COLUMNS, 0))
+        for column, value in contribution((status, score, staked or 0, rewards or 0, created_at)).items():
+            totals[column] += value
+    return stats
+
+
+def _write(user_id: str, values: Dict[str, float]):
+    values = dict(values, updated_at=datetime.utcnow())
+    stmt = dialect_insert(UserStats)
+    if stmt is not None:
+        db.session.execute(stmt.values(user_id=user_id, **values).on_conflict_do_update(
+            index_elements=[UserStats.user_id], set_=values))
+        return
+    row = db.session.get(UserStats, user_id)
+    if row is None:
+        db.session.add(UserStats(user_id=user_id, **values))
+    else:
+        for column, value in values.items():
+            setattr(row, column, value)
+
+
+def refresh(user_ids: Iterable[str]):
+    """Recompute the rows of `user_ids` from their predictions. Caller commits."""
+    user_ids = set(user_ids)
+    stats = compute(user_ids)
+    for user_id in user_ids:
+        _write(user_id, stats.get(user_id) or dict.fromkeys(COLUMNS, 0))
+
+
+def ensure_populated():
+    """Build the table once for a database that has predictions but no statistics yet."""
+    if UserStats.query.first() is None and Prediction.query.filter(Prediction.user_id.isnot(None)).first() is not None:
+        rebuild()
+
+
+def rebuild() -> int:
+    """Recompute every row with one pass over predictions and commit."""
+    without_statement_timeout()
+    stats = compute()
+    for user_id, values in stats.items():
+        _write(user_id, values)
+    stale = UserStats.query.filter(UserStats.user_id.notin_(list(stats))) if stats else UserStats.query
+    stale.delete(synchronize_session=False)
+    db.session.commit()
+    logger.info(f"Rebuilt prediction statistics for {len(stats)} users")
+    return len(stats)
+
+
+def _matches(row: Optional[UserStats], values: Dict[str, float]) -> bool:
+    if row is None:
+        return not any(values.values())
+    # Running float sums pick up rounding error; only a real difference counts as drift
+    return all(math.isclose(getattr(row, column), values[column], rel_tol=1e-6, abs_tol=1e-6) for column in COLUMNS)
+
+
+def reconcile() -> Dict[str, Any]:
+    """
+    Compare every row with a recount from predictions and repair the ones that drifted.
+
+    The comparison runs without locks, so a prediction written meanwhile can
+    look like drift. Each suspect user is therefore recounted again with
+    their row locked (FOR UPDATE) and committed on its own: requests updating
+    that row wait for the repair and apply their delta on top of it.
+    """
+    without_statement_timeout()
+    stats = compute()
+    rows = {row.user_id: row for row in UserStats.query.all()}
+    suspects = [user_id for user_id in set(stats) | set(rows)
+                if not _matches(rows.get(user_id), stats.get(user_id, dict.fromkeys(COLUMNS, 0)))]
+    db.session.commit()
+
+    repaired = 0
+    for user_id in suspects:
+        row = UserStats.query.filter_by(user_id=user_id).with_for_update().populate_existing().first()
+        values = compute([user_id]).get(user_id, dict.fromkeys(COLUMNS, 0))
+        if not _matches(row, values):
+            logger.warning(f"User stats drifted for {user_id}, repairing")
+            _write(user_id, values)
+            repaired += 1
+        db.session.commit()
+
+    if repaired:
+        logger.warning(f"Repaired prediction statistics of {repaired} of {len(stats)} users")
+    return {'users': len(stats), 'repaired': repaired}
+
+
+def rank(stats: UserStats) -> Tuple[Optional[int], int]:
+    """Position of `stats` among users ordered by time-weighted MSPE, and the number of ranked users."""
+    tw_mspe = UserStats.tw_mspe_sum / UserStats.tw_weight_sum
+    ranked = UserStats.query.filter(UserStats.tw_weight_sum > 0)
+    total = ranked.count()
+    mine = stats.time_weighted_mspe
+    if mine is None:
+        return None, total
+    ahead = ranked.filter(UserStats.user_id != stats.user_id, tw_mspe < mine).count()
+    return ahead + 1, total
+
+
+_reconciler: Optional[threading.Thread] = None
+_reconciler_lock = threading.Lock()
+
+
+def _reconcile_forever(app, interval: float):
+    while True:
+        # Spread the workers' runs out instead of every one reconciling at once
+        time.sleep(interval * random.uniform(0.75, 1.25))
+        with app.app_context():
+            try:
+                reconcile()
+            except Exception as e:
+                logger.error(f"User stats reconciliation failed: {e}")
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+
+def start_reconciler(app):
+    """Start the background reconciliation of this process, once."""
+    global _reconciler
+    if _reconciler is not None or RECONCILE_MINUTES <= 0:
+        return
+    with _reconciler_lock:
+        if _reconciler is None:
+            _reconciler = threading.Thread(target=_reconcile_forever, args=(app, RECONCILE_MINUTES * 60),
+                                           name='user-stats-reconcile', daemon=True)
+            _reconciler.start()